@@ -292,6 +292,13 @@ class AgentStepResponse(BaseModel):
     step: Step
 
 
+@json_schema_type
+class ListAgentSessionTurnsResponse(BaseModel):
+    data: List[Turn]
+    # pass as `cursor` to fetch the next page; None once all turns were returned
+    next_cursor: Optional[str] = None
+
+
 @runtime_checkable
 @trace_protocol
 class Agents(Protocol):
@@ -354,6 +361,19 @@ class Agents(Protocol):
         turn_ids: Optional[List[str]] = None,
     ) -> Session: ...
 
+    @webmethod(route="/agents/{agent_id}/session/{session_id}/turns", method="GET")
+    async def list_agents_session_turns(
+        self,
+        agent_id: str,
+        session_id: str,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        descending: Optional[bool] = False,
+        include_steps: Optional[bool] = True,
+    ) -> ListAgentSessionTurnsResponse:
+        """List the turns of a session page by page, optionally without their steps"""
+        ...
+
     @webmethod(route="/agents/{agent_id}/session/{session_id}", method="DELETE")
     async def delete_agents_session(
         self,
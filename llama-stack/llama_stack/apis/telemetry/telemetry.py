@@ -194,6 +194,11 @@ class Telemetry(Protocol):
         self, event: Event, ttl_seconds: int = DEFAULT_TTL_DAYS * 86400
     ) -> None: ...
 
+    @webmethod(route="/telemetry/events/batch", method="POST")
+    async def log_events(
+        self, events: List[Event], ttl_seconds: int = DEFAULT_TTL_DAYS * 86400
+    ) -> None: ...
+
     @webmethod(route="/telemetry/traces", method="GET")
     async def query_traces(
         self,
@@ -60,6 +60,13 @@ RAGQueryGeneratorConfig = register_schema(
 )
 
 
+@json_schema_type
+class RAGSearchMode(Enum):
+    vector = "vector"
+    keyword = "keyword"
+    hybrid = "hybrid"
+
+
 @json_schema_type
 class RAGQueryConfig(BaseModel):
     # This config defines how a query is generated using the messages
@@ -69,6 +76,12 @@ class RAGQueryConfig(BaseModel):
     )
     max_tokens_in_context: int = 4096
     max_chunks: int = 5
+    # chunks scoring lower are dropped by the vector db
+    score_threshold: float = 0.0
+    # hybrid fuses vector and keyword (BM25) results by reciprocal rank,
+    # scoring each chunk sum(1 / (rrf_k + rank)) over the two rankings
+    mode: RAGSearchMode = RAGSearchMode.vector
+    rrf_k: int = 60
 
 
 @runtime_checkable
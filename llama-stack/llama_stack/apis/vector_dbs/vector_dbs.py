@@ -4,10 +4,10 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
-from typing import List, Literal, Optional, Protocol, runtime_checkable
+from typing import Any, Dict, List, Literal, Optional, Protocol, runtime_checkable
 
 from llama_models.schema_utils import json_schema_type, webmethod
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from llama_stack.apis.resource import Resource, ResourceType
 from llama_stack.providers.utils.telemetry.trace_protocol import trace_protocol
@@ -19,6 +19,10 @@ class VectorDB(Resource):
 
     embedding_model: str
     embedding_dimension: int
+    metadata: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Any additional metadata for this vector db, such as provider specific index settings",
+    )
 
     @property
     def vector_db_id(self) -> str:
@@ -34,6 +38,7 @@ class VectorDBInput(BaseModel):
     embedding_model: str
     embedding_dimension: int
     provider_vector_db_id: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
 
 
 class ListVectorDBsResponse(BaseModel):
@@ -60,6 +65,7 @@ class VectorDBs(Protocol):
         embedding_dimension: Optional[int] = 384,
         provider_id: Optional[str] = None,
         provider_vector_db_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
     ) -> VectorDB: ...
 
     @webmethod(route="/vector-dbs/{vector_db_id}", method="DELETE")
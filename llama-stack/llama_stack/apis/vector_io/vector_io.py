@@ -29,6 +29,12 @@ class QueryChunksResponse(BaseModel):
     scores: List[float]
 
 
+@json_schema_type
+class QueryChunksBatchResponse(BaseModel):
+    # one response per query, in the order of the queries
+    data: List[QueryChunksResponse]
+
+
 class VectorDBStore(Protocol):
     def get_vector_db(self, vector_db_id: str) -> Optional[VectorDB]: ...
 
@@ -55,3 +61,11 @@ class VectorIO(Protocol):
         query: InterleavedContent,
         params: Optional[Dict[str, Any]] = None,
     ) -> QueryChunksResponse: ...
+
+    @webmethod(route="/vector-io/query-batch", method="POST")
+    async def query_chunks_batch(
+        self,
+        vector_db_id: str,
+        queries: List[InterleavedContent],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> QueryChunksBatchResponse: ...
@@ -0,0 +1,136 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import argparse
+
+from llama_stack.cli.subcommand import Subcommand
+
+
+class StackCompact(Subcommand):
+    def __init__(self, subparsers: argparse._SubParsersAction):
+        super().__init__()
+        self.parser = subparsers.add_parser(
+            "compact",
+            prog="llama stack compact",
+            description="""Purge sessions, turns and session vector dbs left behind by deleted
+agents and sessions. Run this while the stack is stopped.""",
+            formatter_class=argparse.RawTextHelpFormatter,
+        )
+        self._add_arguments()
+        self.parser.set_defaults(func=self._run_stack_compact_cmd)
+
+    def _add_arguments(self):
+        self.parser.add_argument(
+            "config",
+            type=str,
+            help="Path to the run config of the stack",
+        )
+        self.parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            default=False,
+            help="Only report what would be deleted",
+        )
+
+    def _run_stack_compact_cmd(self, args: argparse.Namespace) -> None:
+        import asyncio
+        from pathlib import Path
+
+        import yaml
+
+        from llama_stack.distribution.configure import parse_and_maybe_upgrade_config
+        from llama_stack.distribution.stack import replace_env_vars
+
+        config_file = Path(args.config)
+        if not config_file.exists():
+            self.parser.error(f"File {str(config_file)} does not exist")
+
+        config_dict = replace_env_vars(yaml.safe_load(config_file.read_text()))
+        config = parse_and_maybe_upgrade_config(config_dict)
+        asyncio.run(self._compact(config, args.dry_run))
+
+    async def _compact(self, config, dry_run: bool) -> None:
+        from llama_stack.providers.inline.agents.meta_reference.compaction import (
+            compact_agents_store,
+        )
+        from llama_stack.providers.inline.agents.meta_reference.config import (
+            MetaReferenceAgentsImplConfig,
+        )
+        from llama_stack.providers.utils.kvstore import kvstore_impl
+
+        action = "Would delete" if dry_run else "Deleted"
+        vector_db_ids = []
+        for provider in config.providers.get("agents", []):
+            if provider.provider_type != "inline::meta-reference":
+                continue
+            agents_config = MetaReferenceAgentsImplConfig(**provider.config)
+            kvstore = await kvstore_impl(agents_config.persistence_store)
+            try:
+                report = await compact_agents_store(kvstore, dry_run=dry_run)
+            finally:
+                await kvstore.shutdown()
+
+            print(
+                f"{provider.provider_id}: {action} {len(report.orphaned_sessions)} "
+                f"sessions of deleted agents and the turns of "
+                f"{len(report.orphaned_turn_sessions)} deleted sessions"
+            )
+            vector_db_ids.extend(report.vector_db_ids)
+
+        if vector_db_ids:
+            await self._delete_vector_dbs(config, vector_db_ids, dry_run)
+
+    async def _delete_vector_dbs(self, config, vector_db_ids, dry_run: bool) -> None:
+        from llama_stack.distribution.store.registry import create_dist_registry
+        from llama_stack.providers.utils.kvstore import kvstore_impl
+
+        action = "Would delete" if dry_run else "Deleted"
+        vector_io_providers = {
+            provider.provider_id: provider
+            for provider in config.providers.get("vector_io", [])
+        }
+        dist_registry, dist_kvstore = await create_dist_registry(
+            config.metadata_store, config.image_name
+        )
+        faiss_kvstores = {}
+        try:
+            for vector_db_id in vector_db_ids:
+                vector_db = await dist_registry.get("vector_db", vector_db_id)
+                if vector_db is None:
+                    continue
+
+                provider = vector_io_providers.get(vector_db.provider_id)
+                if provider is None or provider.provider_type != "inline::faiss":
+                    print(
+                        f"Vector db {vector_db_id} is served by {vector_db.provider_id}; "
+                        "unregister it through the running stack to delete it"
+                    )
+                    continue
+
+                print(f"{action} vector db {vector_db_id}")
+                if dry_run:
+                    continue
+
+                from llama_stack.providers.inline.vector_io.faiss.config import (
+                    FaissImplConfig,
+                )
+                from llama_stack.providers.inline.vector_io.faiss.faiss import (
+                    delete_faiss_index,
+                    VECTOR_DBS_PREFIX,
+                )
+
+                if provider.provider_id not in faiss_kvstores:
+                    faiss_kvstores[provider.provider_id] = await kvstore_impl(
+                        FaissImplConfig(**provider.config).kvstore
+                    )
+                faiss_kvstore = faiss_kvstores[provider.provider_id]
+                await delete_faiss_index(faiss_kvstore, vector_db_id)
+                await faiss_kvstore.delete(f"{VECTOR_DBS_PREFIX}{vector_db_id}")
+                await dist_registry.delete("vector_db", vector_db_id)
+        finally:
+            for kvstore in faiss_kvstores.values():
+                await kvstore.shutdown()
+            await dist_kvstore.shutdown()
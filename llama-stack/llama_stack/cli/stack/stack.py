@@ -10,6 +10,7 @@ from importlib.metadata import version
 from llama_stack.cli.subcommand import Subcommand
 
 from .build import StackBuild
+from .compact import StackCompact
 from .configure import StackConfigure
 from .list_apis import StackListApis
 from .list_providers import StackListProviders
@@ -35,6 +36,7 @@ class StackParser(Subcommand):
 
         # Add sub-commands
         StackBuild.create(subparsers)
+        StackCompact.create(subparsers)
         StackConfigure.create(subparsers)
         StackListApis.create(subparsers)
         StackListProviders.create(subparsers)
@@ -44,7 +44,12 @@ from llama_stack.apis.tools import (
     ToolDef,
     ToolRuntime,
 )
-from llama_stack.apis.vector_io import Chunk, QueryChunksResponse, VectorIO
+from llama_stack.apis.vector_io import (
+    Chunk,
+    QueryChunksBatchResponse,
+    QueryChunksResponse,
+    VectorIO,
+)
 from llama_stack.providers.datatypes import RoutingTable
 
 
@@ -70,6 +75,7 @@ class VectorIORouter(VectorIO):
         embedding_dimension: Optional[int] = 384,
         provider_id: Optional[str] = None,
         provider_vector_db_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
     ) -> None:
         await self.routing_table.register_vector_db(
             vector_db_id,
@@ -77,6 +83,7 @@ class VectorIORouter(VectorIO):
             embedding_dimension,
             provider_id,
             provider_vector_db_id,
+            metadata,
         )
 
     async def insert_chunks(
@@ -99,6 +106,16 @@ class VectorIORouter(VectorIO):
             vector_db_id, query, params
         )
 
+    async def query_chunks_batch(
+        self,
+        vector_db_id: str,
+        queries: List[InterleavedContent],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> QueryChunksBatchResponse:
+        return await self.routing_table.get_provider_impl(
+            vector_db_id
+        ).query_chunks_batch(vector_db_id, queries, params)
+
 
 class InferenceRouter(Inference):
     """Routes to an provider based on the model"""
@@ -4,7 +4,7 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from pydantic import TypeAdapter
 
@@ -97,6 +97,7 @@ class CommonRoutingTableImpl(RoutingTable):
         async def add_objects(
             objs: List[RoutableObjectWithProvider], provider_id: str, cls
         ) -> None:
+            to_register = []
             for obj in objs:
                 if cls is None:
                     obj.provider_id = provider_id
@@ -105,7 +106,8 @@ class CommonRoutingTableImpl(RoutingTable):
                     model_data = obj.model_dump()
                     model_data["provider_id"] = provider_id
                     obj = cls(**model_data)
-                await self.dist_registry.register(obj)
+                to_register.append(obj)
+            await self.dist_registry.register_many(to_register)
 
         # Register all objects from providers
         for pid, p in self.impls_by_provider_id.items():
@@ -316,6 +318,7 @@ class VectorDBsRoutingTable(CommonRoutingTableImpl, VectorDBs):
         embedding_dimension: Optional[int] = 384,
         provider_id: Optional[str] = None,
         provider_vector_db_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
     ) -> VectorDB:
         if provider_vector_db_id is None:
             provider_vector_db_id = vector_db_id
@@ -350,6 +353,7 @@ class VectorDBsRoutingTable(CommonRoutingTableImpl, VectorDBs):
             "provider_resource_id": provider_vector_db_id,
             "embedding_model": embedding_model,
             "embedding_dimension": model.metadata["embedding_dimension"],
+            "metadata": metadata or {},
         }
         vector_db = TypeAdapter(VectorDB).validate_python(vector_db_data)
         await self.register_object(vector_db)
@@ -487,6 +491,23 @@ class EvalTasksRoutingTable(CommonRoutingTableImpl, EvalTasks):
 
 
 class ToolGroupsRoutingTable(CommonRoutingTableImpl, ToolGroups):
+    def __init__(
+        self,
+        impls_by_provider_id: Dict[str, RoutedProtocol],
+        dist_registry: DistributionRegistry,
+    ) -> None:
+        super().__init__(impls_by_provider_id, dist_registry)
+        self.listeners: List[Callable[[str], None]] = []
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """Registers a callback that is called with the toolgroup_id whenever a
+        tool group is registered or unregistered."""
+        self.listeners.append(listener)
+
+    def _notify_listeners(self, toolgroup_id: str) -> None:
+        for listener in self.listeners:
+            listener(toolgroup_id)
+
     async def list_tools(self, toolgroup_id: Optional[str] = None) -> ListToolsResponse:
         tools = await self.get_all_with_type("tool")
         if toolgroup_id:
@@ -552,12 +573,14 @@ class ToolGroupsRoutingTable(CommonRoutingTableImpl, ToolGroups):
                 args=args,
             )
         )
+        self._notify_listeners(toolgroup_id)
 
     async def unregister_toolgroup(self, toolgroup_id: str) -> None:
         tool_group = await self.get_tool_group(toolgroup_id)
         if tool_group is None:
             raise ValueError(f"Tool group {toolgroup_id} not found")
-        tools = await self.list_tools(toolgroup_id).data
+        tools = (await self.list_tools(toolgroup_id)).data
         for tool in tools:
             await self.unregister_object(tool)
         await self.unregister_object(tool_group)
+        self._notify_listeners(toolgroup_id)
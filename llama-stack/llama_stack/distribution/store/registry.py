@@ -31,6 +31,10 @@ class DistributionRegistry(Protocol):
 
     async def register(self, obj: RoutableObjectWithProvider) -> bool: ...
 
+    async def register_many(
+        self, objs: List[RoutableObjectWithProvider]
+    ) -> List[RoutableObjectWithProvider]: ...
+
     async def delete(self, type: str, identifier: str) -> None: ...
 
 
@@ -102,6 +106,42 @@ class DiskDistributionRegistry(DistributionRegistry):
         )
         return True
 
+    async def _filter_new(
+        self, objs: List[RoutableObjectWithProvider]
+    ) -> List[RoutableObjectWithProvider]:
+        values = await self.kvstore.get_many(
+            [
+                KEY_FORMAT.format(type=obj.type, identifier=obj.identifier)
+                for obj in objs
+            ]
+        )
+        new_objs = []
+        for obj, value in zip(objs, values):
+            if value:
+                existing_obj = pydantic.TypeAdapter(
+                    RoutableObjectWithProvider
+                ).validate_json(value)
+                # dont register if the object's providerid already exists
+                if existing_obj.provider_id == obj.provider_id:
+                    continue
+            new_objs.append(obj)
+        return new_objs
+
+    async def register_many(
+        self, objs: List[RoutableObjectWithProvider]
+    ) -> List[RoutableObjectWithProvider]:
+        """Registers `objs` in a single batch, returning the ones that were written."""
+        registered = await self._filter_new(objs)
+        await self.kvstore.set_many(
+            {
+                KEY_FORMAT.format(
+                    type=obj.type, identifier=obj.identifier
+                ): obj.model_dump_json()
+                for obj in registered
+            }
+        )
+        return registered
+
     async def delete(self, type: str, identifier: str) -> None:
         await self.kvstore.delete(KEY_FORMAT.format(type=type, identifier=identifier))
 
@@ -173,6 +213,30 @@ class CachedDiskDistributionRegistry(DiskDistributionRegistry):
 
         return success
 
+    async def _filter_new(
+        self, objs: List[RoutableObjectWithProvider]
+    ) -> List[RoutableObjectWithProvider]:
+        async with self._locked_cache() as cache:
+            new_objs = []
+            for obj in objs:
+                existing_obj = cache.get((obj.type, obj.identifier))
+                if existing_obj and existing_obj.provider_id == obj.provider_id:
+                    continue
+                new_objs.append(obj)
+            return new_objs
+
+    async def register_many(
+        self, objs: List[RoutableObjectWithProvider]
+    ) -> List[RoutableObjectWithProvider]:
+        await self._ensure_initialized()
+        registered = await super().register_many(objs)
+
+        async with self._locked_cache() as cache:
+            for obj in registered:
+                cache[(obj.type, obj.identifier)] = obj
+
+        return registered
+
     async def update(self, obj: RoutableObjectWithProvider) -> None:
         await super().update(obj)
         cache_key = (obj.type, obj.identifier)
@@ -204,3 +204,18 @@ async def test_get_all_objects(config):
             stored_vector_db.embedding_dimension
             == original_vector_db.embedding_dimension
         )
+
+
+@pytest.mark.asyncio
+async def test_register_many(config, sample_vector_db, sample_model):
+    cached_registry = CachedDiskDistributionRegistry(await kvstore_impl(config))
+    await cached_registry.initialize()
+    await cached_registry.register(sample_model)
+
+    registered = await cached_registry.register_many([sample_vector_db, sample_model])
+    assert [obj.identifier for obj in registered] == [sample_vector_db.identifier]
+    assert await cached_registry.get("vector_db", "test_vector_db") is not None
+
+    disk_registry = DiskDistributionRegistry(await kvstore_impl(config))
+    assert await disk_registry.register_many([sample_vector_db, sample_model]) == []
+    assert len(await disk_registry.get_all()) == 2
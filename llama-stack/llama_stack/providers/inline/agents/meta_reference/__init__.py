@@ -23,6 +23,7 @@ async def get_provider_impl(
         deps[Api.safety],
         deps[Api.tool_runtime],
         deps[Api.tool_groups],
+        deps.get(Api.vector_dbs),
     )
     await impl.initialize()
     return impl
@@ -13,7 +13,7 @@ import secrets
 import string
 import uuid
 from datetime import datetime
-from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from typing import Any, AsyncGenerator, Dict, FrozenSet, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import httpx
@@ -66,7 +66,7 @@ from llama_stack.apis.vector_io import VectorIO
 from llama_stack.providers.utils.kvstore import KVStore
 from llama_stack.providers.utils.memory.vector_store import concat_interleaved_content
 from llama_stack.providers.utils.telemetry import tracing
-from .persistence import AgentPersistence
+from .persistence import AgentPersistence, SessionMessageCache
 from .safety import SafetyException, ShieldRunnerMixin
 
 log = logging.getLogger(__name__)
@@ -96,6 +96,9 @@ class ChatAgent(ShieldRunnerMixin):
         tool_groups_api: ToolGroups,
         vector_io_api: VectorIO,
         persistence_store: KVStore,
+        session_ttl_seconds: Optional[int] = None,
+        max_history_turns: Optional[int] = None,
+        session_message_cache: Optional[SessionMessageCache] = None,
     ):
         self.agent_id = agent_id
         self.agent_config = agent_config
@@ -103,10 +106,24 @@ class ChatAgent(ShieldRunnerMixin):
         self.inference_api = inference_api
         self.safety_api = safety_api
         self.vector_io_api = vector_io_api
-        self.storage = AgentPersistence(agent_id, persistence_store)
+        self.storage = AgentPersistence(
+            agent_id,
+            persistence_store,
+            self.turn_to_messages,
+            session_ttl_seconds=session_ttl_seconds,
+            max_history_turns=max_history_turns,
+            message_cache=session_message_cache,
+        )
         self.tool_runtime_api = tool_runtime_api
         self.tool_groups_api = tool_groups_api
 
+        # resolved tool definitions per set of toolgroups requested for a turn
+        self._tool_defs_cache: Dict[
+            Optional[FrozenSet[str]],
+            Tuple[Dict[str, ToolDefinition], Dict[str, str]],
+        ] = {}
+        self._tool_defs_version = 0
+
         ShieldRunnerMixin.__init__(
             self,
             safety_api,
@@ -160,22 +177,18 @@ class ChatAgent(ShieldRunnerMixin):
         with tracing.span("create_and_execute_turn") as span:
             span.set_attribute("session_id", request.session_id)
             span.set_attribute("agent_id", self.agent_id)
-            span.set_attribute("request", request.model_dump_json())
+            span.set_attribute("request", tracing.LazyAttribute(request))
             assert request.stream is True, "Non-streaming not supported"
 
             session_info = await self.storage.get_session_info(request.session_id)
             if session_info is None:
                 raise ValueError(f"Session {request.session_id} not found")
 
-            turns = await self.storage.get_session_turns(request.session_id)
-
             messages = []
             if self.agent_config.instructions != "":
                 messages.append(SystemMessage(content=self.agent_config.instructions))
 
-            for i, turn in enumerate(turns):
-                messages.extend(self.turn_to_messages(turn))
-
+            messages.extend(await self.storage.get_session_messages(session_info))
             messages.extend(request.messages)
 
             print(f"Messages from session memory after extending user message: {messages}")
@@ -307,7 +320,7 @@ class ChatAgent(ShieldRunnerMixin):
         touchpoint: str,
     ) -> AsyncGenerator:
         with tracing.span("run_shields") as span:
-            span.set_attribute("input", [m.model_dump_json() for m in messages])
+            span.set_attribute("input", tracing.LazyAttribute(list(messages)))
             if len(shields) == 0:
                 span.set_attribute("output", "no shields")
                 return
@@ -339,7 +352,7 @@ class ChatAgent(ShieldRunnerMixin):
                         )
                     )
                 )
-                span.set_attribute("output", e.violation.model_dump_json())
+                span.set_attribute("output", tracing.LazyAttribute(e.violation))
 
                 yield CompletionMessage(
                     content=str(e),
@@ -475,14 +488,14 @@ class ChatAgent(ShieldRunnerMixin):
                         )
                     )
                 )
-                span.set_attribute(
-                    "input", [m.model_dump_json() for m in input_messages]
-                )
+                span.set_attribute("input", tracing.LazyAttribute(list(input_messages)))
                 span.set_attribute("output", retrieved_context)
                 span.set_attribute("tool_name", MEMORY_QUERY_TOOL)
                 if retrieved_context:
-                    last_message = input_messages[-1]
-                    last_message.context = retrieved_context
+                    # a copy, the request's messages are traced and stored as sent
+                    input_messages[-1] = input_messages[-1].model_copy(
+                        update={"context": retrieved_context}
+                    )
 
         output_attachments = []
 
@@ -561,9 +574,7 @@ class ChatAgent(ShieldRunnerMixin):
                     if event.stop_reason is not None:
                         stop_reason = event.stop_reason
                 span.set_attribute("stop_reason", stop_reason)
-                span.set_attribute(
-                    "input", [m.model_dump_json() for m in input_messages]
-                )
+                span.set_attribute("input", tracing.LazyAttribute(list(input_messages)))
                 span.set_attribute(
                     "output", f"content: {content} tool_calls: {tool_calls}"
                 )
@@ -658,7 +669,7 @@ class ChatAgent(ShieldRunnerMixin):
                     "tool_execution",
                     {
                         "tool_name": tool_name,
-                        "input": message.model_dump_json(),
+                        "input": tracing.LazyAttribute(message),
                     },
                 ) as span:
                     result_messages = await execute_tool_call_maybe(
@@ -672,7 +683,7 @@ class ChatAgent(ShieldRunnerMixin):
                         len(result_messages) == 1
                     ), "Currently not supporting multiple messages"
                     result_message = result_messages[0]
-                    span.set_attribute("output", result_message.model_dump_json())
+                    span.set_attribute("output", tracing.LazyAttribute(result_message))
 
                 yield AgentTurnResponseStreamChunk(
                     event=AgentTurnResponseEvent(
@@ -710,8 +721,36 @@ class ChatAgent(ShieldRunnerMixin):
 
             n_iter += 1
 
+    def invalidate_tool_defs(self) -> None:
+        """Drops memoized tool definitions, e.g. after a tool group was (un)registered."""
+        self._tool_defs_version += 1
+        self._tool_defs_cache.clear()
+
     async def _get_tool_defs(
         self, toolgroups_for_turn: Optional[List[AgentToolGroup]] = None
+    ) -> Tuple[Dict[str, ToolDefinition], Dict[str, str]]:
+        key = None
+        if toolgroups_for_turn is not None:
+            key = frozenset(
+                (
+                    toolgroup.name
+                    if isinstance(toolgroup, AgentToolGroupWithArgs)
+                    else toolgroup
+                )
+                for toolgroup in toolgroups_for_turn
+            )
+        if key in self._tool_defs_cache:
+            return self._tool_defs_cache[key]
+
+        version = self._tool_defs_version
+        tool_defs = await self._resolve_tool_defs(toolgroups_for_turn)
+        # don't memoize a result that raced with an invalidation
+        if version == self._tool_defs_version:
+            self._tool_defs_cache[key] = tool_defs
+        return tool_defs
+
+    async def _resolve_tool_defs(
+        self, toolgroups_for_turn: Optional[List[AgentToolGroup]] = None
     ) -> Tuple[Dict[str, ToolDefinition], Dict[str, str]]:
         # Determine which tools to include
         agent_config_toolgroups = set(
@@ -849,10 +888,13 @@ class ChatAgent(ShieldRunnerMixin):
             # if no memory or code_interpreter tool is available,
             # we try to load the data from the URLs and content items as a message to inference
             # and add it to the last message's context
-            input_messages[-1].context = "\n".join(
+            context = "\n".join(
                 [doc.content for doc in content_items]
                 + await load_data_from_urls(url_items)
             )
+            input_messages[-1] = input_messages[-1].model_copy(
+                update={"context": context}
+            )
 
     async def _ensure_vector_db(self, session_id: str) -> str:
         session_info = await self.storage.get_session_info(session_id)
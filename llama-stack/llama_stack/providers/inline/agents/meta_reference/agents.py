@@ -9,6 +9,7 @@ import logging
 import shutil
 import tempfile
 import uuid
+from collections import OrderedDict
 from typing import AsyncGenerator, List, Optional, Union
 
 from termcolor import colored
@@ -22,17 +23,20 @@ from llama_stack.apis.agents import (
     AgentToolGroup,
     AgentTurnCreateRequest,
     Document,
+    ListAgentSessionTurnsResponse,
     Session,
     Turn,
 )
 from llama_stack.apis.inference import Inference, ToolResponseMessage, UserMessage
 from llama_stack.apis.safety import Safety
 from llama_stack.apis.tools import ToolGroups, ToolRuntime
+from llama_stack.apis.vector_dbs import VectorDBs
 from llama_stack.apis.vector_io import VectorIO
 from llama_stack.providers.utils.kvstore import InmemoryKVStoreImpl, kvstore_impl
 
 from .agent_instance import ChatAgent
 from .config import MetaReferenceAgentsImplConfig
+from .persistence import SessionMessageCache
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -47,6 +51,7 @@ class MetaReferenceAgentsImpl(Agents):
         safety_api: Safety,
         tool_runtime_api: ToolRuntime,
         tool_groups_api: ToolGroups,
+        vector_dbs_api: Optional[VectorDBs] = None,
     ):
         self.config = config
         self.inference_api = inference_api
@@ -54,13 +59,21 @@ class MetaReferenceAgentsImpl(Agents):
         self.safety_api = safety_api
         self.tool_runtime_api = tool_runtime_api
         self.tool_groups_api = tool_groups_api
+        self.vector_dbs_api = vector_dbs_api
 
         self.in_memory_store = InmemoryKVStoreImpl()
+        self.session_message_cache = SessionMessageCache()
         self.tempdir = tempfile.mkdtemp()
 
+        # agent configs are immutable, so built agents can be reused across requests
+        self._agents: "OrderedDict[str, ChatAgent]" = OrderedDict()
+
     async def initialize(self) -> None:
         self.persistence_store = await kvstore_impl(self.config.persistence_store)
 
+        if hasattr(self.tool_groups_api, "add_listener"):
+            self.tool_groups_api.add_listener(self._on_toolgroups_changed)
+
         # check if "bwrap" is available
         if not shutil.which("bwrap"):
             print(
@@ -84,7 +97,23 @@ class MetaReferenceAgentsImpl(Agents):
             agent_id=agent_id,
         )
 
+    def _on_toolgroups_changed(self, toolgroup_id: str) -> None:
+        for agent in self._agents.values():
+            agent.invalidate_tool_defs()
+
     async def get_agent(self, agent_id: str) -> ChatAgent:
+        agent = self._agents.get(agent_id)
+        if agent is not None:
+            self._agents.move_to_end(agent_id)
+            return agent
+
+        agent = await self._load_agent(agent_id)
+        self._agents[agent_id] = agent
+        while len(self._agents) > self.config.max_cached_agents:
+            self._agents.popitem(last=False)
+        return agent
+
+    async def _load_agent(self, agent_id: str) -> ChatAgent:
         agent_config = await self.persistence_store.get(
             key=f"agent:{agent_id}",
         )
@@ -119,6 +148,9 @@ class MetaReferenceAgentsImpl(Agents):
                 if agent_config.enable_session_persistence
                 else self.in_memory_store
             ),
+            session_ttl_seconds=self.config.session_ttl_seconds,
+            max_history_turns=self.config.max_session_history_turns,
+            session_message_cache=self.session_message_cache,
         )
 
     async def create_agent_session(
@@ -171,21 +203,16 @@ class MetaReferenceAgentsImpl(Agents):
     async def get_agents_turn(
         self, agent_id: str, session_id: str, turn_id: str
     ) -> Turn:
-        turn = await self.persistence_store.get(
-            f"session:{agent_id}:{session_id}:{turn_id}"
-        )
-        turn = json.loads(turn)
-        turn = Turn(**turn)
+        agent = await self.get_agent(agent_id)
+        turn = await agent.storage.get_turn(session_id, turn_id)
+        if turn is None:
+            raise ValueError(f"Turn {turn_id} not found in session {session_id}")
         return turn
 
     async def get_agents_step(
         self, agent_id: str, session_id: str, turn_id: str, step_id: str
     ) -> AgentStepResponse:
-        turn = await self.persistence_store.get(
-            f"session:{agent_id}:{session_id}:{turn_id}"
-        )
-        turn = json.loads(turn)
-        turn = Turn(**turn)
+        turn = await self.get_agents_turn(agent_id, session_id, turn_id)
         steps = turn.steps
         for step in steps:
             if step.step_id == step_id:
@@ -198,26 +225,58 @@ class MetaReferenceAgentsImpl(Agents):
         session_id: str,
         turn_ids: Optional[List[str]] = None,
     ) -> Session:
-        session = await self.persistence_store.get(f"session:{agent_id}:{session_id}")
-        session = Session(**json.loads(session), turns=[])
+        agent = await self.get_agent(agent_id)
+        session_info = await agent.storage.get_session_info(session_id)
+        if session_info is None:
+            raise ValueError(f"Session {session_id} not found")
         turns = []
         if turn_ids:
-            for turn_id in turn_ids:
-                turn = await self.persistence_store.get(
-                    f"session:{agent_id}:{session_id}:{turn_id}"
-                )
-                turn = json.loads(turn)
-                turn = Turn(**turn)
-                turns.append(turn)
+            turns = await agent.storage.get_turns(session_id, turn_ids)
         return Session(
-            session_name=session.session_name,
+            session_name=session_info.session_name,
             session_id=session_id,
-            turns=turns if turns else [],
-            started_at=session.started_at,
+            turns=turns,
+            started_at=session_info.started_at,
         )
 
+    async def list_agents_session_turns(
+        self,
+        agent_id: str,
+        session_id: str,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        descending: Optional[bool] = False,
+        include_steps: Optional[bool] = True,
+    ) -> ListAgentSessionTurnsResponse:
+        agent = await self.get_agent(agent_id)
+        turns, next_cursor = await agent.storage.get_session_turns(
+            session_id,
+            cursor=cursor,
+            limit=limit,
+            descending=descending,
+            include_steps=include_steps,
+        )
+        return ListAgentSessionTurnsResponse(data=turns, next_cursor=next_cursor)
+
     async def delete_agents_session(self, agent_id: str, session_id: str) -> None:
-        await self.persistence_store.delete(f"session:{agent_id}:{session_id}")
+        agent = await self.get_agent(agent_id)
+        vector_db_id = await agent.storage.delete_session(session_id)
+        if vector_db_id:
+            await self._unregister_vector_dbs([vector_db_id])
 
     async def delete_agent(self, agent_id: str) -> None:
+        agent = await self.get_agent(agent_id)
+        vector_db_ids = await agent.storage.delete_all_sessions()
+        await self._unregister_vector_dbs(vector_db_ids)
+        self._agents.pop(agent_id, None)
         await self.persistence_store.delete(f"agent:{agent_id}")
+
+    async def _unregister_vector_dbs(self, vector_db_ids: List[str]) -> None:
+        if self.vector_dbs_api is None:
+            return
+        for vector_db_id in vector_db_ids:
+            try:
+                await self.vector_dbs_api.unregister_vector_db(vector_db_id)
+            except Exception:
+                # the session data is already gone; `llama stack compact` can retry
+                logger.exception(f"Failed to unregister vector db {vector_db_id}")
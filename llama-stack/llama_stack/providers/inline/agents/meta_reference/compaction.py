@@ -0,0 +1,84 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import json
+from typing import List, Set, Tuple
+
+from pydantic import BaseModel
+
+from llama_stack.providers.utils.kvstore import KVStore
+
+from .persistence import AgentSessionInfo, delete_session_data, SESSION_DATA_PREFIXES
+
+
+class AgentsStoreCompactionReport(BaseModel):
+    # sessions whose agent no longer exists
+    orphaned_sessions: List[str]
+    # sessions whose turns were left behind after the session was deleted
+    orphaned_turn_sessions: List[str]
+    # vector dbs that belonged to the orphaned sessions and may still be registered
+    vector_db_ids: List[str]
+
+
+async def compact_agents_store(
+    kvstore: KVStore, dry_run: bool = False
+) -> AgentsStoreCompactionReport:
+    """Deletes sessions of deleted agents and turns of deleted sessions.
+
+    Agents and sessions used to be deleted without their sessions and turns; this
+    finds and purges what they left behind. With `dry_run`, only reports it.
+    """
+    agent_keys = await kvstore.keys_in_range("agent:", "agent:\xff")
+    agent_ids = {key.split(":")[1] for key in agent_keys}
+
+    sessions: Set[Tuple[str, str]] = set()
+    sessions_with_data: Set[Tuple[str, str]] = set()
+    for prefix in SESSION_DATA_PREFIXES:
+        for key in await kvstore.keys_in_range(f"{prefix}:", f"{prefix}:\xff"):
+            parts = key.split(":")
+            if len(parts) < 3:
+                continue
+            if prefix == "session" and len(parts) == 3:
+                sessions.add((parts[1], parts[2]))
+            else:
+                sessions_with_data.add((parts[1], parts[2]))
+
+    orphaned_sessions = sorted(
+        (agent_id, session_id)
+        for agent_id, session_id in sessions
+        if agent_id not in agent_ids
+    )
+    orphaned_turn_sessions = sorted(sessions_with_data - sessions)
+
+    vector_db_ids = []
+    values = await kvstore.get_many(
+        [
+            f"session:{agent_id}:{session_id}"
+            for agent_id, session_id in orphaned_sessions
+        ]
+    )
+    for value in values:
+        if value is None:
+            continue
+        session_info = AgentSessionInfo(**json.loads(value))
+        if session_info.vector_db_id:
+            vector_db_ids.append(session_info.vector_db_id)
+    # the session info is gone, but session vector dbs are named after the session
+    vector_db_ids.extend(
+        f"vector_db_{session_id}" for _, session_id in orphaned_turn_sessions
+    )
+
+    if not dry_run:
+        for agent_id, session_id in orphaned_sessions + orphaned_turn_sessions:
+            await delete_session_data(kvstore, agent_id, session_id)
+        for agent_id, session_id in orphaned_sessions:
+            await kvstore.delete(f"session:{agent_id}:{session_id}")
+
+    return AgentsStoreCompactionReport(
+        orphaned_sessions=[session_id for _, session_id in orphaned_sessions],
+        orphaned_turn_sessions=[session_id for _, session_id in orphaned_turn_sessions],
+        vector_db_ids=vector_db_ids,
+    )
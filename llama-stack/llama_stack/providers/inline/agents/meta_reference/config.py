@@ -4,9 +4,9 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from llama_stack.providers.utils.kvstore import KVStoreConfig
 from llama_stack.providers.utils.kvstore.config import SqliteKVStoreConfig
@@ -14,6 +14,20 @@ from llama_stack.providers.utils.kvstore.config import SqliteKVStoreConfig
 
 class MetaReferenceAgentsImplConfig(BaseModel):
     persistence_store: KVStoreConfig
+    session_ttl_seconds: Optional[int] = Field(
+        default=None,
+        description="Delete sessions and their turns this long after the session was "
+        "started. Sessions are kept forever if not set",
+    )
+    max_session_history_turns: Optional[int] = Field(
+        default=None,
+        description="Only send the messages of the last N turns of a session to the "
+        "model. The full history is sent if not set",
+    )
+    max_cached_agents: int = Field(
+        default=1024,
+        description="Maximum number of agents kept in memory between requests",
+    )
 
     @classmethod
     def sample_run_config(cls, __distro_dir__: str) -> Dict[str, Any]:
@@ -4,31 +4,176 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
+import asyncio
+import base64
 import json
 import logging
 import uuid
-from datetime import datetime
-from typing import List, Optional
+import weakref
+import zlib
+from collections import deque, OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, List, Optional, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
 from llama_stack.apis.agents import Turn
+from llama_stack.apis.inference import Message, UserMessage
 from llama_stack.providers.utils.kvstore import KVStore
 
 log = logging.getLogger(__name__)
 
+MAX_CACHED_SESSIONS = 1000
+
+# values larger than this are stored zlib-compressed
+COMPRESSION_THRESHOLD_BYTES = 1024
+COMPRESSED_PREFIX = "zlib:"
+
+_messages_adapter = TypeAdapter(List[Message])
+
+
+def _compress(data: str) -> str:
+    if len(data) < COMPRESSION_THRESHOLD_BYTES:
+        return data
+    compressed = base64.b64encode(zlib.compress(data.encode("utf-8")))
+    return COMPRESSED_PREFIX + compressed.decode("ascii")
+
+
+def _decompress(value: str) -> str:
+    if not value.startswith(COMPRESSED_PREFIX):
+        return value
+    compressed = base64.b64decode(value[len(COMPRESSED_PREFIX) :])
+    return zlib.decompress(compressed).decode("utf-8")
+
+
+def encode_turn(turn: Turn) -> str:
+    return _compress(turn.model_dump_json())
+
+
+def decode_turn(value: str) -> Turn:
+    return Turn.model_validate_json(_decompress(value))
+
 
 class AgentSessionInfo(BaseModel):
     session_id: str
     session_name: str
     vector_db_id: Optional[str] = None
     started_at: datetime
+    # number of turns in the session, None for sessions whose turns were stored
+    # before they were indexed
+    turn_count: Optional[int] = None
+
+
+# the messages of each turn, oldest first
+SessionHistory = Deque[List[Message]]
+
+
+class SessionMessageCache:
+    """LRU of materialized session histories, shared by all agents of a provider.
+
+    Each entry is tagged with the turn count it reflects, so a history that was
+    appended to elsewhere is detected as stale and reloaded.
+    """
+
+    def __init__(self, max_sessions: int = MAX_CACHED_SESSIONS):
+        self.max_sessions = max_sessions
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, SessionHistory]]" = (
+            OrderedDict()
+        )
+
+    def get(self, key: Tuple[str, str], version: int) -> Optional[SessionHistory]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Tuple[str, str], version: int, history: SessionHistory):
+        self._entries[key] = (version, history)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def evict(self, key: Tuple[str, str]) -> None:
+        self._entries.pop(key, None)
+
+
+# guards the read-modify-write of a session's info; shared by all AgentPersistence
+# instances, since an agent is instantiated for every request
+_session_locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def _session_lock(agent_id: str, session_id: str) -> asyncio.Lock:
+    key = (agent_id, session_id)
+    lock = _session_locks.get(key)
+    if lock is None:
+        lock = _session_locks[key] = asyncio.Lock()
+    return lock
+
+
+# prefixes of the keys holding the turns of a session, see AgentPersistence
+SESSION_DATA_PREFIXES = ["session", "session_turns", "session_messages"]
+
+
+async def delete_session_data(kvstore: KVStore, agent_id: str, session_id: str):
+    """Deletes the turns, turn index and message log of a session, but not the
+    session itself."""
+    for prefix in SESSION_DATA_PREFIXES:
+        await kvstore.delete_range(
+            f"{prefix}:{agent_id}:{session_id}:",
+            f"{prefix}:{agent_id}:{session_id}:\xff",
+        )
 
 
 class AgentPersistence:
-    def __init__(self, agent_id: str, kvstore: KVStore):
+    """Stores the sessions and turns of an agent.
+
+    Besides the full turn under `session:{agent}:{session}:{turn_id}`, every turn
+    gets two entries keyed by its position in the session, so that turns can be
+    paged through without sorting and the history sent to the model is append-only:
+
+    - `session_turns:{agent}:{session}:{index}`: the turn without its steps and
+      retrieved context
+    - `session_messages:{agent}:{session}:{index}`: the messages the turn adds
+      to the conversation
+    """
+
+    def __init__(
+        self,
+        agent_id: str,
+        kvstore: KVStore,
+        turn_to_messages: Callable[[Turn], List[Message]],
+        session_ttl_seconds: Optional[int] = None,
+        max_history_turns: Optional[int] = None,
+        message_cache: Optional[SessionMessageCache] = None,
+    ):
         self.agent_id = agent_id
         self.kvstore = kvstore
+        self.turn_to_messages = turn_to_messages
+        self.session_ttl_seconds = session_ttl_seconds
+        self.max_history_turns = max_history_turns
+        self.message_cache = message_cache or SessionMessageCache()
+
+    def _session_expiration(self, session_info: AgentSessionInfo) -> Optional[datetime]:
+        # a session and all of its turns expire together, counted from when it started
+        if not self.session_ttl_seconds:
+            return None
+        return session_info.started_at + timedelta(seconds=self.session_ttl_seconds)
+
+    def _session_key(self, session_id: str) -> str:
+        return f"session:{self.agent_id}:{session_id}"
+
+    def _turn_key(self, session_id: str, turn_id: str) -> str:
+        return f"session:{self.agent_id}:{session_id}:{turn_id}"
+
+    # indexes are zero-padded so that keys sort in turn order
+    def _turn_index_key(self, session_id: str, index: int) -> str:
+        return f"session_turns:{self.agent_id}:{session_id}:{index:010d}"
+
+    def _message_log_key(self, session_id: str, index: int) -> str:
+        return f"session_messages:{self.agent_id}:{session_id}:{index:010d}"
 
     async def create_session(self, name: str) -> str:
         session_id = str(uuid.uuid4())
@@ -36,40 +181,100 @@ class AgentPersistence:
             session_id=session_id,
             session_name=name,
             started_at=datetime.now(),
+            turn_count=0,
+        )
+        await self._save_session_info(session_info)
+        self.message_cache.put(
+            (self.agent_id, session_id), 0, deque(maxlen=self.max_history_turns)
         )
+        return session_id
+
+    async def _save_session_info(self, session_info: AgentSessionInfo) -> None:
         await self.kvstore.set(
-            key=f"session:{self.agent_id}:{session_id}",
+            key=self._session_key(session_info.session_id),
             value=session_info.model_dump_json(),
+            expiration=self._session_expiration(session_info),
         )
-        return session_id
 
     async def get_session_info(self, session_id: str) -> Optional[AgentSessionInfo]:
         value = await self.kvstore.get(
-            key=f"session:{self.agent_id}:{session_id}",
+            key=self._session_key(session_id),
         )
         if not value:
             return None
 
         return AgentSessionInfo(**json.loads(value))
 
-    async def add_vector_db_to_session(self, session_id: str, vector_db_id: str):
+    async def _get_indexed_session_info(self, session_id: str) -> AgentSessionInfo:
         session_info = await self.get_session_info(session_id)
         if session_info is None:
             raise ValueError(f"Session {session_id} not found")
+        if session_info.turn_count is None:
+            await self._index_turns(session_info)
+        return session_info
 
-        session_info.vector_db_id = vector_db_id
-        await self.kvstore.set(
-            key=f"session:{self.agent_id}:{session_id}",
-            value=session_info.model_dump_json(),
+    async def add_vector_db_to_session(self, session_id: str, vector_db_id: str):
+        async with _session_lock(self.agent_id, session_id):
+            session_info = await self.get_session_info(session_id)
+            if session_info is None:
+                raise ValueError(f"Session {session_id} not found")
+
+            session_info.vector_db_id = vector_db_id
+            await self._save_session_info(session_info)
+
+    def _turn_entries(
+        self, session_id: str, index: int, turn: Turn, messages: List[Message]
+    ) -> Dict[str, str]:
+        # the turn without steps, attachments and retrieved context
+        summary = turn.model_copy(
+            update={
+                "input_messages": [
+                    (
+                        message.model_copy(update={"context": None})
+                        if isinstance(message, UserMessage)
+                        else message
+                    )
+                    for message in turn.input_messages
+                ],
+                "steps": [],
+                "output_attachments": [],
+            }
         )
+        return {
+            self._turn_key(session_id, turn.turn_id): encode_turn(turn),
+            self._turn_index_key(session_id, index): encode_turn(summary),
+            self._message_log_key(session_id, index): _compress(
+                _messages_adapter.dump_json(messages).decode("utf-8")
+            ),
+        }
 
     async def add_turn_to_session(self, session_id: str, turn: Turn):
-        await self.kvstore.set(
-            key=f"session:{self.agent_id}:{session_id}:{turn.turn_id}",
-            value=turn.model_dump_json(),
-        )
+        messages = self.turn_to_messages(turn)
+        # concurrent turns of a session must each get their own index
+        async with _session_lock(self.agent_id, session_id):
+            # re-read so that changes made during the turn (e.g. a new vector db)
+            # are kept
+            session_info = await self._get_indexed_session_info(session_id)
+
+            key = (self.agent_id, session_id)
+            index = session_info.turn_count
+            history = self.message_cache.get(key, index)
 
-    async def get_session_turns(self, session_id: str) -> List[Turn]:
+            session_info.turn_count = index + 1
+            entries = self._turn_entries(session_id, index, turn, messages)
+            entries[self._session_key(session_id)] = session_info.model_dump_json()
+            await self.kvstore.set_many(
+                entries, expiration=self._session_expiration(session_info)
+            )
+
+            if history is not None:
+                history.append(messages)
+                self.message_cache.put(key, index + 1, history)
+
+    async def _index_turns(self, session_info: AgentSessionInfo) -> None:
+        """Adds the index and message log entries to a session whose turns were
+        stored before turns were indexed."""
+        session_id = session_info.session_id
         values = await self.kvstore.range(
             start_key=f"session:{self.agent_id}:{session_id}:",
             end_key=f"session:{self.agent_id}:{session_id}:\xff\xff\xff\xff",
@@ -77,10 +282,139 @@ class AgentPersistence:
         turns = []
         for value in values:
             try:
-                turn = Turn(**json.loads(value))
-                turns.append(turn)
+                turns.append(decode_turn(value))
             except Exception as e:
                 log.error(f"Error parsing turn: {e}")
                 continue
         turns.sort(key=lambda x: (x.completed_at or datetime.min))
+
+        session_info.turn_count = len(turns)
+        entries = {self._session_key(session_id): session_info.model_dump_json()}
+        for index, turn in enumerate(turns):
+            entries.update(
+                self._turn_entries(session_id, index, turn, self.turn_to_messages(turn))
+            )
+        await self.kvstore.set_many(
+            entries, expiration=self._session_expiration(session_info)
+        )
+
+    async def get_turn(self, session_id: str, turn_id: str) -> Optional[Turn]:
+        value = await self.kvstore.get(self._turn_key(session_id, turn_id))
+        if value is None:
+            return None
+        return decode_turn(value)
+
+    async def get_turns(self, session_id: str, turn_ids: List[str]) -> List[Turn]:
+        values = await self.kvstore.get_many(
+            [self._turn_key(session_id, turn_id) for turn_id in turn_ids]
+        )
+        turns = []
+        for turn_id, value in zip(turn_ids, values):
+            if value is None:
+                raise ValueError(f"Turn {turn_id} not found in session {session_id}")
+            turns.append(decode_turn(value))
         return turns
+
+    async def get_session_turns(
+        self,
+        session_id: str,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        descending: bool = False,
+        include_steps: bool = True,
+    ) -> Tuple[List[Turn], Optional[str]]:
+        """Returns a page of the turns of a session in the order they were added,
+        and the cursor of the next page if there is one.
+
+        The cursor is the index of the turn the next page starts at (or, when
+        `descending`, ends before). Without `include_steps`, turns are returned
+        without their steps and attachments.
+        """
+        session_info = await self._get_indexed_session_info(session_id)
+        turn_count = session_info.turn_count
+
+        try:
+            position = int(cursor) if cursor else None
+        except ValueError:
+            raise ValueError(f"Invalid cursor {cursor}") from None
+        if descending:
+            end = turn_count if position is None else min(position, turn_count)
+            start = 0 if limit is None else max(0, end - limit)
+            indexes = list(reversed(range(start, end)))
+            next_cursor = str(start) if start > 0 else None
+        else:
+            start = position or 0
+            end = turn_count if limit is None else min(turn_count, start + limit)
+            indexes = list(range(start, end))
+            next_cursor = str(end) if end < turn_count else None
+
+        values = await self.kvstore.get_many(
+            [self._turn_index_key(session_id, index) for index in indexes]
+        )
+        turns = [decode_turn(value) for value in values if value is not None]
+        if include_steps:
+            turns = await self.get_turns(session_id, [turn.turn_id for turn in turns])
+        return turns, next_cursor
+
+    async def get_session_messages(
+        self, session_info: AgentSessionInfo
+    ) -> List[Message]:
+        """Returns the messages of the previous turns of a session, limited to the
+        last `max_history_turns` turns if set."""
+        session_id = session_info.session_id
+        if session_info.turn_count is None:
+            await self._index_turns(session_info)
+
+        key = (self.agent_id, session_id)
+        history = self.message_cache.get(key, session_info.turn_count)
+        if history is None:
+            turn_count = session_info.turn_count
+            start = 0
+            if self.max_history_turns:
+                start = max(0, turn_count - self.max_history_turns)
+            values = await self.kvstore.get_many(
+                [self._message_log_key(session_id, i) for i in range(start, turn_count)]
+            )
+            history = deque(
+                (
+                    _messages_adapter.validate_json(_decompress(value))
+                    for value in values
+                    if value is not None
+                ),
+                maxlen=self.max_history_turns,
+            )
+            self.message_cache.put(key, turn_count, history)
+        return [message for messages in history for message in messages]
+
+    async def delete_session(self, session_id: str) -> Optional[str]:
+        """Deletes a session with all of its turns. Returns the id of the session's
+        vector db, which the caller is responsible for unregistering."""
+        session_info = await self.get_session_info(session_id)
+        await delete_session_data(self.kvstore, self.agent_id, session_id)
+        await self.kvstore.delete(self._session_key(session_id))
+        self.message_cache.evict((self.agent_id, session_id))
+        return session_info.vector_db_id if session_info else None
+
+    async def delete_all_sessions(self) -> List[str]:
+        """Deletes all sessions of the agent. Returns the ids of their vector dbs."""
+        keys = await self.kvstore.keys_in_range(
+            f"session:{self.agent_id}:", f"session:{self.agent_id}:\xff"
+        )
+        # turns are stored under session:{agent}:{session}:{turn}
+        session_keys = [key for key in keys if key.count(":") == 2]
+        values = await self.kvstore.get_many(session_keys)
+
+        vector_db_ids = []
+        for key, value in zip(session_keys, values):
+            self.message_cache.evict((self.agent_id, key.split(":")[2]))
+            if value is None:
+                continue
+            session_info = AgentSessionInfo(**json.loads(value))
+            if session_info.vector_db_id:
+                vector_db_ids.append(session_info.vector_db_id)
+
+        for prefix in SESSION_DATA_PREFIXES:
+            await self.kvstore.delete_range(
+                f"{prefix}:{self.agent_id}:", f"{prefix}:{self.agent_id}:\xff"
+            )
+        return vector_db_ids
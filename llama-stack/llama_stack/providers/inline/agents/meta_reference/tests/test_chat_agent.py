@@ -34,6 +34,7 @@ from llama_stack.apis.inference import (
 )
 from llama_stack.apis.safety import RunShieldResponse
 from llama_stack.apis.tools import (
+    ListToolsResponse,
     Tool,
     ToolDef,
     ToolGroup,
@@ -143,32 +144,36 @@ class MockToolGroupsAPI:
     async def list_tool_groups(self) -> List[ToolGroup]:
         return []
 
-    async def list_tools(self, tool_group_id: Optional[str] = None) -> List[Tool]:
-        if tool_group_id == MEMORY_TOOLGROUP:
-            return [
-                Tool(
-                    identifier=MEMORY_QUERY_TOOL,
-                    provider_resource_id=MEMORY_QUERY_TOOL,
-                    toolgroup_id=MEMORY_TOOLGROUP,
-                    tool_host=ToolHost.client,
-                    description="Mock tool",
-                    provider_id="builtin::rag",
-                    parameters=[],
-                )
-            ]
-        if tool_group_id == CODE_INTERPRETER_TOOLGROUP:
-            return [
-                Tool(
-                    identifier="code_interpreter",
-                    provider_resource_id="code_interpreter",
-                    toolgroup_id=CODE_INTERPRETER_TOOLGROUP,
-                    tool_host=ToolHost.client,
-                    description="Mock tool",
-                    provider_id="builtin::code_interpreter",
-                    parameters=[],
-                )
-            ]
-        return []
+    async def list_tools(self, toolgroup_id: Optional[str] = None) -> ListToolsResponse:
+        if toolgroup_id == MEMORY_TOOLGROUP:
+            return ListToolsResponse(
+                data=[
+                    Tool(
+                        identifier=MEMORY_QUERY_TOOL,
+                        provider_resource_id=MEMORY_QUERY_TOOL,
+                        toolgroup_id=MEMORY_TOOLGROUP,
+                        tool_host=ToolHost.client,
+                        description="Mock tool",
+                        provider_id="builtin::rag",
+                        parameters=[],
+                    )
+                ]
+            )
+        if toolgroup_id == CODE_INTERPRETER_TOOLGROUP:
+            return ListToolsResponse(
+                data=[
+                    Tool(
+                        identifier="code_interpreter",
+                        provider_resource_id="code_interpreter",
+                        toolgroup_id=CODE_INTERPRETER_TOOLGROUP,
+                        tool_host=ToolHost.client,
+                        description="Mock tool",
+                        provider_id="builtin::code_interpreter",
+                        parameters=[],
+                    )
+                ]
+            )
+        return ListToolsResponse(data=[])
 
     async def get_tool(self, tool_name: str) -> Tool:
         return Tool(
@@ -412,3 +417,51 @@ async def test_chat_agent_tools(
         )
         assert MEMORY_QUERY_TOOL in new_tool_defs
         assert BuiltinTool.code_interpreter not in new_tool_defs
+
+
+@pytest.mark.asyncio
+async def test_get_agent_is_cached(get_agents_impl):
+    impl = await get_agents_impl
+    agent_config = AgentConfig(
+        model="test_model",
+        instructions="You are a helpful assistant.",
+        enable_session_persistence=False,
+    )
+    response = await impl.create_agent(agent_config)
+    chat_agent = await impl.get_agent(response.agent_id)
+    assert await impl.get_agent(response.agent_id) is chat_agent
+
+    await impl.delete_agent(response.agent_id)
+    with pytest.raises(ValueError):
+        await impl.get_agent(response.agent_id)
+
+
+@pytest.mark.asyncio
+async def test_tool_defs_are_memoized(get_agents_impl, mock_tool_groups_api):
+    impl = await get_agents_impl
+    agent_config = AgentConfig(
+        model="test_model",
+        instructions="You are a helpful assistant.",
+        toolgroups=[MEMORY_TOOLGROUP],
+        enable_session_persistence=False,
+    )
+    response = await impl.create_agent(agent_config)
+    chat_agent = await impl.get_agent(response.agent_id)
+
+    calls = []
+    list_tools = mock_tool_groups_api.list_tools
+
+    async def counting_list_tools(toolgroup_id=None):
+        calls.append(toolgroup_id)
+        return await list_tools(toolgroup_id)
+
+    mock_tool_groups_api.list_tools = counting_list_tools
+
+    await chat_agent._get_tool_defs()
+    await chat_agent._get_tool_defs()
+    assert calls == [MEMORY_TOOLGROUP]
+
+    # registering or unregistering a tool group invalidates the resolved tools
+    impl._on_toolgroups_changed(MEMORY_TOOLGROUP)
+    await chat_agent._get_tool_defs()
+    assert calls == [MEMORY_TOOLGROUP, MEMORY_TOOLGROUP]
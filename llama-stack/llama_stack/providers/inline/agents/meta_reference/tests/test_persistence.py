@@ -0,0 +1,281 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from llama_stack.apis.agents import InferenceStep, Turn
+from llama_stack.apis.inference import CompletionMessage, StopReason, UserMessage
+from llama_stack.providers.inline.agents.meta_reference.compaction import (
+    compact_agents_store,
+)
+from llama_stack.providers.inline.agents.meta_reference.persistence import (
+    AgentPersistence,
+    COMPRESSED_PREFIX,
+    decode_turn,
+    encode_turn,
+    SessionMessageCache,
+)
+from llama_stack.providers.utils.kvstore import InmemoryKVStoreImpl
+
+
+class CountingKVStore(InmemoryKVStoreImpl):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    async def get_many(self, keys):
+        self.reads += 1
+        return await super().get_many(keys)
+
+    async def range(self, start_key, end_key):
+        self.reads += 1
+        return await super().range(start_key, end_key)
+
+
+def make_turn(session_id: str, i: int) -> Turn:
+    output_message = CompletionMessage(
+        content=f"answer {i}", stop_reason=StopReason.end_of_turn
+    )
+    return Turn(
+        turn_id=f"turn-{i}",
+        session_id=session_id,
+        input_messages=[UserMessage(content=f"question {i}")],
+        output_message=output_message,
+        steps=[
+            InferenceStep(
+                turn_id=f"turn-{i}",
+                step_id=f"step-{i}",
+                model_response=output_message,
+            )
+        ],
+        started_at=datetime.now(),
+        completed_at=datetime.now(),
+    )
+
+
+def turn_to_messages(turn: Turn):
+    return [*turn.input_messages, turn.output_message]
+
+
+async def run_turn(persistence: AgentPersistence, session_id: str, i: int):
+    session_info = await persistence.get_session_info(session_id)
+    history = await persistence.get_session_messages(session_info)
+    await persistence.add_turn_to_session(session_id, make_turn(session_id, i))
+    return history
+
+
+@pytest.mark.asyncio
+async def test_message_log_is_cached():
+    store = CountingKVStore()
+    persistence = AgentPersistence("agent", store, turn_to_messages)
+    session_id = await persistence.create_session("session")
+
+    for i in range(5):
+        history = await run_turn(persistence, session_id, i)
+        assert [m.content for m in history[::2]] == [f"question {j}" for j in range(i)]
+    assert store.reads == 0
+
+    # a fresh cache reloads the log from the store
+    other = AgentPersistence(
+        "agent", store, turn_to_messages, message_cache=SessionMessageCache()
+    )
+    session_info = await other.get_session_info(session_id)
+    history = await other.get_session_messages(session_info)
+    assert len(history) == 10
+    assert store.reads == 1
+
+
+class YieldingKVStore(InmemoryKVStoreImpl):
+    async def get(self, key):
+        value = await super().get(key)
+        # let concurrent turns interleave between reading and writing a session
+        await asyncio.sleep(0)
+        return value
+
+
+@pytest.mark.asyncio
+async def test_concurrent_turns_get_their_own_index():
+    store = YieldingKVStore()
+    cache = SessionMessageCache()
+    session_id = await AgentPersistence(
+        "agent", store, turn_to_messages, message_cache=cache
+    ).create_session("session")
+
+    # agents are instantiated per request, so each turn has its own persistence
+    await asyncio.gather(
+        *(
+            AgentPersistence(
+                "agent", store, turn_to_messages, message_cache=cache
+            ).add_turn_to_session(session_id, make_turn(session_id, i))
+            for i in range(4)
+        )
+    )
+
+    persistence = AgentPersistence("agent", store, turn_to_messages)
+    session_info = await persistence.get_session_info(session_id)
+    assert session_info.turn_count == 4
+    turns, _ = await persistence.get_session_turns(session_id)
+    assert sorted(turn.turn_id for turn in turns) == [f"turn-{i}" for i in range(4)]
+    assert len(await persistence.get_session_messages(session_info)) == 8
+
+
+@pytest.mark.asyncio
+async def test_max_history_turns():
+    store = CountingKVStore()
+    persistence = AgentPersistence(
+        "agent", store, turn_to_messages, max_history_turns=2
+    )
+    session_id = await persistence.create_session("session")
+
+    for i in range(4):
+        history = await run_turn(persistence, session_id, i)
+    assert [m.content for m in history] == [
+        "question 1",
+        "answer 1",
+        "question 2",
+        "answer 2",
+    ]
+
+    other = AgentPersistence("agent", store, turn_to_messages, max_history_turns=2)
+    session_info = await other.get_session_info(session_id)
+    history = await other.get_session_messages(session_info)
+    assert [m.content for m in history] == [
+        "question 2",
+        "answer 2",
+        "question 3",
+        "answer 3",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_session_turns_pagination():
+    store = CountingKVStore()
+    persistence = AgentPersistence("agent", store, turn_to_messages)
+    session_id = await persistence.create_session("session")
+    for i in range(5):
+        await run_turn(persistence, session_id, i)
+
+    turns, cursor = await persistence.get_session_turns(session_id, limit=2)
+    assert [turn.turn_id for turn in turns] == ["turn-0", "turn-1"]
+    assert turns[0].steps[0].step_id == "step-0"
+    turns, cursor = await persistence.get_session_turns(
+        session_id, cursor=cursor, limit=2
+    )
+    assert [turn.turn_id for turn in turns] == ["turn-2", "turn-3"]
+    turns, cursor = await persistence.get_session_turns(
+        session_id, cursor=cursor, limit=2
+    )
+    assert [turn.turn_id for turn in turns] == ["turn-4"]
+    assert cursor is None
+
+    turns, cursor = await persistence.get_session_turns(
+        session_id, limit=2, descending=True, include_steps=False
+    )
+    assert [turn.turn_id for turn in turns] == ["turn-4", "turn-3"]
+    assert [turn.output_message.content for turn in turns] == ["answer 4", "answer 3"]
+    assert turns[0].steps == []
+    turns, cursor = await persistence.get_session_turns(
+        session_id, cursor=cursor, descending=True
+    )
+    assert [turn.turn_id for turn in turns] == ["turn-2", "turn-1", "turn-0"]
+    assert cursor is None
+
+    with pytest.raises(ValueError):
+        await persistence.get_session_turns(session_id, cursor="not-a-cursor")
+
+
+def test_turn_encoding():
+    turn = make_turn("session", 0)
+    assert decode_turn(encode_turn(turn)) == turn
+
+    turn.output_message.content = "long answer " * 1000
+    encoded = encode_turn(turn)
+    assert encoded.startswith(COMPRESSED_PREFIX)
+    assert len(encoded) < len(turn.model_dump_json()) / 10
+    assert decode_turn(encoded) == turn
+
+
+@pytest.mark.asyncio
+async def test_unindexed_sessions_are_migrated():
+    store = CountingKVStore()
+    persistence = AgentPersistence("agent", store, turn_to_messages)
+    session_id = await persistence.create_session("session")
+    session_info = await persistence.get_session_info(session_id)
+    session_info.turn_count = None
+    await store.set(f"session:agent:{session_id}", session_info.model_dump_json())
+    # turns as they were stored before they were indexed
+    for i in range(3):
+        turn = make_turn(session_id, i)
+        await store.set(
+            f"session:agent:{session_id}:{turn.turn_id}", turn.model_dump_json()
+        )
+
+    history = await run_turn(persistence, session_id, 3)
+    assert len(history) == 6
+
+    session_info = await persistence.get_session_info(session_id)
+    assert session_info.turn_count == 4
+    other = AgentPersistence("agent", store, turn_to_messages)
+    history = await other.get_session_messages(session_info)
+    assert [m.content for m in history[-2:]] == ["question 3", "answer 3"]
+    turns, _ = await other.get_session_turns(session_id)
+    assert [turn.turn_id for turn in turns] == [f"turn-{i}" for i in range(4)]
+
+
+@pytest.mark.asyncio
+async def test_delete_session_cascades():
+    store = CountingKVStore()
+    persistence = AgentPersistence("agent", store, turn_to_messages)
+    session_id = await persistence.create_session("session")
+    other_session_id = await persistence.create_session("other")
+    await persistence.add_vector_db_to_session(session_id, "vector_db")
+    for i in range(3):
+        await run_turn(persistence, session_id, i)
+        await run_turn(persistence, other_session_id, i)
+
+    assert await persistence.delete_session(session_id) == "vector_db"
+    assert await persistence.get_session_info(session_id) is None
+    assert [key for key in store._store if session_id in key] == []
+
+    turns, _ = await persistence.get_session_turns(other_session_id)
+    assert len(turns) == 3
+
+    assert await persistence.delete_all_sessions() == []
+    assert list(store._store) == []
+
+
+@pytest.mark.asyncio
+async def test_compact_agents_store():
+    store = CountingKVStore()
+    await store.set("agent:live", "{}")
+    live = AgentPersistence("live", store, turn_to_messages)
+    deleted = AgentPersistence("deleted", store, turn_to_messages)
+
+    live_session_id = await live.create_session("live")
+    orphaned_session_id = await deleted.create_session("orphaned")
+    await deleted.add_vector_db_to_session(orphaned_session_id, "vector_db")
+    # as left behind by deleting only the session key
+    deleted_session_id = await live.create_session("deleted")
+    for session_id, persistence in [
+        (live_session_id, live),
+        (orphaned_session_id, deleted),
+        (deleted_session_id, live),
+    ]:
+        await run_turn(persistence, session_id, 0)
+    await store.delete(f"session:live:{deleted_session_id}")
+
+    report = await compact_agents_store(store, dry_run=True)
+    assert report.orphaned_sessions == [orphaned_session_id]
+    assert report.orphaned_turn_sessions == [deleted_session_id]
+    assert report.vector_db_ids == ["vector_db", f"vector_db_{deleted_session_id}"]
+    assert len(store._store) == 12
+
+    await compact_agents_store(store)
+    assert all(live_session_id in key for key in store._store if key != "agent:live")
+    assert len(store._store) == 5
@@ -5,11 +5,16 @@
 # the root directory of this source tree.
 
 from enum import Enum
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field, field_validator
 
 from llama_stack.distribution.utils.config_dirs import RUNTIME_BASE_DIR
+from llama_stack.providers.utils.telemetry.sqlite_trace_store import (
+    DEFAULT_INDEXED_ATTRIBUTES,
+    LargeAttributePolicy,
+)
+from llama_stack.providers.utils.telemetry.tracing import BackgroundLoggerConfig
 
 
 class TelemetrySink(str, Enum):
@@ -18,6 +23,48 @@ class TelemetrySink(str, Enum):
     CONSOLE = "console"
 
 
+class TraceSamplingConfig(BaseModel):
+    head_sample_rate: float = Field(
+        default=1.0,
+        ge=0.0,
+        le=1.0,
+        description="Fraction of traces recorded at all, decided when they start. Applies to every sink",
+    )
+    tail_sample_rate: float = Field(
+        default=1.0,
+        ge=0.0,
+        le=1.0,
+        description="Fraction of the other recorded traces kept in the SQLite store, decided when they end",
+    )
+    keep_errors: bool = Field(
+        default=True,
+        description="Always keep traces with an error span in the SQLite store",
+    )
+    slow_trace_ms: Optional[float] = Field(
+        default=None,
+        description="Always keep traces that took at least this long in the SQLite store",
+    )
+
+
+class TraceRetentionConfig(BaseModel):
+    interval_seconds: float = Field(
+        default=3600,
+        description="How often traces past their ttl are deleted from the SQLite store, 0 to never delete them",
+    )
+    batch_size: int = Field(
+        default=1000,
+        description="Number of traces deleted per transaction",
+    )
+    max_attribute_length: int = Field(
+        default=16_384,
+        description="String span attributes longer than this, such as message dumps, are compacted",
+    )
+    large_attribute_policy: LargeAttributePolicy = Field(
+        default=LargeAttributePolicy.compress,
+        description="Whether long attributes are compressed or truncated",
+    )
+
+
 class TelemetryConfig(BaseModel):
     otel_endpoint: str = Field(
         default="http://localhost:4318/v1/traces",
@@ -35,6 +82,16 @@ class TelemetryConfig(BaseModel):
         default=(RUNTIME_BASE_DIR / "trace_store.db").as_posix(),
         description="The path to the SQLite database to use for storing traces",
     )
+    sqlite_indexed_attributes: List[str] = Field(
+        default_factory=lambda: list(DEFAULT_INDEXED_ATTRIBUTES),
+        description="Span attributes to index in the SQLite database, for fast filtering of trace queries",
+    )
+    sampling: TraceSamplingConfig = Field(default_factory=TraceSamplingConfig)
+    retention: TraceRetentionConfig = Field(default_factory=TraceRetentionConfig)
+    background_logger: BackgroundLoggerConfig = Field(
+        default_factory=BackgroundLoggerConfig,
+        description="Queueing and batching of events on their way to the sinks",
+    )
 
     @field_validator("sinks", mode="before")
     @classmethod
@@ -4,174 +4,305 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
+import hashlib
 import json
+import logging
 import os
 import sqlite3
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from typing import Dict, List, Optional, Sequence
 
-from opentelemetry.sdk.trace import SpanProcessor
-from opentelemetry.trace import Span
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.trace import StatusCode
 
+from llama_stack.apis.telemetry import DEFAULT_TTL_DAYS
+from llama_stack.providers.utils.telemetry.sqlite_trace_store import (
+    compact_attributes,
+    create_trace_tables,
+    delete_expired_traces,
+    LargeAttributePolicy,
+)
 
-class SQLiteSpanProcessor(SpanProcessor):
-    def __init__(self, conn_string):
-        """Initialize the SQLite span processor with a connection string."""
-        self.conn_string = conn_string
-        self.conn = None
-        self.setup_database()
+from .config import TraceRetentionConfig, TraceSamplingConfig
 
-    def _get_connection(self) -> sqlite3.Connection:
-        """Get the database connection."""
-        if self.conn is None:
-            self.conn = sqlite3.connect(self.conn_string, check_same_thread=False)
-        return self.conn
+log = logging.getLogger(__name__)
 
-    def setup_database(self):
-        """Create the necessary tables if they don't exist."""
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(self.conn_string), exist_ok=True)
 
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS traces (
-                trace_id TEXT PRIMARY KEY,
-                service_name TEXT,
-                root_span_id TEXT,
-                start_time TIMESTAMP,
-                end_time TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """
-        )
+def _isoformat(timestamp_ns: int) -> str:
+    return datetime.fromtimestamp(timestamp_ns / 1e9).isoformat()
 
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS spans (
-                span_id TEXT PRIMARY KEY,
-                trace_id TEXT REFERENCES traces(trace_id),
-                parent_span_id TEXT,
-                name TEXT,
-                start_time TIMESTAMP,
-                end_time TIMESTAMP,
-                attributes TEXT,
-                status TEXT,
-                kind TEXT
-            )
-        """
-        )
 
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS span_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                span_id TEXT REFERENCES spans(span_id),
-                name TEXT,
-                timestamp TIMESTAMP,
-                attributes TEXT
-            )
-        """
-        )
+def _trace_fraction(trace_id: int) -> float:
+    # uniform in [0, 1) whatever the trace ids look like, and the same for every span
+    digest = hashlib.blake2b(trace_id.to_bytes(16, "big"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2**64
 
-        cursor.execute(
-            """
-            CREATE INDEX IF NOT EXISTS idx_traces_created_at
-            ON traces(created_at)
-        """
-        )
 
-        conn.commit()
-        cursor.close()
+class TailSampler:
+    """Decides whether to keep a trace once its root span has ended.
 
-    def on_start(self, span: Span, parent_context=None):
-        """Called when a span starts."""
-        pass
+    Spans are held per trace until then. Traces with an error or a slow root span
+    are always kept, and the others with probability `tail_sample_rate`.
+    """
 
-    def on_end(self, span: Span):
-        """Called when a span ends. Export the span data to SQLite."""
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+    def __init__(self, config: TraceSamplingConfig, max_pending_traces: int = 10_000):
+        self.config = config
+        self.max_pending_traces = max_pending_traces
+        self.pending: "OrderedDict[int, List[ReadableSpan]]" = OrderedDict()
+        # for spans that end after their root span, e.g. in background tasks
+        self.decisions: "OrderedDict[int, bool]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.dropped_traces = 0
+
+    def on_end(self, span: ReadableSpan) -> List[ReadableSpan]:
+        """Returns the spans to export now."""
+        trace_id = span.context.trace_id
+        with self.lock:
+            keep = self.decisions.get(trace_id)
+            if keep is not None:
+                return [span] if keep else []
+
+            spans = self.pending.setdefault(trace_id, [])
+            spans.append(span)
+            if span.parent is not None and not span.parent.is_remote:
+                if len(self.pending) <= self.max_pending_traces:
+                    return []
+                # out of room; the oldest trace is exported undecided
+                _, spans = self.pending.popitem(last=False)
+                return spans
+
+            del self.pending[trace_id]
+            keep = self._keep(span, spans)
+            self.decisions[trace_id] = keep
+            if len(self.decisions) > self.max_pending_traces:
+                self.decisions.popitem(last=False)
+            if not keep:
+                self.dropped_traces += 1
+            return spans if keep else []
+
+    def _keep(self, root: ReadableSpan, spans: List[ReadableSpan]) -> bool:
+        if self.config.keep_errors and any(
+            span.status.status_code == StatusCode.ERROR for span in spans
+        ):
+            return True
+        slow_ms = self.config.slow_trace_ms
+        if slow_ms is not None and (root.end_time - root.start_time) / 1e6 >= slow_ms:
+            return True
+        return _trace_fraction(root.context.trace_id) < self.config.tail_sample_rate
 
+
+class SQLiteSpanExporter(SpanExporter):
+    """Writes each batch of finished spans to SQLite in a single transaction."""
+
+    def __init__(
+        self,
+        conn_string: str,
+        indexed_attributes: Optional[List[str]] = None,
+        max_attribute_length: int = 16_384,
+        large_attribute_policy: LargeAttributePolicy = LargeAttributePolicy.compress,
+    ):
+        self.conn_string = conn_string
+        self.max_attribute_length = max_attribute_length
+        self.large_attribute_policy = large_attribute_policy
+        # Create directory if it doesn't exist
+        os.makedirs(os.path.dirname(self.conn_string), exist_ok=True)
+
+        # only used by the processor's worker thread once the tables exist
+        self.conn = sqlite3.connect(self.conn_string, check_same_thread=False)
+        # no fsync per commit; with WAL a crash may lose the last batches, but
+        # cannot corrupt the database
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        create_trace_tables(self.conn, indexed_attributes)
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        traces: Dict[str, list] = {}
+        span_rows = []
+        event_rows = []
+        for span in spans:
             trace_id = format(span.get_span_context().trace_id, "032x")
             span_id = format(span.get_span_context().span_id, "016x")
-            service_name = span.resource.attributes.get("service.name", "unknown")
-
-            parent_span_id = None
-            parent_context = span.parent
-            if parent_context:
-                parent_span_id = format(parent_context.span_id, "016x")
-
-            # Insert into traces
-            cursor.execute(
-                """
-                INSERT INTO traces (
-                    trace_id, service_name, root_span_id, start_time, end_time
-                ) VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(trace_id) DO UPDATE SET
-                    root_span_id = COALESCE(root_span_id, excluded.root_span_id),
-                    start_time = MIN(excluded.start_time, start_time),
-                    end_time = MAX(excluded.end_time, end_time)
-            """,
-                (
-                    trace_id,
-                    service_name,
-                    (span_id if not parent_span_id else None),
-                    datetime.fromtimestamp(span.start_time / 1e9).isoformat(),
-                    datetime.fromtimestamp(span.end_time / 1e9).isoformat(),
-                ),
+            parent_span_id = (
+                format(span.parent.span_id, "016x") if span.parent else None
             )
+            start_time = _isoformat(span.start_time)
+            end_time = _isoformat(span.end_time)
+            # the ttl log_event was called with, on every span of the trace
+            ttl_seconds = span.attributes.get("__ttl__", DEFAULT_TTL_DAYS * 86400)
+            expires_at = datetime.fromtimestamp(
+                span.end_time / 1e9 + ttl_seconds
+            ).isoformat()
+
+            # one upsert per trace, whatever the number of its spans in the batch
+            trace = traces.get(trace_id)
+            if trace is None:
+                traces[trace_id] = [
+                    trace_id,
+                    span.resource.attributes.get("service.name", "unknown"),
+                    None if parent_span_id else span_id,
+                    start_time,
+                    end_time,
+                    expires_at,
+                ]
+            else:
+                if not parent_span_id:
+                    trace[2] = trace[2] or span_id
+                trace[3] = min(trace[3], start_time)
+                trace[4] = max(trace[4], end_time)
+                trace[5] = max(trace[5], expires_at)
 
-            # Insert into spans
-            cursor.execute(
-                """
-                INSERT INTO spans (
-                    span_id, trace_id, parent_span_id, name,
-                    start_time, end_time, attributes, status,
-                    kind
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
+            span_rows.append(
                 (
                     span_id,
                     trace_id,
                     parent_span_id,
                     span.name,
-                    datetime.fromtimestamp(span.start_time / 1e9).isoformat(),
-                    datetime.fromtimestamp(span.end_time / 1e9).isoformat(),
-                    json.dumps(dict(span.attributes)),
+                    start_time,
+                    end_time,
+                    json.dumps(self._compact(span.attributes)),
                     span.status.status_code.name,
                     span.kind.name,
-                ),
+                )
             )
-
             for event in span.events:
-                cursor.execute(
+                event_rows.append(
+                    (
+                        span_id,
+                        event.name,
+                        _isoformat(event.timestamp),
+                        json.dumps(self._compact(event.attributes)),
+                    )
+                )
+
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    """
+                    INSERT INTO traces (
+                        trace_id, service_name, root_span_id, start_time, end_time,
+                        expires_at
+                    ) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(trace_id) DO UPDATE SET
+                        root_span_id = COALESCE(root_span_id, excluded.root_span_id),
+                        start_time = MIN(excluded.start_time, start_time),
+                        end_time = MAX(excluded.end_time, end_time),
+                        expires_at = MAX(excluded.expires_at, expires_at)
+                    """,
+                    traces.values(),
+                )
+                # a span exported twice must not fail the rest of its batch
+                self.conn.executemany(
+                    """
+                    INSERT INTO spans (
+                        span_id, trace_id, parent_span_id, name,
+                        start_time, end_time, attributes, status,
+                        kind
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(span_id) DO NOTHING
+                    """,
+                    span_rows,
+                )
+                self.conn.executemany(
                     """
                     INSERT INTO span_events (
                         span_id, name, timestamp, attributes
                     ) VALUES (?, ?, ?, ?)
-                """,
-                    (
-                        span_id,
-                        event.name,
-                        datetime.fromtimestamp(event.timestamp / 1e9).isoformat(),
-                        json.dumps(dict(event.attributes)),
-                    ),
+                    """,
+                    event_rows,
                 )
+        except sqlite3.Error as e:
+            log.error(f"Error exporting {len(spans)} spans to SQLite: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
 
-            conn.commit()
-            cursor.close()
-        except Exception as e:
-            print(f"Error exporting span to SQLite: {e}")
+    def _compact(self, attributes) -> dict:
+        return compact_attributes(
+            dict(attributes), self.max_attribute_length, self.large_attribute_policy
+        )
 
     def shutdown(self):
-        """Cleanup any resources."""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
-
-    def force_flush(self, timeout_millis=30000):
-        """Force export of spans."""
-        pass
+        self.conn.close()
+
+
+class SQLiteSpanProcessor(BatchSpanProcessor):
+    """Buffers finished spans and writes them to SQLite from a background thread.
+
+    Ending a span only enqueues it. Spans are written in batches of up to
+    `max_export_batch_size`, at least every `schedule_delay_millis`. Traces can be
+    tail sampled before they are queued, and expired traces are deleted by a
+    second thread every `retention.interval_seconds`.
+    """
+
+    def __init__(
+        self,
+        conn_string: str,
+        indexed_attributes: Optional[List[str]] = None,
+        sampling: Optional[TraceSamplingConfig] = None,
+        retention: Optional[TraceRetentionConfig] = None,
+        max_queue_size: int = 8192,
+        schedule_delay_millis: float = 500,
+        max_export_batch_size: int = 512,
+    ):
+        retention = retention or TraceRetentionConfig()
+        super().__init__(
+            SQLiteSpanExporter(
+                conn_string,
+                indexed_attributes,
+                retention.max_attribute_length,
+                retention.large_attribute_policy,
+            ),
+            max_queue_size=max_queue_size,
+            schedule_delay_millis=schedule_delay_millis,
+            max_export_batch_size=max_export_batch_size,
+        )
+        self.conn_string = conn_string
+        self.retention = retention
+        self.tail_sampler = (
+            TailSampler(sampling)
+            if sampling and sampling.tail_sample_rate < 1
+            else None
+        )
+
+        self._stopping = threading.Event()
+        self.retention_thread = None
+        if retention.interval_seconds:
+            self.retention_thread = threading.Thread(
+                target=self._run_retention, name="trace-retention", daemon=True
+            )
+            self.retention_thread.start()
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if self.tail_sampler is None:
+            super().on_end(span)
+            return
+        for kept in self.tail_sampler.on_end(span):
+            super().on_end(kept)
+
+    def delete_expired_traces(self) -> int:
+        conn = sqlite3.connect(self.conn_string, timeout=30)
+        try:
+            return delete_expired_traces(
+                conn, datetime.now(), self.retention.batch_size
+            )
+        finally:
+            conn.close()
+
+    def _run_retention(self) -> None:
+        while not self._stopping.wait(self.retention.interval_seconds):
+            try:
+                self.delete_expired_traces()
+            except sqlite3.Error as e:
+                log.error(f"Error deleting expired traces: {e}")
+
+    def shutdown(self) -> None:
+        self._stopping.set()
+        # the exporter closes its connection, so let a running deletion finish first
+        if self.retention_thread is not None:
+            self.retention_thread.join()
+        super().shutdown()
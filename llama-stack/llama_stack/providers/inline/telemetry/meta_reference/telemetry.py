@@ -4,6 +4,7 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
+import logging
 import threading
 from typing import Any, Dict, List, Optional
 
@@ -15,6 +16,7 @@ from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ALWAYS_OFF, ParentBased, TraceIdRatioBased
 from opentelemetry.semconv.resource import ResourceAttributes
 
 from llama_stack.apis.telemetry import (
@@ -41,9 +43,15 @@ from llama_stack.providers.inline.telemetry.meta_reference.sqlite_span_processor
 )
 from llama_stack.providers.utils.telemetry.dataset_mixin import TelemetryDatasetMixin
 from llama_stack.providers.utils.telemetry.sqlite_trace_store import SQLiteTraceStore
+from llama_stack.providers.utils.telemetry.trace_protocol import (
+    LazyAttribute,
+    resolve_attributes,
+)
 
 from .config import TelemetryConfig, TelemetrySink
 
+log = logging.getLogger(__name__)
+
 _GLOBAL_STORAGE = {
     "active_spans": {},
     "counters": {},
@@ -87,7 +95,15 @@ class TelemetryAdapter(TelemetryDatasetMixin, Telemetry):
         # Since the library client can be recreated multiple times in a notebook,
         # the kernel will hold on to the span processor and cause duplicate spans to be written.
         if _TRACER_PROVIDER is None:
-            provider = TracerProvider(resource=resource)
+            sampler = None
+            head_sample_rate = self.config.sampling.head_sample_rate
+            if not self.config.sinks:
+                # nothing would export the spans, so don't record them
+                sampler = ALWAYS_OFF
+            elif head_sample_rate < 1:
+                # spans follow the decision made for the root span of their trace
+                sampler = ParentBased(TraceIdRatioBased(head_sample_rate))
+            provider = TracerProvider(resource=resource, sampler=sampler)
             trace.set_tracer_provider(provider)
             _TRACER_PROVIDER = provider
             if TelemetrySink.OTEL in self.config.sinks:
@@ -107,7 +123,12 @@ class TelemetryAdapter(TelemetryDatasetMixin, Telemetry):
                 metrics.set_meter_provider(metric_provider)
             if TelemetrySink.SQLITE in self.config.sinks:
                 trace.get_tracer_provider().add_span_processor(
-                    SQLiteSpanProcessor(self.config.sqlite_db_path)
+                    SQLiteSpanProcessor(
+                        self.config.sqlite_db_path,
+                        self.config.sqlite_indexed_attributes,
+                        self.config.sampling,
+                        self.config.retention,
+                    )
                 )
             if TelemetrySink.CONSOLE in self.config.sinks:
                 trace.get_tracer_provider().add_span_processor(ConsoleSpanProcessor())
@@ -115,7 +136,9 @@ class TelemetryAdapter(TelemetryDatasetMixin, Telemetry):
         if TelemetrySink.OTEL in self.config.sinks:
             self.meter = metrics.get_meter(__name__)
         if TelemetrySink.SQLITE in self.config.sinks:
-            self.trace_store = SQLiteTraceStore(self.config.sqlite_db_path)
+            self.trace_store = SQLiteTraceStore(
+                self.config.sqlite_db_path, self.config.sqlite_indexed_attributes
+            )
 
         self._lock = _global_lock
 
@@ -126,6 +149,19 @@ class TelemetryAdapter(TelemetryDatasetMixin, Telemetry):
         trace.get_tracer_provider().force_flush()
 
     async def log_event(self, event: Event, ttl_seconds: int = 604800) -> None:
+        with self._lock:
+            self._log_event(event, ttl_seconds)
+
+    async def log_events(self, events: List[Event], ttl_seconds: int = 604800) -> None:
+        # one lock section for the batch; an event that fails is logged and skipped
+        with self._lock:
+            for event in events:
+                try:
+                    self._log_event(event, ttl_seconds)
+                except Exception:
+                    log.exception(f"Failed to log telemetry event {event}")
+
+    def _log_event(self, event: Event, ttl_seconds: int) -> None:
         if isinstance(event, UnstructuredLogEvent):
             self._log_unstructured(event, ttl_seconds)
         elif isinstance(event, MetricEvent):
@@ -136,27 +172,26 @@ class TelemetryAdapter(TelemetryDatasetMixin, Telemetry):
             raise ValueError(f"Unknown event type: {event}")
 
     def _log_unstructured(self, event: UnstructuredLogEvent, ttl_seconds: int) -> None:
-        with self._lock:
-            # Use global storage instead of instance storage
-            span_id = string_to_span_id(event.span_id)
-            span = _GLOBAL_STORAGE["active_spans"].get(span_id)
-
-            if span:
-                timestamp_ns = int(event.timestamp.timestamp() * 1e9)
-                span.add_event(
-                    name=event.type,
-                    attributes={
-                        "message": event.message,
-                        "severity": event.severity.value,
-                        "__ttl__": ttl_seconds,
-                        **event.attributes,
-                    },
-                    timestamp=timestamp_ns,
-                )
-            else:
-                print(
-                    f"Warning: No active span found for span_id {span_id}. Dropping event: {event}"
-                )
+        # Use global storage instead of instance storage
+        span_id = string_to_span_id(event.span_id)
+        span = _GLOBAL_STORAGE["active_spans"].get(span_id)
+
+        if span:
+            timestamp_ns = int(event.timestamp.timestamp() * 1e9)
+            span.add_event(
+                name=event.type,
+                attributes={
+                    "message": event.message,
+                    "severity": event.severity.value,
+                    "__ttl__": ttl_seconds,
+                    **event.attributes,
+                },
+                timestamp=timestamp_ns,
+            )
+        else:
+            print(
+                f"Warning: No active span found for span_id {span_id}. Dropping event: {event}"
+            )
 
     def _get_or_create_counter(self, name: str, unit: str) -> metrics.Counter:
         if name not in _GLOBAL_STORAGE["counters"]:
@@ -200,51 +235,56 @@ class TelemetryAdapter(TelemetryDatasetMixin, Telemetry):
         return _GLOBAL_STORAGE["up_down_counters"][name]
 
     def _log_structured(self, event: StructuredLogEvent, ttl_seconds: int) -> None:
-        with self._lock:
-            span_id = string_to_span_id(event.span_id)
-            trace_id = string_to_trace_id(event.trace_id)
-            tracer = trace.get_tracer(__name__)
-            if event.attributes is None:
-                event.attributes = {}
-            event.attributes["__ttl__"] = ttl_seconds
-
-            if isinstance(event.payload, SpanStartPayload):
-                # Check if span already exists to prevent duplicates
-                if span_id in _GLOBAL_STORAGE["active_spans"]:
-                    return
-
-                parent_span = None
-                if event.payload.parent_span_id:
-                    parent_span_id = string_to_span_id(event.payload.parent_span_id)
-                    parent_span = _GLOBAL_STORAGE["active_spans"].get(parent_span_id)
-
-                context = trace.Context(trace_id=trace_id)
-                if parent_span:
-                    context = trace.set_span_in_context(parent_span, context)
-
-                span = tracer.start_span(
-                    name=event.payload.name,
-                    context=context,
-                    attributes=event.attributes or {},
+        span_id = string_to_span_id(event.span_id)
+        trace_id = string_to_trace_id(event.trace_id)
+        tracer = trace.get_tracer(__name__)
+        if event.attributes is None:
+            event.attributes = {}
+        event.attributes["__ttl__"] = ttl_seconds
+
+        if isinstance(event.payload, SpanStartPayload):
+            # Check if span already exists to prevent duplicates
+            if span_id in _GLOBAL_STORAGE["active_spans"]:
+                return
+
+            parent_span = None
+            if event.payload.parent_span_id:
+                parent_span_id = string_to_span_id(event.payload.parent_span_id)
+                parent_span = _GLOBAL_STORAGE["active_spans"].get(parent_span_id)
+
+            context = trace.Context(trace_id=trace_id)
+            if parent_span:
+                context = trace.set_span_in_context(parent_span, context)
+
+            # deferred values are set with the others when the span ends, and
+            # only if it is sampled
+            span = tracer.start_span(
+                name=event.payload.name,
+                context=context,
+                attributes={
+                    key: value
+                    for key, value in event.attributes.items()
+                    if not isinstance(value, LazyAttribute)
+                },
+            )
+            _GLOBAL_STORAGE["active_spans"][span_id] = span
+
+        elif isinstance(event.payload, SpanEndPayload):
+            span = _GLOBAL_STORAGE["active_spans"].get(span_id)
+            if span:
+                if event.attributes and span.is_recording():
+                    span.set_attributes(resolve_attributes(event.attributes))
+
+                status = (
+                    trace.Status(status_code=trace.StatusCode.OK)
+                    if event.payload.status == SpanStatus.OK
+                    else trace.Status(status_code=trace.StatusCode.ERROR)
                 )
-                _GLOBAL_STORAGE["active_spans"][span_id] = span
-
-            elif isinstance(event.payload, SpanEndPayload):
-                span = _GLOBAL_STORAGE["active_spans"].get(span_id)
-                if span:
-                    if event.attributes:
-                        span.set_attributes(event.attributes)
-
-                    status = (
-                        trace.Status(status_code=trace.StatusCode.OK)
-                        if event.payload.status == SpanStatus.OK
-                        else trace.Status(status_code=trace.StatusCode.ERROR)
-                    )
-                    span.set_status(status)
-                    span.end()
-                    _GLOBAL_STORAGE["active_spans"].pop(span_id, None)
-            else:
-                raise ValueError(f"Unknown structured log event: {event}")
+                span.set_status(status)
+                span.end()
+                _GLOBAL_STORAGE["active_spans"].pop(span_id, None)
+        else:
+            raise ValueError(f"Unknown structured log event: {event}")
 
     async def query_traces(
         self,
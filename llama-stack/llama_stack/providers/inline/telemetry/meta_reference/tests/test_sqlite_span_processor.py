@@ -0,0 +1,175 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import logging
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from llama_stack.apis.telemetry import QueryCondition
+from llama_stack.providers.inline.telemetry.meta_reference.config import (
+    TraceRetentionConfig,
+    TraceSamplingConfig,
+)
+from llama_stack.providers.inline.telemetry.meta_reference.sqlite_span_processor import (
+    SQLiteSpanProcessor,
+)
+from llama_stack.providers.utils.telemetry.sqlite_trace_store import SQLiteTraceStore
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.trace import Status, StatusCode
+
+
+@pytest.mark.asyncio
+async def test_spans_are_written_in_batches(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "traces" / "trace_store.db")
+    processor = SQLiteSpanProcessor(
+        db_path, ["session_id"], schedule_delay_millis=60_000
+    )
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    tracer = provider.get_tracer(__name__)
+
+    batches = []
+    export = processor.span_exporter.export
+    monkeypatch.setattr(
+        processor.span_exporter,
+        "export",
+        lambda spans: batches.append(len(spans)) or export(spans),
+    )
+
+    for i in range(10):
+        # the telemetry adapter always sets a status, the trace store expects one
+        with tracer.start_as_current_span(f"request-{i}") as root:
+            root.set_status(Status(StatusCode.OK))
+            with tracer.start_as_current_span("turn") as span:
+                span.set_status(Status(StatusCode.OK))
+                span.set_attribute("session_id", f"session{i % 2}")
+                span.add_event("log", {"message": "hello"})
+    # ending spans only queues them
+    assert batches == []
+    assert processor.force_flush()
+    assert batches == [20]
+
+    store = SQLiteTraceStore(db_path, ["session_id"])
+    traces = await store.query_traces(
+        attribute_filters=[QueryCondition(key="session_id", op="eq", value="session1")]
+    )
+    assert len(traces) == 5
+    trace = await store.get_trace(traces[0].trace_id)
+    tree = await store.get_span_tree(trace.root_span_id)
+    root, turn = tree.values()
+    assert root.name.startswith("request-") and turn.name == "turn"
+    assert turn.parent_span_id == root.span_id
+    assert turn.attributes["session_id"] == "session1"
+
+    provider.shutdown()
+
+
+def make_processor(tmp_path, **kwargs):
+    db_path = str(tmp_path / "trace_store.db")
+    processor = SQLiteSpanProcessor(db_path, **kwargs)
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    return db_path, processor, provider.get_tracer(__name__)
+
+
+def stored_root_names(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT s.name FROM traces t JOIN spans s ON s.span_id = t.root_span_id ORDER BY 1"
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def test_tail_sampling_keeps_errors_and_slow_traces(tmp_path):
+    db_path, processor, tracer = make_processor(
+        tmp_path,
+        sampling=TraceSamplingConfig(tail_sample_rate=0.0, slow_trace_ms=50),
+        retention=TraceRetentionConfig(interval_seconds=0),
+    )
+    with tracer.start_as_current_span("ok"):
+        with tracer.start_as_current_span("child"):
+            pass
+    with tracer.start_as_current_span("error"):
+        with tracer.start_as_current_span("child") as child:
+            child.set_status(Status(StatusCode.ERROR))
+    with tracer.start_as_current_span("slow"):
+        time.sleep(0.06)
+
+    # a span that ends after its root follows the decision for its trace
+    with tracer.start_as_current_span("late"):
+        late = tracer.start_span("late child")
+    late.end()
+
+    assert processor.force_flush()
+    assert stored_root_names(db_path) == ["error", "slow"]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT count(*) FROM spans").fetchone() == (3,)
+    assert processor.tail_sampler.dropped_traces == 2
+    processor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_retention_and_large_attributes(tmp_path):
+    db_path, processor, tracer = make_processor(
+        tmp_path,
+        retention=TraceRetentionConfig(interval_seconds=0, max_attribute_length=100),
+    )
+    with tracer.start_as_current_span("short-lived") as span:
+        span.set_attribute("__ttl__", 60)
+        span.set_status(Status(StatusCode.OK))
+    with tracer.start_as_current_span("long-lived") as span:
+        span.set_attribute("__ttl__", 3600)
+        span.set_attribute("output", "z" * 10_000)
+        span.set_status(Status(StatusCode.OK))
+    assert processor.force_flush()
+
+    conn = sqlite3.connect(db_path)
+    (stored,) = conn.execute(
+        "SELECT length(attributes) FROM spans WHERE name = 'long-lived'"
+    ).fetchone()
+    assert stored < 1000
+    (span_id,) = conn.execute(
+        "SELECT span_id FROM spans WHERE name = 'long-lived'"
+    ).fetchone()
+    tree = await SQLiteTraceStore(db_path).get_span_tree(span_id)
+    assert tree[span_id].attributes["output"] == "z" * 10_000
+
+    # nothing has expired yet
+    assert processor.delete_expired_traces() == 0
+    conn.execute(
+        "UPDATE traces SET expires_at = ? WHERE expires_at < ?",
+        (
+            (datetime.now() - timedelta(seconds=1)).isoformat(),
+            (datetime.now() + timedelta(seconds=120)).isoformat(),
+        ),
+    )
+    conn.commit()
+    assert processor.delete_expired_traces() == 1
+    assert stored_root_names(db_path) == ["long-lived"]
+    processor.shutdown()
+
+
+def test_retention_errors_are_logged_and_shutdown_waits(tmp_path, monkeypatch, caplog):
+    deleting = []
+
+    def failing_delete(self):
+        deleting.append(True)
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(SQLiteSpanProcessor, "delete_expired_traces", failing_delete)
+    _, processor, _ = make_processor(
+        tmp_path, retention=TraceRetentionConfig(interval_seconds=0.01)
+    )
+    with caplog.at_level(logging.ERROR):
+        while not deleting:
+            time.sleep(0.01)
+        processor.shutdown()
+
+    assert not processor.retention_thread.is_alive()
+    assert "Error deleting expired traces: database is locked" in caplog.text
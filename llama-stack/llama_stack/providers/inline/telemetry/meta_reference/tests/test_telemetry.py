@@ -0,0 +1,48 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import logging
+from datetime import datetime
+
+import pytest
+
+from llama_stack.apis.telemetry import MetricEvent, SpanStartPayload, StructuredLogEvent
+from llama_stack.providers.inline.telemetry.meta_reference.config import TelemetryConfig
+from llama_stack.providers.inline.telemetry.meta_reference.telemetry import (
+    _GLOBAL_STORAGE,
+    string_to_span_id,
+    TelemetryAdapter,
+)
+
+
+def span_start(span_id: str) -> StructuredLogEvent:
+    return StructuredLogEvent(
+        trace_id="trace",
+        span_id=span_id,
+        timestamp=datetime.now(),
+        payload=SpanStartPayload(name=span_id),
+    )
+
+
+@pytest.mark.asyncio
+async def test_log_events_skips_failing_events(caplog):
+    adapter = TelemetryAdapter(TelemetryConfig(sinks=[]), {})
+    # without the otel sink there is no meter to record metrics with
+    metric = MetricEvent(
+        trace_id="trace",
+        span_id="metric",
+        timestamp=datetime.now(),
+        metric="tokens",
+        value=1,
+        unit="tokens",
+    )
+
+    with caplog.at_level(logging.ERROR):
+        await adapter.log_events([span_start("before"), metric, span_start("after")])
+
+    assert "Failed to log telemetry event" in caplog.text
+    for span_id in ("before", "after"):
+        assert _GLOBAL_STORAGE["active_spans"].pop(string_to_span_id(span_id))
@@ -4,8 +4,31 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from llama_stack.providers.utils.memory.vector_store import ChunkBoundary
 
 
 class RagToolRuntimeConfig(BaseModel):
-    pass
+    chunk_boundary: ChunkBoundary = Field(
+        default=ChunkBoundary.token,
+        description="Shorten chunks to end at sentence or paragraph boundaries when possible",
+    )
+    max_concurrent_fetches: int = Field(
+        default=8,
+        description="Maximum number of documents fetched and parsed at the same time during insert",
+    )
+    embedding_batch_size: int = Field(
+        default=128,
+        description="Number of chunks sent to the vector db in each insert_chunks call",
+    )
+    max_pending_batches: int = Field(
+        default=4,
+        description="Number of chunk batches that may wait to be embedded before fetching pauses",
+    )
+    parser_workers: Optional[int] = Field(
+        default=None,
+        description="Size of the process pool that parses and chunks documents; defaults to the number of CPUs",
+    )
@@ -5,10 +5,16 @@
 # the root directory of this source tree.
 
 import asyncio
+import heapq
+import itertools
 import logging
+import multiprocessing
 import secrets
 import string
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+
+import httpx
 
 from llama_stack.apis.common.content_types import (
     InterleavedContent,
@@ -25,11 +31,13 @@ from llama_stack.apis.tools import (
     ToolInvocationResult,
     ToolRuntime,
 )
-from llama_stack.apis.vector_io import QueryChunksResponse, VectorIO
+from llama_stack.apis.vector_io import Chunk, QueryChunksResponse, VectorIO
 from llama_stack.providers.datatypes import ToolsProtocolPrivate
 from llama_stack.providers.utils.memory.vector_store import (
-    content_from_doc,
+    ChunkBoundary,
+    fetch_doc,
     make_overlapped_chunks,
+    parse_doc,
 )
 
 from .config import RagToolRuntimeConfig
@@ -38,6 +46,19 @@ from .context_retriever import generate_rag_query
 log = logging.getLogger(__name__)
 
 
+def chunk_document(
+    document_id: str,
+    raw: Union[str, bytes, URL],
+    window_len: int,
+    overlap_len: int,
+    boundary: ChunkBoundary,
+) -> List[Chunk]:
+    # runs in the parser pool
+    return make_overlapped_chunks(
+        document_id, parse_doc(raw), window_len, overlap_len, boundary
+    )
+
+
 def make_random_string(length: int = 8):
     return "".join(
         secrets.choice(string.ascii_letters + string.digits) for _ in range(length)
@@ -56,10 +77,17 @@ class MemoryToolRuntimeImpl(ToolsProtocolPrivate, ToolRuntime, RAGToolRuntime):
         self.inference_api = inference_api
 
     async def initialize(self):
-        pass
+        self.http_client = httpx.AsyncClient()
+        # forking this multithreaded process could copy locks held by other threads
+        self.parser_pool = ProcessPoolExecutor(
+            max_workers=self.config.parser_workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        self.fetch_semaphore = asyncio.Semaphore(self.config.max_concurrent_fetches)
 
     async def shutdown(self):
-        pass
+        await self.http_client.aclose()
+        self.parser_pool.shutdown(wait=False, cancel_futures=True)
 
     async def insert(
         self,
@@ -67,25 +95,64 @@ class MemoryToolRuntimeImpl(ToolsProtocolPrivate, ToolRuntime, RAGToolRuntime):
         vector_db_id: str,
         chunk_size_in_tokens: int = 512,
     ) -> None:
-        chunks = []
-        for doc in documents:
-            content = await content_from_doc(doc)
-            chunks.extend(
-                make_overlapped_chunks(
+        # Documents are fetched concurrently and parsed and chunked in the process
+        # pool, while their chunks are embedded and inserted batch by batch. The
+        # queue is bounded, so fetching pauses while the vector db catches up and
+        # at most max_concurrent_fetches documents are held in memory.
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.max_pending_batches)
+        batch_size = self.config.embedding_batch_size
+
+        async def ingest(doc: RAGDocument) -> None:
+            async with self.fetch_semaphore:
+                raw = await fetch_doc(doc, self.http_client)
+                chunks = await asyncio.get_running_loop().run_in_executor(
+                    self.parser_pool,
+                    chunk_document,
                     doc.document_id,
-                    content,
+                    raw,
                     chunk_size_in_tokens,
                     chunk_size_in_tokens // 4,
+                    self.config.chunk_boundary,
                 )
+                del raw
+                for i in range(0, len(chunks), batch_size):
+                    await queue.put(chunks[i : i + batch_size])
+
+        producers = [asyncio.create_task(ingest(doc)) for doc in documents]
+        consumer = asyncio.create_task(self._insert_batches(queue, vector_db_id))
+        producing = asyncio.gather(*producers)
+        try:
+            done, _ = await asyncio.wait(
+                [consumer, producing], return_when=asyncio.FIRST_COMPLETED
             )
+            # the consumer only returns after the end marker, so it failed
+            if consumer in done:
+                consumer.result()
+            await producing
+            await queue.put(None)
+            await consumer
+        finally:
+            for task in [consumer, *producers]:
+                task.cancel()
+
+    async def _insert_batches(self, queue: asyncio.Queue, vector_db_id: str) -> None:
+        # batches of small documents are merged up to embedding_batch_size chunks
+        pending: List[Chunk] = []
+        while (chunks := await queue.get()) is not None:
+            pending.extend(chunks)
+            while len(pending) >= self.config.embedding_batch_size:
+                batch = pending[: self.config.embedding_batch_size]
+                pending = pending[self.config.embedding_batch_size :]
+                await self.vector_io_api.insert_chunks(
+                    chunks=batch,
+                    vector_db_id=vector_db_id,
+                )
 
-        if not chunks:
-            return
-
-        await self.vector_io_api.insert_chunks(
-            chunks=chunks,
-            vector_db_id=vector_db_id,
-        )
+        if pending:
+            await self.vector_io_api.insert_chunks(
+                chunks=pending,
+                vector_db_id=vector_db_id,
+            )
 
     async def query(
         self,
@@ -108,25 +175,33 @@ class MemoryToolRuntimeImpl(ToolsProtocolPrivate, ToolRuntime, RAGToolRuntime):
                 query=query,
                 params={
                     "max_chunks": query_config.max_chunks,
+                    "score_threshold": query_config.score_threshold,
+                    "mode": query_config.mode.value,
+                    "rrf_k": query_config.rrf_k,
                 },
             )
             for vector_db_id in vector_db_ids
         ]
         results: List[QueryChunksResponse] = await asyncio.gather(*tasks)
-        chunks = [c for r in results for c in r.chunks]
-        scores = [s for r in results for s in r.scores]
 
+        # each vector db returns its chunks best first
+        chunks = [
+            c
+            for c, _ in itertools.islice(
+                heapq.merge(
+                    *[zip(r.chunks, r.scores) for r in results],
+                    key=lambda x: x[1],
+                    reverse=True,
+                ),
+                query_config.max_chunks,
+            )
+        ]
         if not chunks:
             return RAGQueryResult(content=None)
 
-        # sort by score
-        chunks, scores = zip(
-            *sorted(zip(chunks, scores), key=lambda x: x[1], reverse=True)
-        )
-
         tokens = 0
         picked = []
-        for c in chunks[: query_config.max_chunks]:
+        for c in chunks:
             metadata = c.metadata
             tokens += metadata["token_count"]
             if tokens > query_config.max_tokens_in_context:
@@ -0,0 +1,117 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import asyncio
+import base64
+
+import pytest
+
+from llama_stack.apis.tools import RAGDocument
+
+from llama_stack.providers.inline.tool_runtime.rag.config import RagToolRuntimeConfig
+from llama_stack.providers.inline.tool_runtime.rag.memory import MemoryToolRuntimeImpl
+
+
+class FakeVectorIO:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+
+    async def insert_chunks(self, vector_db_id, chunks, ttl_seconds=None):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("insert failed")
+        self.batches.append((vector_db_id, chunks))
+
+
+async def make_runtime(vector_io, **config):
+    runtime = MemoryToolRuntimeImpl(
+        RagToolRuntimeConfig(parser_workers=2, **config), vector_io, None
+    )
+    await runtime.initialize()
+    return runtime
+
+
+def text_document(i: int, words: int = 200) -> RAGDocument:
+    return RAGDocument(
+        document_id=f"doc-{i}",
+        content=" ".join(f"word{i}-{n}" for n in range(words)),
+        metadata={},
+    )
+
+
+@pytest.mark.asyncio
+async def test_insert_batches_chunks_of_all_documents():
+    vector_io = FakeVectorIO()
+    runtime = await make_runtime(vector_io, embedding_batch_size=8)
+    encoded = base64.b64encode(b"hello from a data url").decode("utf-8")
+    documents = [text_document(i) for i in range(5)] + [
+        RAGDocument(
+            document_id="data",
+            content=f"data:text/plain;base64,{encoded}",
+            metadata={},
+        )
+    ]
+    try:
+        await runtime.insert(documents, "db", chunk_size_in_tokens=64)
+    finally:
+        await runtime.shutdown()
+
+    assert {vector_db_id for vector_db_id, _ in vector_io.batches} == {"db"}
+    assert all(len(chunks) == 8 for _, chunks in vector_io.batches[:-1])
+    assert 0 < len(vector_io.batches[-1][1]) <= 8
+
+    chunks = [chunk for _, batch in vector_io.batches for chunk in batch]
+    assert {chunk.metadata["document_id"] for chunk in chunks} == {
+        doc.document_id for doc in documents
+    }
+    data_chunks = [c for c in chunks if c.metadata["document_id"] == "data"]
+    assert [c.content for c in data_chunks] == ["hello from a data url"]
+    # each document's chunks keep their order
+    doc_0 = [c.content for c in chunks if c.metadata["document_id"] == "doc-0"]
+    assert doc_0[0].startswith("word0-0 ")
+
+
+@pytest.mark.asyncio
+async def test_insert_applies_backpressure(monkeypatch):
+    vector_io = FakeVectorIO(delay=0.01)
+    runtime = await make_runtime(
+        vector_io, embedding_batch_size=2, max_pending_batches=1
+    )
+    queue_sizes = []
+    put = asyncio.Queue.put
+
+    async def tracking_put(queue, item):
+        await put(queue, item)
+        queue_sizes.append(queue.qsize())
+
+    monkeypatch.setattr(asyncio.Queue, "put", tracking_put)
+    try:
+        await runtime.insert(
+            [text_document(i) for i in range(4)], "db", chunk_size_in_tokens=32
+        )
+    finally:
+        await runtime.shutdown()
+
+    assert len(vector_io.batches) > 4
+    assert max(queue_sizes) <= 1
+
+
+@pytest.mark.asyncio
+async def test_insert_failure_stops_ingestion():
+    vector_io = FakeVectorIO(fail=True)
+    runtime = await make_runtime(vector_io, embedding_batch_size=2)
+    try:
+        with pytest.raises(RuntimeError, match="insert failed"):
+            await asyncio.wait_for(
+                runtime.insert(
+                    [text_document(i) for i in range(4)], "db", chunk_size_in_tokens=32
+                ),
+                timeout=30,
+            )
+    finally:
+        await runtime.shutdown()
@@ -4,20 +4,89 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
-from typing import Any, Dict
+from enum import Enum
+from typing import Any, Dict, Optional
 
 from llama_models.schema_utils import json_schema_type
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from llama_stack.providers.utils.kvstore.config import (
     KVStoreConfig,
     SqliteKVStoreConfig,
 )
+from llama_stack.providers.utils.memory.embedding_cache import EmbeddingCacheConfig
+
+
+class FaissIndexType(Enum):
+    flat = "flat"
+    hnsw = "hnsw"
+    ivf_flat = "ivf_flat"
+    ivf_pq = "ivf_pq"
+
+
+class FaissMetric(Enum):
+    l2 = "l2"
+    inner_product = "inner_product"
+    # inner product over normalized vectors
+    cosine = "cosine"
+
+
+@json_schema_type
+class FaissIndexConfig(BaseModel):
+    type: FaissIndexType = FaissIndexType.flat
+    metric: FaissMetric = FaissMetric.l2
+
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 40
+    # default efSearch, can be overridden per query with the `ef_search` param
+    hnsw_ef_search: int = 64
+
+    ivf_nlist: int = 1024
+    # default nprobe, can be overridden per query with the `nprobe` param
+    ivf_nprobe: int = 16
+    # IVF indexes are served by an exact flat index until this many vectors
+    # exist, and are then trained in the background. Defaults to 39 * nlist,
+    # the minimum faiss recommends for training.
+    ivf_train_size: Optional[int] = None
+
+    # number of PQ subquantizers, must divide the embedding dimension
+    pq_m: int = 16
+    pq_nbits: int = 8
+
+    # also maintain a BM25 index of the chunk text, for keyword and hybrid queries
+    keyword_index: bool = True
+
+    # split the vectors of new banks over this many indexes, searched in parallel;
+    # existing banks keep the number of shards they were created with
+    num_shards: int = 1
+
+    @property
+    def train_size(self) -> int:
+        return self.ivf_train_size or 39 * self.ivf_nlist
+
+    def factory_string(self) -> str:
+        if self.type == FaissIndexType.hnsw:
+            return f"HNSW{self.hnsw_m}"
+        if self.type == FaissIndexType.ivf_flat:
+            return f"IVF{self.ivf_nlist},Flat"
+        if self.type == FaissIndexType.ivf_pq:
+            return f"IVF{self.ivf_nlist},PQ{self.pq_m}x{self.pq_nbits}"
+        return "Flat"
 
 
 @json_schema_type
 class FaissImplConfig(BaseModel):
     kvstore: KVStoreConfig
+    # default for vector dbs that do not set `faiss_index` in their metadata
+    index: FaissIndexConfig = Field(default_factory=FaissIndexConfig)
+    # shared by all vector dbs of the provider; set to null to disable
+    embedding_cache: Optional[EmbeddingCacheConfig] = Field(
+        default_factory=EmbeddingCacheConfig
+    )
+
+    def index_config(self, vector_db_metadata: Dict[str, Any]) -> FaissIndexConfig:
+        overrides = vector_db_metadata.get("faiss_index") or {}
+        return FaissIndexConfig(**{**self.index.model_dump(), **overrides})
 
     @classmethod
     def sample_run_config(cls, __distro_dir__: str) -> Dict[str, Any]:
@@ -4,12 +4,15 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
+import asyncio
 import base64
 import io
 import json
 import logging
+import math
+from contextlib import asynccontextmanager
 
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
 
 import faiss
 
@@ -18,77 +21,424 @@ from numpy.typing import NDArray
 
 from llama_stack.apis.inference import InterleavedContent
 from llama_stack.apis.vector_dbs import VectorDB
-from llama_stack.apis.vector_io import Chunk, QueryChunksResponse, VectorIO
+from llama_stack.apis.vector_io import (
+    Chunk,
+    QueryChunksBatchResponse,
+    QueryChunksResponse,
+    VectorIO,
+)
 from llama_stack.providers.datatypes import Api, VectorDBsProtocolPrivate
-from llama_stack.providers.utils.kvstore import kvstore_impl
+from llama_stack.providers.utils.inference.prompt_adapter import (
+    interleaved_content_as_str,
+)
+from llama_stack.providers.utils.kvstore import KVStore, kvstore_impl
+from llama_stack.providers.utils.memory.embedding_cache import EmbeddingCache
+from llama_stack.providers.utils.memory.keyword_index import BM25Index
 from llama_stack.providers.utils.memory.vector_store import (
     EmbeddingIndex,
+    l2_distance_to_score,
     VectorDBWithIndex,
 )
 
-from .config import FaissImplConfig
+from .config import FaissImplConfig, FaissIndexConfig, FaissIndexType, FaissMetric
+from .sharding import ShardedIndex
 
 logger = logging.getLogger(__name__)
 
 VERSION = "v3"
 VECTOR_DBS_PREFIX = f"vector_dbs:{VERSION}::"
-FAISS_INDEX_PREFIX = f"faiss_index:{VERSION}::"
+# v3 stored the whole index and every chunk as one JSON value, rewritten on every insert
+LEGACY_FAISS_INDEX_PREFIX = f"faiss_index:{VERSION}::"
+
+INDEX_VERSION = "v4"
+# binary snapshot of the faiss index; for sharded indexes {"num_shards": N}, with
+# the snapshot of shard j under "<key>:<j>"
+FAISS_INDEX_PREFIX = f"faiss_index:{INDEX_VERSION}::"
+# float32 embeddings added since the snapshot, one entry per add_chunks call
+FAISS_VECTORS_PREFIX = f"faiss_vectors:{INDEX_VERSION}::"
+# chunks, one entry per vector id
+FAISS_CHUNKS_PREFIX = f"faiss_chunks:{INDEX_VERSION}::"
+# BM25 index of the chunks, saved with the snapshot; later chunks are added on load
+FAISS_KEYWORDS_PREFIX = f"faiss_keywords:{INDEX_VERSION}::"
+
+# the vector log is folded into a new snapshot once it holds at least this many
+# vectors and at least as many as the snapshot, which keeps snapshot writes
+# amortized O(1) per vector
+SNAPSHOT_MIN_VECTORS = 1024
+
+IVF_INDEX_TYPES = [FaissIndexType.ivf_flat, FaissIndexType.ivf_pq]
+
+
+def _index_key(bank_id: str) -> str:
+    return f"{FAISS_INDEX_PREFIX}{bank_id}"
+
+
+def _shard_key(bank_id: str, shard: int) -> str:
+    return f"{_index_key(bank_id)}:{shard:04d}"
+
+
+def _vectors_key(bank_id: str, start: int) -> str:
+    return f"{FAISS_VECTORS_PREFIX}{bank_id}:{start:010d}"
+
+
+def _chunk_key(bank_id: str, vector_id: int) -> str:
+    return f"{FAISS_CHUNKS_PREFIX}{bank_id}:{vector_id:010d}"
+
+
+def _keywords_key(bank_id: str) -> str:
+    return f"{FAISS_KEYWORDS_PREFIX}{bank_id}"
+
+
+async def delete_faiss_index(kvstore: KVStore, bank_id: str) -> None:
+    """Deletes the stored index, vector log, chunks and keyword index of `bank_id`."""
+    await kvstore.delete(_index_key(bank_id))
+    await kvstore.delete_range(_shard_key(bank_id, 0), f"{_index_key(bank_id)}:\xff")
+    await kvstore.delete(_keywords_key(bank_id))
+    await kvstore.delete(f"{LEGACY_FAISS_INDEX_PREFIX}{bank_id}")
+    for prefix in [FAISS_VECTORS_PREFIX, FAISS_CHUNKS_PREFIX]:
+        await kvstore.delete_range(f"{prefix}{bank_id}:", f"{prefix}{bank_id}:\xff")
+
+
+class ReadWriteLock:
+    """Lets searches share the faiss index while adds and index swaps get it alone.
+
+    faiss indexes can be searched from several threads at once, but not while
+    vectors are added. Waiting writers hold off new readers so they are not starved.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[None]:
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._writing and not self._waiting_writers
+            )
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[None]:
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(
+                    lambda: not self._writing and not self._readers
+                )
+            finally:
+                self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writing = False
+                self._condition.notify_all()
 
 
 class FaissIndex(EmbeddingIndex):
-    chunk_by_index: Dict[int, str]
+    chunk_by_index: Dict[int, Chunk]
+    index: Union[faiss.Index, ShardedIndex]
 
-    def __init__(self, dimension: int, kvstore=None, bank_id: str = None):
-        self.index = faiss.IndexFlatL2(dimension)
+    def __init__(
+        self,
+        dimension: int,
+        kvstore=None,
+        bank_id: str = None,
+        index_config: Optional[FaissIndexConfig] = None,
+    ):
+        self.index_config = index_config or FaissIndexConfig()
+        self.metric = (
+            faiss.METRIC_L2
+            if self.index_config.metric == FaissMetric.l2
+            else faiss.METRIC_INNER_PRODUCT
+        )
+        index = self._new_index(dimension)
+        if not index.is_trained:
+            # searched exactly until there are enough vectors to train on
+            index = faiss.IndexFlat(dimension, self.metric)
+        self.index = self._shard(index, self.index_config.num_shards)
+        # searches and adds run in threads, so they no longer hold up the event loop
+        self.lock = ReadWriteLock()
         self.chunk_by_index = {}
+        self.keyword_index = BM25Index() if self.index_config.keyword_index else None
         self.kvstore = kvstore
         self.bank_id = bank_id
+        # number of vectors covered by the stored snapshot
+        self.snapshot_ntotal = 0
+        self.training_task: Optional[asyncio.Task] = None
 
     @classmethod
-    async def create(cls, dimension: int, kvstore=None, bank_id: str = None):
-        instance = cls(dimension, kvstore, bank_id)
+    async def create(
+        cls,
+        dimension: int,
+        kvstore=None,
+        bank_id: str = None,
+        index_config: Optional[FaissIndexConfig] = None,
+    ):
+        instance = cls(dimension, kvstore, bank_id, index_config)
         await instance.initialize()
+        instance._maybe_train()
         return instance
 
+    def _new_index(self, dimension: int) -> faiss.Index:
+        index = faiss.index_factory(
+            dimension, self.index_config.factory_string(), self.metric
+        )
+        if self.index_config.type == FaissIndexType.hnsw:
+            index.hnsw.efConstruction = self.index_config.hnsw_ef_construction
+            index.hnsw.efSearch = self.index_config.hnsw_ef_search
+        elif self.index_config.type in IVF_INDEX_TYPES:
+            index.nprobe = self.index_config.ivf_nprobe
+        return index
+
+    @staticmethod
+    def _shard(index: faiss.Index, num_shards: int) -> Union[faiss.Index, ShardedIndex]:
+        # index must be empty
+        if num_shards <= 1:
+            return index
+        return ShardedIndex(
+            [index] + [faiss.clone_index(index) for _ in range(num_shards - 1)]
+        )
+
+    @property
+    def num_shards(self) -> int:
+        return len(self.index.shards) if isinstance(self.index, ShardedIndex) else 1
+
+    def _index_type(self) -> faiss.Index:
+        # every shard is the same kind of index
+        if isinstance(self.index, ShardedIndex):
+            return self.index.shards[0]
+        return self.index
+
+    def _maybe_train(self) -> None:
+        if (
+            self.index_config.type not in IVF_INDEX_TYPES
+            or not isinstance(self._index_type(), faiss.IndexFlat)
+            or self.index.ntotal < self.index_config.train_size
+            or self.training_task is not None
+        ):
+            return
+
+        self.training_task = asyncio.create_task(self._train())
+
+    async def _train(self) -> None:
+        async with self.lock.read():
+            ntotal = self.index.ntotal
+            vectors = await asyncio.to_thread(self.index.reconstruct_n, 0, ntotal)
+        num_shards = self.num_shards
+
+        def train() -> Union[faiss.Index, ShardedIndex]:
+            # a sharded index is trained once, its shards share the centroids
+            index = self._new_index(vectors.shape[1])
+            index.train(vectors)
+            index = self._shard(index, num_shards)
+            index.add(vectors)
+            return index
+
+        try:
+            index = await asyncio.to_thread(train)
+        except Exception:
+            # keep the task around so that every insert does not retry
+            logger.exception(f"Failed to train faiss index {self.bank_id}")
+            return
+
+        async with self.lock.write():
+            # vectors added while training
+            if self.index.ntotal > ntotal:
+                index.add(self.index.reconstruct_n(ntotal, self.index.ntotal - ntotal))
+            self.index = index
+        logger.info(
+            f"Trained {self.index_config.type.value} index {self.bank_id} on {ntotal} vectors"
+        )
+
+        if self.kvstore and self.bank_id:
+            await self._save_snapshot()
+
     async def initialize(self) -> None:
-        if not self.kvstore:
+        if not self.kvstore or not self.bank_id:
+            return
+
+        snapshot, legacy, keywords = await self.kvstore.get_many(
+            [
+                _index_key(self.bank_id),
+                f"{LEGACY_FAISS_INDEX_PREFIX}{self.bank_id}",
+                _keywords_key(self.bank_id),
+            ]
+        )
+        if legacy is not None:
+            if snapshot is None:
+                await self._migrate_legacy(legacy)
+                return
+            # a migration that stopped before removing the v3 entry
+            await self.kvstore.delete(f"{LEGACY_FAISS_INDEX_PREFIX}{self.bank_id}")
+
+        if snapshot is not None:
+            self.index = await self._load_snapshot(snapshot)
+        self.snapshot_ntotal = self.index.ntotal
+
+        for value in await self.kvstore.range(
+            _vectors_key(self.bank_id, 0), f"{FAISS_VECTORS_PREFIX}{self.bank_id}:\xff"
+        ):
+            segment = json.loads(value)
+            # segments already folded into the snapshot may outlive it briefly
+            if segment["start"] < self.index.ntotal:
+                continue
+            self.index.add(
+                np.frombuffer(
+                    base64.b64decode(segment["vectors"]), dtype=np.float32
+                ).reshape(-1, self.index.d)
+            )
+
+        # chunks are keyed by their vector id; ids of chunks that expired or were
+        # never written are missing
+        keys = await self.kvstore.keys_in_range(
+            _chunk_key(self.bank_id, 0), f"{FAISS_CHUNKS_PREFIX}{self.bank_id}:\xff"
+        )
+        self.chunk_by_index = {
+            int(key.rsplit(":", 1)[1]): Chunk.model_validate_json(chunk)
+            for key, chunk in zip(keys, await self.kvstore.get_many(keys))
+            if chunk is not None
+        }
+
+        if self.keyword_index is not None and keywords is not None:
+            keyword_index = BM25Index.from_dict(json.loads(keywords))
+            # a snapshot taken while chunks were being written may cover chunks
+            # whose write never completed
+            if keyword_index.num_docs <= self.index.ntotal:
+                self.keyword_index = keyword_index
+        # chunks stored after the snapshot, or before there was a keyword index
+        self._index_keywords()
+
+    def _index_keywords(self) -> None:
+        if self.keyword_index is None:
             return
+        # keyword doc ids are vector ids, so a missing chunk is an empty document
+        for i in range(self.keyword_index.num_docs, self.index.ntotal):
+            chunk = self.chunk_by_index.get(i)
+            self.keyword_index.add(
+                interleaved_content_as_str(chunk.content) if chunk else ""
+            )
 
-        index_key = f"{FAISS_INDEX_PREFIX}{self.bank_id}"
-        stored_data = await self.kvstore.get(index_key)
+    async def _migrate_legacy(self, stored_data: str) -> None:
+        data = json.loads(stored_data)
+        # v3 dumped the serialized index with np.savetxt, which writes floats
+        buffer = io.BytesIO(base64.b64decode(data["faiss_index"]))
+        self.index = faiss.deserialize_index(
+            np.loadtxt(buffer, dtype=np.float64).astype(np.uint8)
+        )
+        self.chunk_by_index = {
+            int(k): Chunk.model_validate_json(v)
+            for k, v in data["chunk_by_index"].items()
+        }
+        self._index_keywords()
 
-        if stored_data:
-            data = json.loads(stored_data)
-            self.chunk_by_index = {
-                int(k): Chunk.model_validate_json(v)
-                for k, v in data["chunk_by_index"].items()
+        await self.kvstore.set_many(
+            {
+                _chunk_key(self.bank_id, i): chunk.model_dump_json()
+                for i, chunk in self.chunk_by_index.items()
             }
+        )
+        await self._save_snapshot()
+        await self.kvstore.delete(f"{LEGACY_FAISS_INDEX_PREFIX}{self.bank_id}")
+        logger.info(
+            f"Migrated faiss index {self.bank_id} with {self.index.ntotal} vectors to {INDEX_VERSION}"
+        )
+
+    async def _load_snapshot(self, snapshot: str) -> Union[faiss.Index, ShardedIndex]:
+        def deserialize(data: str) -> faiss.Index:
+            return faiss.deserialize_index(
+                np.frombuffer(base64.b64decode(data), dtype=np.uint8)
+            )
+
+        if not snapshot.startswith("{"):
+            index = deserialize(snapshot)
+        else:
+            num_shards = json.loads(snapshot)["num_shards"]
+            shards = await self.kvstore.get_many(
+                [_shard_key(self.bank_id, j) for j in range(num_shards)]
+            )
+            index = ShardedIndex([deserialize(shard) for shard in shards])
 
-            buffer = io.BytesIO(base64.b64decode(data["faiss_index"]))
-            self.index = faiss.deserialize_index(np.loadtxt(buffer, dtype=np.uint8))
+        if self.num_shards != (
+            len(index.shards) if isinstance(index, ShardedIndex) else 1
+        ):
+            logger.info(
+                f"Faiss index {self.bank_id} keeps the number of shards it was created with"
+            )
+        return index
+
+    def _serialize(self) -> Dict[str, str]:
+        def serialize(index: faiss.Index) -> str:
+            return base64.b64encode(faiss.serialize_index(index).tobytes()).decode(
+                "utf-8"
+            )
 
-    async def _save_index(self):
+        if not isinstance(self.index, ShardedIndex):
+            return {_index_key(self.bank_id): serialize(self.index)}
+        items = {
+            _shard_key(self.bank_id, j): serialize(shard)
+            for j, shard in enumerate(self.index.shards)
+        }
+        items[_index_key(self.bank_id)] = json.dumps({"num_shards": self.num_shards})
+        return items
+
+    async def _save_snapshot(self) -> None:
+        async with self.lock.read():
+            # vectors may be added once the lock is released
+            ntotal = self.index.ntotal
+            items = await asyncio.to_thread(self._serialize)
+        if self.keyword_index is not None:
+            items[_keywords_key(self.bank_id)] = json.dumps(
+                self.keyword_index.to_dict()
+            )
+        await self.kvstore.set_many(items)
+        self.snapshot_ntotal = max(self.snapshot_ntotal, ntotal)
+        # sorts after the last folded segment and before the first one that was not,
+        # whether the backend's range end is inclusive or exclusive
+        await self.kvstore.delete_range(
+            _vectors_key(self.bank_id, 0),
+            f"{_vectors_key(self.bank_id, ntotal - 1)}\xff",
+        )
+
+    async def _save_chunks(
+        self, start: int, chunks: List[Chunk], embeddings: NDArray
+    ) -> None:
         if not self.kvstore or not self.bank_id:
             return
 
-        np_index = faiss.serialize_index(self.index)
-        buffer = io.BytesIO()
-        np.savetxt(buffer, np_index)
-        data = {
-            "chunk_by_index": {
-                k: v.model_dump_json() for k, v in self.chunk_by_index.items()
-            },
-            "faiss_index": base64.b64encode(buffer.getvalue()).decode("utf-8"),
+        items = {
+            _chunk_key(self.bank_id, start + i): chunk.model_dump_json()
+            for i, chunk in enumerate(chunks)
         }
+        items[_vectors_key(self.bank_id, start)] = json.dumps(
+            {
+                "start": start,
+                "vectors": base64.b64encode(embeddings.tobytes()).decode("utf-8"),
+            }
+        )
+        await self.kvstore.set_many(items)
 
-        index_key = f"{FAISS_INDEX_PREFIX}{self.bank_id}"
-        await self.kvstore.set(key=index_key, value=json.dumps(data))
+        pending = self.index.ntotal - self.snapshot_ntotal
+        if pending >= max(self.snapshot_ntotal, SNAPSHOT_MIN_VECTORS):
+            await self._save_snapshot()
 
     async def delete(self):
+        if self.training_task is not None:
+            self.training_task.cancel()
         if not self.kvstore or not self.bank_id:
             return
 
-        await self.kvstore.delete(f"{FAISS_INDEX_PREFIX}{self.bank_id}")
+        await delete_faiss_index(self.kvstore, self.bank_id)
 
     async def add_chunks(self, chunks: List[Chunk], embeddings: NDArray):
         # Add dimension check
@@ -100,29 +450,108 @@ class FaissIndex(EmbeddingIndex):
                 f"Embedding dimension mismatch. Expected {self.index.d}, got {embedding_dim}"
             )
 
-        indexlen = len(self.chunk_by_index)
-        for i, chunk in enumerate(chunks):
-            self.chunk_by_index[indexlen + i] = chunk
-
-        self.index.add(np.array(embeddings).astype(np.float32))
-
-        # Save updated index
-        await self._save_index()
+        embeddings = np.array(embeddings, dtype=np.float32).reshape(-1, self.index.d)
+        if self.index_config.metric == FaissMetric.cosine:
+            faiss.normalize_L2(embeddings)
+
+        # concurrent adds take their vector ids in the order they get the lock
+        async with self.lock.write():
+            # vector ids are positions in the index
+            indexlen = self.index.ntotal
+            for i, chunk in enumerate(chunks):
+                self.chunk_by_index[indexlen + i] = chunk
+            await asyncio.to_thread(self.index.add, embeddings)
+            self._index_keywords()
+
+        # Append the new vectors and chunks to the stored log
+        await self._save_chunks(indexlen, chunks, embeddings)
+        self._maybe_train()
+
+    def _search_parameters(
+        self, search_params: Dict[str, Any]
+    ) -> Optional[faiss.SearchParameters]:
+        index = self._index_type()
+        if "ef_search" in search_params and isinstance(index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=int(search_params["ef_search"]))
+        if "nprobe" in search_params and isinstance(index, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(nprobe=int(search_params["nprobe"]))
+        return None
 
     async def query(
-        self, embedding: NDArray, k: int, score_threshold: float
+        self,
+        embedding: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
     ) -> QueryChunksResponse:
-        distances, indices = self.index.search(
-            embedding.reshape(1, -1).astype(np.float32), k
+        responses = await self.query_batch(
+            embedding.reshape(1, -1), k, score_threshold, search_params
         )
+        return responses[0]
 
+    async def query_batch(
+        self,
+        embeddings: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
+    ) -> List[QueryChunksResponse]:
+        queries = np.array(embeddings, dtype=np.float32).reshape(-1, self.index.d)
+        if self.index_config.metric == FaissMetric.cosine:
+            faiss.normalize_L2(queries)
+        async with self.lock.read():
+            distances, indices = await asyncio.to_thread(
+                self.index.search,
+                queries,
+                k,
+                params=self._search_parameters(search_params or {}),
+            )
+        return [
+            self._to_response(row_distances, row_indices, score_threshold)
+            for row_distances, row_indices in zip(distances, indices)
+        ]
+
+    async def query_keyword(
+        self, query_string: str, k: int, score_threshold: float
+    ) -> QueryChunksResponse:
+        if self.keyword_index is None:
+            raise ValueError(
+                f"Keyword search is disabled for faiss index {self.bank_id}"
+            )
+
+        chunks = []
+        scores = []
+        for i, score in self.keyword_index.search(query_string, k):
+            if score < score_threshold:
+                break
+            if i not in self.chunk_by_index:
+                continue
+            chunks.append(self.chunk_by_index[i])
+            scores.append(score)
+
+        return QueryChunksResponse(chunks=chunks, scores=scores)
+
+    def _to_response(
+        self, distances: NDArray, indices: NDArray, score_threshold: float
+    ) -> QueryChunksResponse:
         chunks = []
         scores = []
-        for d, i in zip(distances[0], indices[0]):
-            if i < 0:
+        for d, i in zip(distances, indices):
+            if i < 0 or int(i) not in self.chunk_by_index:
                 continue
+            if self.metric == faiss.METRIC_L2:
+                # faiss returns squared L2 distances
+                score = l2_distance_to_score(math.sqrt(max(float(d), 0.0)))
+            else:
+                score = float(d)
+            # results are sorted by score, so the rest are below the threshold too.
+            # This is the top k of the results within the threshold, as a
+            # range_search would find; that would return every vector in the radius
+            # though, and neither HNSW nor sharded indexes support it.
+            if score < score_threshold:
+                break
             chunks.append(self.chunk_by_index[int(i)])
-            scores.append(1.0 / float(d))
+            scores.append(score)
 
         return QueryChunksResponse(chunks=chunks, scores=scores)
 
@@ -133,28 +562,42 @@ class FaissVectorIOImpl(VectorIO, VectorDBsProtocolPrivate):
         self.inference_api = inference_api
         self.cache = {}
         self.kvstore = None
+        self.embedding_cache = None
 
     async def initialize(self) -> None:
         self.kvstore = await kvstore_impl(self.config.kvstore)
+        if self.config.embedding_cache is not None:
+            self.embedding_cache = await EmbeddingCache.create(
+                self.config.embedding_cache
+            )
         # Load existing banks from kvstore
         start_key = VECTOR_DBS_PREFIX
         end_key = f"{VECTOR_DBS_PREFIX}\xff"
-        stored_vector_dbs = await self.kvstore.range(start_key, end_key)
+        stored_vector_dbs = [
+            VectorDB.model_validate_json(vector_db_data)
+            for vector_db_data in await self.kvstore.range(start_key, end_key)
+        ]
 
-        for vector_db_data in stored_vector_dbs:
-            vector_db = VectorDB.model_validate_json(vector_db_data)
+        for vector_db in stored_vector_dbs:
             index = VectorDBWithIndex(
                 vector_db,
                 await FaissIndex.create(
-                    vector_db.embedding_dimension, self.kvstore, vector_db.identifier
+                    vector_db.embedding_dimension,
+                    self.kvstore,
+                    vector_db.identifier,
+                    self.config.index_config(vector_db.metadata),
                 ),
                 self.inference_api,
+                self.embedding_cache,
             )
             self.cache[vector_db.identifier] = index
 
     async def shutdown(self) -> None:
-        # Cleanup if needed
-        pass
+        for index in self.cache.values():
+            if index.index.training_task is not None:
+                index.index.training_task.cancel()
+        if self.embedding_cache is not None:
+            await self.embedding_cache.shutdown()
 
     async def register_vector_db(
         self,
@@ -170,9 +613,13 @@ class FaissVectorIOImpl(VectorIO, VectorDBsProtocolPrivate):
         self.cache[vector_db.identifier] = VectorDBWithIndex(
             vector_db=vector_db,
             index=await FaissIndex.create(
-                vector_db.embedding_dimension, self.kvstore, vector_db.identifier
+                vector_db.embedding_dimension,
+                self.kvstore,
+                vector_db.identifier,
+                self.config.index_config(vector_db.metadata),
             ),
             inference_api=self.inference_api,
+            embedding_cache=self.embedding_cache,
         )
 
     async def list_vector_dbs(self) -> List[VectorDB]:
@@ -208,3 +655,15 @@ class FaissVectorIOImpl(VectorIO, VectorDBsProtocolPrivate):
             raise ValueError(f"Vector DB {vector_db_id} not found")
 
         return await index.query_chunks(query, params)
+
+    async def query_chunks_batch(
+        self,
+        vector_db_id: str,
+        queries: List[InterleavedContent],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> QueryChunksBatchResponse:
+        index = self.cache.get(vector_db_id)
+        if index is None:
+            raise ValueError(f"Vector DB {vector_db_id} not found")
+
+        return await index.query_chunks_batch(queries, params)
@@ -0,0 +1,94 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+from numpy.typing import NDArray
+
+
+@lru_cache(maxsize=None)
+def shard_executor() -> ThreadPoolExecutor:
+    # shared by all sharded indexes; faiss releases the GIL while it works
+    return ThreadPoolExecutor(
+        max_workers=os.cpu_count() or 4, thread_name_prefix="faiss-shard"
+    )
+
+
+class ShardedIndex:
+    """Spreads the vectors of one bank over several faiss indexes.
+
+    Vector i lives in shard i % N under local id i // N, so ids stay dense and in
+    insertion order without an id map. Searches run on every shard in parallel
+    and merge the per shard top k. Implements the subset of the faiss.Index
+    interface FaissIndex uses.
+    """
+
+    def __init__(self, shards: List[faiss.Index]):
+        self.shards = shards
+        self.d = shards[0].d
+        self.metric_type = shards[0].metric_type
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards)
+
+    @property
+    def is_trained(self) -> bool:
+        return all(shard.is_trained for shard in self.shards)
+
+    def _map(self, fn, *args) -> list:
+        return list(shard_executor().map(fn, self.shards, *args))
+
+    def add(self, vectors: NDArray) -> None:
+        num_shards = len(self.shards)
+        start = self.ntotal
+        # rows of the shard each next vector id belongs to
+        parts = [
+            vectors[(j - start) % num_shards :: num_shards] for j in range(num_shards)
+        ]
+        self._map(lambda shard, part: shard.add(part), parts)
+
+    def search(
+        self,
+        queries: NDArray,
+        k: int,
+        params: Optional[faiss.SearchParameters] = None,
+    ) -> Tuple[NDArray, NDArray]:
+        num_shards = len(self.shards)
+        results = self._map(lambda shard: shard.search(queries, k, params=params))
+
+        distances = np.concatenate([d for d, _ in results], axis=1)
+        indices = np.concatenate(
+            [
+                np.where(i >= 0, i * num_shards + j, -1)
+                for j, (_, i) in enumerate(results)
+            ],
+            axis=1,
+        )
+        # missing results have the worst distance of the metric, so they sort last
+        keys = distances if self.metric_type == faiss.METRIC_L2 else -distances
+        order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+        return (
+            np.take_along_axis(distances, order, axis=1),
+            np.take_along_axis(indices, order, axis=1),
+        )
+
+    def reconstruct_n(self, start: int, n: int) -> NDArray:
+        num_shards = len(self.shards)
+        vectors = np.empty((n, self.d), dtype=np.float32)
+        for j, shard in enumerate(self.shards):
+            first = start + (j - start) % num_shards
+            count = len(range(first, start + n, num_shards))
+            if count:
+                vectors[first - start :: num_shards] = shard.reconstruct_n(
+                    first // num_shards, count
+                )
+        return vectors
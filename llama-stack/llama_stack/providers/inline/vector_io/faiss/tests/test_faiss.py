@@ -0,0 +1,372 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import asyncio
+import base64
+import io
+import json
+
+import faiss
+import numpy as np
+import pytest
+
+from llama_stack.apis.inference import EmbeddingsResponse
+from llama_stack.apis.vector_dbs import VectorDB
+from llama_stack.apis.vector_io import Chunk
+from llama_stack.providers.inline.vector_io.faiss import faiss as faiss_impl
+from llama_stack.providers.inline.vector_io.faiss.config import (
+    FaissImplConfig,
+    FaissIndexConfig,
+    FaissIndexType,
+    FaissMetric,
+)
+from llama_stack.providers.inline.vector_io.faiss.faiss import (
+    FAISS_INDEX_PREFIX,
+    FAISS_VECTORS_PREFIX,
+    FaissIndex,
+    LEGACY_FAISS_INDEX_PREFIX,
+)
+from llama_stack.providers.inline.vector_io.faiss.sharding import ShardedIndex
+from llama_stack.providers.utils.kvstore import InmemoryKVStoreImpl
+from llama_stack.providers.utils.kvstore.config import SqliteKVStoreConfig
+from llama_stack.providers.utils.memory.vector_store import VectorDBWithIndex
+
+DIMENSION = 8
+
+
+def make_chunks(start: int, count: int):
+    chunks = [
+        Chunk(content=f"chunk {i}", metadata={"document_id": "doc"})
+        for i in range(start, start + count)
+    ]
+    embeddings = np.random.default_rng(start).random((count, DIMENSION))
+    return chunks, embeddings.astype(np.float32)
+
+
+def vector_segments(store: InmemoryKVStoreImpl):
+    return [key for key in store._store if key.startswith(FAISS_VECTORS_PREFIX)]
+
+
+@pytest.mark.asyncio
+async def test_writes_are_incremental_and_reload(monkeypatch):
+    monkeypatch.setattr(faiss_impl, "SNAPSHOT_MIN_VECTORS", 8)
+    store = InmemoryKVStoreImpl()
+    index = await FaissIndex.create(DIMENSION, store, "bank")
+
+    all_embeddings = []
+    for start in range(0, 20, 4):
+        chunks, embeddings = make_chunks(start, 4)
+        await index.add_chunks(chunks, embeddings)
+        all_embeddings.append(embeddings)
+        if start == 4:
+            # the log is folded into a snapshot once it reaches SNAPSHOT_MIN_VECTORS
+            assert index.snapshot_ntotal == 8
+            assert vector_segments(store) == []
+    # 12 vectors in the log do not outgrow the 8 in the snapshot until the 16th
+    assert index.snapshot_ntotal == 16
+    assert len(vector_segments(store)) == 1
+
+    reloaded = await FaissIndex.create(DIMENSION, store, "bank")
+    assert reloaded.index.ntotal == 20
+    assert reloaded.chunk_by_index == index.chunk_by_index
+    query = all_embeddings[4][1] + 0.01
+    expected = await index.query(query, 3, 0.0)
+    assert await reloaded.query(query, 3, 0.0) == expected
+    assert expected.chunks[0].content == "chunk 17"
+
+    await reloaded.delete()
+    assert list(store._store) == []
+
+
+@pytest.mark.asyncio
+async def test_reload_maps_chunks_by_their_key():
+    store = InmemoryKVStoreImpl()
+    index = await FaissIndex.create(DIMENSION, store, "bank")
+    chunks, embeddings = make_chunks(0, 12)
+    await index.add_chunks(chunks, embeddings)
+    # e.g. a chunk inserted with a ttl that has expired
+    await store.delete(faiss_impl._chunk_key("bank", 3))
+
+    reloaded = await FaissIndex.create(DIMENSION, store, "bank")
+    assert sorted(reloaded.chunk_by_index) == [i for i in range(12) if i != 3]
+    for i, chunk in reloaded.chunk_by_index.items():
+        assert chunk == chunks[i]
+    response = await reloaded.query(embeddings[3], 2, 0.0)
+    assert "chunk 3" not in [c.content for c in response.chunks]
+    response = await reloaded.query(embeddings[11], 1, 0.0)
+    assert response.chunks[0].content == "chunk 11"
+    assert (await reloaded.query_keyword("3", 1, 0.0)).chunks == []
+
+    # new chunks take the ids after the last vector, not after the last chunk
+    more_chunks, more_embeddings = make_chunks(12, 2)
+    await reloaded.add_chunks(more_chunks, more_embeddings)
+    assert reloaded.chunk_by_index[13] == more_chunks[1]
+    response = await reloaded.query(more_embeddings[1], 1, 0.0)
+    assert response.chunks[0].content == "chunk 13"
+    response = await reloaded.query_keyword("chunk 13", 1, 0.0)
+    assert response.chunks[0].content == "chunk 13"
+
+
+@pytest.mark.asyncio
+async def test_migrates_v3_index():
+    store = InmemoryKVStoreImpl()
+    chunks, embeddings = make_chunks(0, 10)
+    legacy_index = faiss.IndexFlatL2(DIMENSION)
+    legacy_index.add(embeddings)
+    buffer = io.BytesIO()
+    np.savetxt(buffer, faiss.serialize_index(legacy_index))
+    await store.set(
+        f"{LEGACY_FAISS_INDEX_PREFIX}bank",
+        json.dumps(
+            {
+                "chunk_by_index": {
+                    i: chunk.model_dump_json() for i, chunk in enumerate(chunks)
+                },
+                "faiss_index": base64.b64encode(buffer.getvalue()).decode("utf-8"),
+            }
+        ),
+    )
+
+    index = await FaissIndex.create(DIMENSION, store, "bank")
+    assert index.index.ntotal == 10
+    assert f"{LEGACY_FAISS_INDEX_PREFIX}bank" not in store._store
+    assert f"{FAISS_INDEX_PREFIX}bank" in store._store
+
+    more_chunks, more_embeddings = make_chunks(10, 2)
+    await index.add_chunks(more_chunks, more_embeddings)
+    reloaded = await FaissIndex.create(DIMENSION, store, "bank")
+    assert [chunk.content for chunk in reloaded.chunk_by_index.values()] == [
+        f"chunk {i}" for i in range(12)
+    ]
+    response = await reloaded.query(embeddings[3] + 0.01, 1, 0.0)
+    assert response.chunks[0].content == "chunk 3"
+
+
+@pytest.mark.asyncio
+async def test_hnsw_cosine_index():
+    store = InmemoryKVStoreImpl()
+    index_config = FaissIndexConfig(type="hnsw", metric="cosine", hnsw_m=8)
+    index = await FaissIndex.create(DIMENSION, store, "bank", index_config)
+    assert isinstance(index.index, faiss.IndexHNSWFlat)
+
+    chunks, embeddings = make_chunks(0, 50)
+    await index.add_chunks(chunks, embeddings)
+    # cosine similarity ignores the scale of the query
+    response = await index.query(embeddings[7] * 3, 2, 0.0, {"ef_search": 16})
+    assert response.chunks[0].content == "chunk 7"
+    assert response.scores[0] == pytest.approx(1.0)
+
+    reloaded = await FaissIndex.create(DIMENSION, store, "bank", index_config)
+    assert isinstance(reloaded.index, faiss.IndexHNSWFlat)
+    reloaded_response = await reloaded.query(embeddings[7], 2, 0.0)
+    assert reloaded_response.chunks == response.chunks
+    assert reloaded_response.scores == pytest.approx(response.scores)
+
+
+@pytest.mark.asyncio
+async def test_ivf_index_is_trained_in_background():
+    store = InmemoryKVStoreImpl()
+    index_config = FaissIndexConfig(type="ivf_flat", ivf_nlist=4, ivf_train_size=64)
+    index = await FaissIndex.create(DIMENSION, store, "bank", index_config)
+
+    chunks, embeddings = make_chunks(0, 40)
+    await index.add_chunks(chunks, embeddings)
+    assert isinstance(index.index, faiss.IndexFlat)
+    assert index.training_task is None
+
+    more_chunks, more_embeddings = make_chunks(40, 40)
+    await index.add_chunks(more_chunks, more_embeddings)
+    await index.training_task
+    assert isinstance(index.index, faiss.IndexIVFFlat)
+    assert index.index.ntotal == 80
+
+    # probing every list is exact
+    response = await index.query(embeddings[3] + 0.01, 1, 0.0, {"nprobe": 4})
+    assert response.chunks[0].content == "chunk 3"
+
+    reloaded = await FaissIndex.create(DIMENSION, store, "bank", index_config)
+    assert isinstance(reloaded.index, faiss.IndexIVFFlat)
+    assert reloaded.training_task is None
+
+
+def test_sharded_index_matches_unsharded():
+    rng = np.random.default_rng(0)
+    vectors = rng.random((103, DIMENSION)).astype(np.float32)
+    queries = rng.random((5, DIMENSION)).astype(np.float32)
+    for metric in (faiss.METRIC_L2, faiss.METRIC_INNER_PRODUCT):
+        flat = faiss.IndexFlat(DIMENSION, metric)
+        sharded = ShardedIndex([faiss.IndexFlat(DIMENSION, metric) for _ in range(4)])
+        # uneven batches start at any shard
+        for start, end in [(0, 7), (7, 50), (50, 51), (51, 103)]:
+            flat.add(vectors[start:end])
+            sharded.add(vectors[start:end])
+        assert sharded.ntotal == 103
+        np.testing.assert_array_equal(sharded.reconstruct_n(5, 90), vectors[5:95])
+
+        expected_distances, expected_indices = flat.search(queries, 10)
+        distances, indices = sharded.search(queries, 10)
+        np.testing.assert_array_equal(indices, expected_indices)
+        np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+
+        # shards without enough vectors pad with -1, which sorts last
+        _, indices = sharded.search(queries, 200)
+        assert (indices[:, :103] >= 0).all() and (indices[:, 103:] == -1).all()
+
+
+@pytest.mark.asyncio
+async def test_sharded_faiss_index():
+    store = InmemoryKVStoreImpl()
+    index_config = FaissIndexConfig(
+        type="ivf_flat", ivf_nlist=4, ivf_train_size=64, num_shards=3
+    )
+    index = await FaissIndex.create(DIMENSION, store, "bank", index_config)
+    assert index.num_shards == 3
+
+    chunks, embeddings = make_chunks(0, 80)
+    await asyncio.gather(
+        index.add_chunks(chunks[:40], embeddings[:40]),
+        index.add_chunks(chunks[40:], embeddings[40:]),
+        index.query(embeddings[0], 1, 0.0),
+    )
+    await index.training_task
+    assert isinstance(index.index, ShardedIndex)
+    assert all(isinstance(shard, faiss.IndexIVFFlat) for shard in index.index.shards)
+    assert index.index.ntotal == 80
+
+    response = await index.query(embeddings[63] + 0.01, 1, 0.0, {"nprobe": 4})
+    assert response.chunks[0].content == "chunk 63"
+
+    await index._save_snapshot()
+    # banks keep the number of shards they were created with
+    reloaded = await FaissIndex.create(
+        DIMENSION, store, "bank", index_config.model_copy(update={"num_shards": 1})
+    )
+    assert reloaded.num_shards == 3
+    assert reloaded.index.ntotal == 80
+    assert await reloaded.query(embeddings[63], 3, 0.0, {"nprobe": 4}) == (
+        await index.query(embeddings[63], 3, 0.0, {"nprobe": 4})
+    )
+
+    await reloaded.delete()
+    assert list(store._store) == []
+
+
+def test_index_config_from_vector_db_metadata():
+    config = FaissImplConfig(
+        kvstore=SqliteKVStoreConfig(db_path=":memory:"),
+        index=FaissIndexConfig(metric="inner_product"),
+    )
+    assert config.index_config({}) == config.index
+    index_config = config.index_config({"faiss_index": {"type": "ivf_pq", "pq_m": 4}})
+    assert index_config.type == FaissIndexType.ivf_pq
+    assert index_config.metric == FaissMetric.inner_product
+    assert index_config.factory_string() == "IVF1024,PQ4x8"
+
+
+@pytest.mark.asyncio
+async def test_scores_are_normalized_and_thresholded():
+    index = await FaissIndex.create(DIMENSION)
+    chunks, embeddings = make_chunks(0, 20)
+    await index.add_chunks(chunks, embeddings)
+
+    response = await index.query(embeddings[5], 20, 0.0)
+    assert response.chunks[0].content == "chunk 5"
+    assert response.scores[0] == pytest.approx(1.0)
+    assert response.scores == sorted(response.scores, reverse=True)
+    assert all(0.0 < score <= 1.0 for score in response.scores)
+
+    threshold = response.scores[3]
+    response = await index.query(embeddings[5], 20, threshold)
+    assert len(response.chunks) == 4
+    assert all(score >= threshold for score in response.scores)
+
+
+class FakeInference:
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    async def embeddings(self, model_id, contents):
+        self.calls += 1
+        return EmbeddingsResponse(
+            embeddings=[self.vectors[int(content)].tolist() for content in contents]
+        )
+
+
+@pytest.mark.asyncio
+async def test_query_chunks_batch():
+    chunks, embeddings = make_chunks(0, 20)
+    index = await FaissIndex.create(DIMENSION)
+    await index.add_chunks(chunks, embeddings)
+    inference = FakeInference(embeddings + 0.01)
+    vector_db = VectorDB(
+        identifier="bank",
+        provider_id="faiss",
+        provider_resource_id="bank",
+        embedding_model="model",
+        embedding_dimension=DIMENSION,
+    )
+    vector_db_with_index = VectorDBWithIndex(vector_db, index, inference)
+
+    params = {"max_chunks": 2}
+    response = await vector_db_with_index.query_chunks_batch(["3", "11", "7"], params)
+    assert inference.calls == 1
+    assert [r.chunks[0].content for r in response.data] == [
+        "chunk 3",
+        "chunk 11",
+        "chunk 7",
+    ]
+    single = await vector_db_with_index.query_chunks("11", params)
+    assert single.chunks == response.data[1].chunks
+    assert single.scores == pytest.approx(response.data[1].scores)
+
+
+@pytest.mark.asyncio
+async def test_keyword_and_hybrid_queries(monkeypatch):
+    monkeypatch.setattr(faiss_impl, "SNAPSHOT_MIN_VECTORS", 8)
+    store = InmemoryKVStoreImpl()
+    index = await FaissIndex.create(DIMENSION, store, "bank")
+    for start in range(0, 20, 4):
+        chunks, embeddings = make_chunks(start, 4)
+        await index.add_chunks(chunks, embeddings)
+    # 16 chunks in the keyword snapshot, the last 4 are added back from the log
+    assert faiss_impl._keywords_key("bank") in store._store
+
+    reloaded = await FaissIndex.create(DIMENSION, store, "bank")
+    assert reloaded.keyword_index.num_docs == 20
+    for faiss_index in [index, reloaded]:
+        response = await faiss_index.query_keyword("chunk 17", 3, 0.0)
+        assert response.chunks[0].content == "chunk 17"
+        assert response.scores == sorted(response.scores, reverse=True)
+
+    inference = FakeInference({0: make_chunks(0, 20)[1][2]})
+    vector_db = VectorDB(
+        identifier="bank",
+        provider_id="faiss",
+        provider_resource_id="bank",
+        embedding_model="model",
+        embedding_dimension=DIMENSION,
+    )
+    vector_db_with_index = VectorDBWithIndex(vector_db, reloaded, inference)
+    # the embedding of "0" is chunk 2's, while its text only matches chunk 0
+    response = await vector_db_with_index.query_chunks(
+        "0", {"max_chunks": 2, "mode": "hybrid"}
+    )
+    assert {c.content for c in response.chunks} == {"chunk 0", "chunk 2"}
+    assert response.scores[0] == pytest.approx(1 / 61)
+
+    with pytest.raises(ValueError, match="Unknown search mode"):
+        await vector_db_with_index.query_chunks("0", {"mode": "fuzzy"})
+
+
+@pytest.mark.asyncio
+async def test_keyword_index_can_be_disabled():
+    index = await FaissIndex.create(
+        DIMENSION, index_config=FaissIndexConfig(keyword_index=False)
+    )
+    await index.add_chunks(*make_chunks(0, 4))
+    with pytest.raises(ValueError, match="Keyword search is disabled"):
+        await index.query_keyword("chunk", 3, 0.0)
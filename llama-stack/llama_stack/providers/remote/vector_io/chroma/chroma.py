@@ -6,6 +6,7 @@
 import asyncio
 import json
 import logging
+import math
 from typing import Any, Dict, List, Optional, Union
 from urllib.parse import urlparse
 
@@ -14,11 +15,17 @@ from numpy.typing import NDArray
 
 from llama_stack.apis.inference import InterleavedContent
 from llama_stack.apis.vector_dbs import VectorDB
-from llama_stack.apis.vector_io import Chunk, QueryChunksResponse, VectorIO
+from llama_stack.apis.vector_io import (
+    Chunk,
+    QueryChunksBatchResponse,
+    QueryChunksResponse,
+    VectorIO,
+)
 from llama_stack.providers.datatypes import Api, VectorDBsProtocolPrivate
 from llama_stack.providers.inline.vector_io.chroma import ChromaInlineImplConfig
 from llama_stack.providers.utils.memory.vector_store import (
     EmbeddingIndex,
+    l2_distance_to_score,
     VectorDBWithIndex,
 )
 from .config import ChromaRemoteImplConfig
@@ -55,21 +62,47 @@ class ChromaIndex(EmbeddingIndex):
         )
 
     async def query(
-        self, embedding: NDArray, k: int, score_threshold: float
+        self,
+        embedding: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
     ) -> QueryChunksResponse:
+        responses = await self.query_batch(
+            embedding.reshape(1, -1), k, score_threshold, search_params
+        )
+        return responses[0]
+
+    async def query_batch(
+        self,
+        embeddings: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
+    ) -> List[QueryChunksResponse]:
         results = await maybe_await(
             self.collection.query(
-                query_embeddings=[embedding.tolist()],
+                query_embeddings=embeddings.tolist(),
                 n_results=k,
                 include=["documents", "distances"],
             )
         )
-        distances = results["distances"][0]
-        documents = results["documents"][0]
+        return [
+            self._to_response(distances, documents, score_threshold)
+            for distances, documents in zip(results["distances"], results["documents"])
+        ]
 
+    def _to_response(
+        self, distances: List[float], documents: List[str], score_threshold: float
+    ) -> QueryChunksResponse:
         chunks = []
         scores = []
         for dist, doc in zip(distances, documents):
+            # chroma returns squared L2 distances, sorted. Its filters only apply to
+            # metadata, so the threshold is applied here, before parsing any chunks.
+            score = l2_distance_to_score(math.sqrt(max(float(dist), 0.0)))
+            if score < score_threshold:
+                break
             try:
                 doc = json.loads(doc)
                 chunk = Chunk(**doc)
@@ -78,7 +111,7 @@ class ChromaIndex(EmbeddingIndex):
                 continue
 
             chunks.append(chunk)
-            scores.append(1.0 / float(dist))
+            scores.append(score)
 
         return QueryChunksResponse(chunks=chunks, scores=scores)
 
@@ -156,6 +189,16 @@ class ChromaVectorIOAdapter(VectorIO, VectorDBsProtocolPrivate):
 
         return await index.query_chunks(query, params)
 
+    async def query_chunks_batch(
+        self,
+        vector_db_id: str,
+        queries: List[InterleavedContent],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> QueryChunksBatchResponse:
+        index = await self._get_and_cache_vector_db_index(vector_db_id)
+
+        return await index.query_chunks_batch(queries, params)
+
     async def _get_and_cache_vector_db_index(
         self, vector_db_id: str
     ) -> VectorDBWithIndex:
@@ -4,10 +4,41 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
+from enum import Enum
+from typing import Any, Dict, Optional
+
 from llama_models.schema_utils import json_schema_type
 from pydantic import BaseModel, Field
 
 
+class PGVectorIndexType(Enum):
+    # exact sequential scan
+    none = "none"
+    hnsw = "hnsw"
+    ivfflat = "ivfflat"
+
+
+@json_schema_type
+class PGVectorIndexConfig(BaseModel):
+    type: PGVectorIndexType = PGVectorIndexType.hnsw
+
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    # default hnsw.ef_search, can be overridden per query with the `ef_search` param
+    hnsw_ef_search: int = 40
+
+    ivfflat_lists: int = 100
+    # default ivfflat.probes, can be overridden per query with the `nprobe` param
+    ivfflat_probes: int = 10
+    # IVFFlat clusters the rows present when the index is built, so it is only
+    # created once the table has this many rows. Defaults to 39 * lists.
+    ivfflat_min_rows: Optional[int] = None
+
+    @property
+    def min_rows(self) -> int:
+        return self.ivfflat_min_rows or 39 * self.ivfflat_lists
+
+
 @json_schema_type
 class PGVectorConfig(BaseModel):
     host: str = Field(default="localhost")
@@ -15,3 +46,17 @@ class PGVectorConfig(BaseModel):
     db: str = Field(default="postgres")
     user: str = Field(default="postgres")
     password: str = Field(default="mysecretpassword")
+    pool_min_size: int = Field(
+        default=1,
+        description="Minimum number of connections kept open in the pool",
+    )
+    pool_max_size: int = Field(
+        default=10,
+        description="Maximum number of concurrent connections to the database",
+    )
+    # default for vector dbs that do not set `pgvector_index` in their metadata
+    index: PGVectorIndexConfig = Field(default_factory=PGVectorIndexConfig)
+
+    def index_config(self, vector_db_metadata: Dict[str, Any]) -> PGVectorIndexConfig:
+        overrides = vector_db_metadata.get("pgvector_index") or {}
+        return PGVectorIndexConfig(**{**self.index.model_dump(), **overrides})
@@ -7,147 +7,285 @@
 import logging
 from typing import Any, Dict, List, Optional, Tuple
 
-import psycopg2
+import asyncpg
 from numpy.typing import NDArray
-from psycopg2 import sql
-from psycopg2.extras import execute_values, Json
 
 from pydantic import BaseModel, TypeAdapter
 
 from llama_stack.apis.inference import InterleavedContent
 from llama_stack.apis.vector_dbs import VectorDB
-from llama_stack.apis.vector_io import Chunk, QueryChunksResponse, VectorIO
+from llama_stack.apis.vector_io import (
+    Chunk,
+    QueryChunksBatchResponse,
+    QueryChunksResponse,
+    VectorIO,
+)
 from llama_stack.providers.datatypes import Api, VectorDBsProtocolPrivate
 
 from llama_stack.providers.utils.memory.vector_store import (
     EmbeddingIndex,
+    generate_chunk_id,
+    l2_distance_to_score,
+    score_threshold_to_l2_distance,
     VectorDBWithIndex,
 )
 
-from .config import PGVectorConfig
+from .config import PGVectorConfig, PGVectorIndexConfig, PGVectorIndexType
 
 log = logging.getLogger(__name__)
 
+# rows are copied here before being upserted, as COPY cannot resolve conflicts
+STAGING_TABLE = "vector_store_staging"
+
+
+def vector_literal(embedding: NDArray) -> str:
+    # text form of the vector type; asyncpg has no binary codec for it
+    return "[" + ",".join(str(x) for x in embedding.tolist()) + "]"
 
-def check_extension_version(cur):
-    cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
-    result = cur.fetchone()
-    return result[0] if result else None
+
+async def check_extension_version(conn) -> Optional[str]:
+    return await conn.fetchval(
+        "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+    )
 
 
-def upsert_models(cur, keys_models: List[Tuple[str, BaseModel]]):
-    query = sql.SQL(
+async def upsert_models(conn, keys_models: List[Tuple[str, BaseModel]]):
+    await conn.executemany(
         """
         INSERT INTO metadata_store (key, data)
-        VALUES %s
+        VALUES ($1, $2::jsonb)
         ON CONFLICT (key) DO UPDATE
         SET data = EXCLUDED.data
-    """
+        """,
+        [(key, model.model_dump_json()) for key, model in keys_models],
     )
 
-    values = [(key, Json(model.model_dump())) for key, model in keys_models]
-    execute_values(cur, query, values, template="(%s, %s)")
 
-
-def load_models(cur, cls):
-    cur.execute("SELECT key, data FROM metadata_store")
-    rows = cur.fetchall()
-    return [TypeAdapter(cls).validate_python(row["data"]) for row in rows]
+async def load_models(conn, cls):
+    rows = await conn.fetch("SELECT key, data::text AS data FROM metadata_store")
+    return [TypeAdapter(cls).validate_json(row["data"]) for row in rows]
 
 
 class PGVectorIndex(EmbeddingIndex):
-    def __init__(self, vector_db: VectorDB, dimension: int, cursor):
-        self.cursor = cursor
+    def __init__(
+        self,
+        vector_db: VectorDB,
+        dimension: int,
+        pool: asyncpg.Pool,
+        index_config: Optional[PGVectorIndexConfig] = None,
+    ):
+        self.pool = pool
+        self.dimension = dimension
+        self.index_config = index_config or PGVectorIndexConfig()
         self.table_name = f"vector_store_{vector_db.identifier}"
+        self.ann_index_name = (
+            f"{self.table_name}_embedding_{self.index_config.type.value}_idx"
+        )
+        self.has_ann_index = False
+        # only tracked until the IVFFlat index exists
+        self.num_rows = 0
+
+    @classmethod
+    async def create(
+        cls,
+        vector_db: VectorDB,
+        dimension: int,
+        pool: asyncpg.Pool,
+        index_config: Optional[PGVectorIndexConfig] = None,
+    ) -> "PGVectorIndex":
+        instance = cls(vector_db, dimension, pool, index_config)
+        await instance.initialize()
+        return instance
 
-        self.cursor.execute(
+    async def initialize(self) -> None:
+        await self.pool.execute(
             f"""
             CREATE TABLE IF NOT EXISTS {self.table_name} (
                 id TEXT PRIMARY KEY,
                 document JSONB,
-                embedding vector({dimension})
+                embedding vector({self.dimension})
             )
-        """
+            """
+        )
+        if self.index_config.type == PGVectorIndexType.none:
+            return
+
+        self.has_ann_index = bool(
+            await self.pool.fetchval(
+                "SELECT 1 FROM pg_indexes WHERE indexname = $1", self.ann_index_name
+            )
+        )
+        if self.has_ann_index:
+            return
+        if self.index_config.type == PGVectorIndexType.ivfflat:
+            self.num_rows = await self.pool.fetchval(
+                f"SELECT count(*) FROM {self.table_name}"
+            )
+        await self._maybe_create_ann_index()
+
+    async def _maybe_create_ann_index(self) -> None:
+        if self.has_ann_index or self.index_config.type == PGVectorIndexType.none:
+            return
+
+        config = self.index_config
+        if config.type == PGVectorIndexType.hnsw:
+            # HNSW indexes are built incrementally, so they can exist from the start
+            method = "hnsw"
+            options = (
+                f"m = {config.hnsw_m}, ef_construction = {config.hnsw_ef_construction}"
+            )
+        else:
+            if self.num_rows < config.min_rows:
+                return
+            method = "ivfflat"
+            options = f"lists = {config.ivfflat_lists}"
+
+        log.info(f"Creating {method} index on {self.table_name}")
+        await self.pool.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS {self.ann_index_name}
+            ON {self.table_name} USING {method} (embedding vector_l2_ops)
+            WITH ({options})
+            """
         )
+        self.has_ann_index = True
 
     async def add_chunks(self, chunks: List[Chunk], embeddings: NDArray):
         assert len(chunks) == len(
             embeddings
         ), f"Chunk length {len(chunks)} does not match embedding length {len(embeddings)}"
 
-        values = []
-        for i, chunk in enumerate(chunks):
-            values.append(
-                (
-                    f"{chunk.document_id}:chunk-{i}",
-                    Json(chunk.model_dump()),
-                    embeddings[i].tolist(),
-                )
+        # an upsert can not touch the same row twice, so the last copy of a chunk wins
+        records = {}
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk_id = generate_chunk_id(chunk)
+            records[chunk_id] = (
+                chunk_id,
+                chunk.model_dump_json(),
+                vector_literal(embedding),
             )
 
-        query = sql.SQL(
-            f"""
-        INSERT INTO {self.table_name} (id, document, embedding)
-        VALUES %s
-        ON CONFLICT (id) DO UPDATE SET embedding = EXCLUDED.embedding, document = EXCLUDED.document
-    """
-        )
-        execute_values(self.cursor, query, values, template="(%s, %s, %s::vector)")
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    f"""
+                    CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+                        id TEXT,
+                        document TEXT,
+                        embedding TEXT
+                    ) ON COMMIT DELETE ROWS
+                    """
+                )
+                await conn.copy_records_to_table(
+                    STAGING_TABLE, records=list(records.values())
+                )
+                await conn.execute(
+                    f"""
+                    INSERT INTO {self.table_name} (id, document, embedding)
+                    SELECT id, document::jsonb, embedding::vector
+                    FROM {STAGING_TABLE}
+                    ON CONFLICT (id) DO UPDATE
+                    SET embedding = EXCLUDED.embedding, document = EXCLUDED.document
+                    """
+                )
+
+        if not self.has_ann_index:
+            self.num_rows += len(records)
+            await self._maybe_create_ann_index()
 
     async def query(
-        self, embedding: NDArray, k: int, score_threshold: float
+        self,
+        embedding: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
     ) -> QueryChunksResponse:
-        self.cursor.execute(
-            f"""
-        SELECT document, embedding <-> %s::vector AS distance
-        FROM {self.table_name}
-        ORDER BY distance
-        LIMIT %s
-    """,
-            (embedding.tolist(), k),
+        responses = await self.query_batch(
+            embedding.reshape(1, -1), k, score_threshold, search_params
         )
-        results = self.cursor.fetchall()
+        return responses[0]
+
+    def _search_settings(self, search_params: Dict[str, Any]) -> Dict[str, str]:
+        if self.index_config.type == PGVectorIndexType.hnsw:
+            ef_search = search_params.get("ef_search", self.index_config.hnsw_ef_search)
+            return {"hnsw.ef_search": str(int(ef_search))}
+        if self.index_config.type == PGVectorIndexType.ivfflat:
+            probes = search_params.get("nprobe", self.index_config.ivfflat_probes)
+            return {"ivfflat.probes": str(int(probes))}
+        return {}
+
+    async def query_batch(
+        self,
+        embeddings: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
+    ) -> List[QueryChunksResponse]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # scoped to the transaction, so pooled connections keep the defaults
+                for name, value in self._search_settings(search_params or {}).items():
+                    await conn.execute("SELECT set_config($1, $2, true)", name, value)
+
+                # one nearest neighbor search per query embedding, in a single statement
+                rows = await conn.fetch(
+                    f"""
+                    SELECT q.idx, r.document::text AS document, r.distance
+                    FROM unnest($1::text[]::vector[]) WITH ORDINALITY AS q(query_embedding, idx)
+                    CROSS JOIN LATERAL (
+                        SELECT t.document, t.embedding <-> q.query_embedding AS distance
+                        FROM {self.table_name} t
+                        WHERE t.embedding <-> q.query_embedding <= $2
+                        ORDER BY t.embedding <-> q.query_embedding
+                        LIMIT $3
+                    ) r
+                    ORDER BY q.idx, r.distance
+                    """,
+                    [vector_literal(embedding) for embedding in embeddings],
+                    # no threshold is 'Infinity'
+                    score_threshold_to_l2_distance(score_threshold),
+                    k,
+                )
 
-        chunks = []
-        scores = []
-        for doc, dist in results:
-            chunks.append(Chunk(**doc))
-            scores.append(1.0 / float(dist))
+        responses = [QueryChunksResponse(chunks=[], scores=[]) for _ in embeddings]
+        for row in rows:
+            response = responses[row["idx"] - 1]
+            response.chunks.append(Chunk.model_validate_json(row["document"]))
+            response.scores.append(l2_distance_to_score(float(row["distance"])))
 
-        return QueryChunksResponse(chunks=chunks, scores=scores)
+        return responses
 
     async def delete(self):
-        self.cursor.execute(f"DROP TABLE IF EXISTS {self.table_name}")
+        await self.pool.execute(f"DROP TABLE IF EXISTS {self.table_name}")
 
 
 class PGVectorVectorDBAdapter(VectorIO, VectorDBsProtocolPrivate):
     def __init__(self, config: PGVectorConfig, inference_api: Api.inference) -> None:
         self.config = config
         self.inference_api = inference_api
-        self.cursor = None
-        self.conn = None
+        self.pool: Optional[asyncpg.Pool] = None
         self.cache = {}
 
     async def initialize(self) -> None:
         log.info(f"Initializing PGVector memory adapter with config: {self.config}")
         try:
-            self.conn = psycopg2.connect(
+            self.pool = await asyncpg.create_pool(
                 host=self.config.host,
                 port=self.config.port,
                 database=self.config.db,
                 user=self.config.user,
                 password=self.config.password,
+                min_size=self.config.pool_min_size,
+                max_size=self.config.pool_max_size,
             )
-            self.conn.autocommit = True
-            self.cursor = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-            version = check_extension_version(self.cursor)
+            version = await check_extension_version(self.pool)
             if version:
                 log.info(f"Vector extension version: {version}")
             else:
                 raise RuntimeError("Vector extension is not installed.")
 
-            self.cursor.execute(
+            await self.pool.execute(
                 """
                 CREATE TABLE IF NOT EXISTS metadata_store (
                     key TEXT PRIMARY KEY,
@@ -160,15 +298,22 @@ class PGVectorVectorDBAdapter(VectorIO, VectorDBsProtocolPrivate):
             raise RuntimeError("Could not connect to PGVector database server") from e
 
     async def shutdown(self) -> None:
-        pass
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def _create_index(self, vector_db: VectorDB) -> VectorDBWithIndex:
+        index = await PGVectorIndex.create(
+            vector_db,
+            vector_db.embedding_dimension,
+            self.pool,
+            self.config.index_config(vector_db.metadata),
+        )
+        return VectorDBWithIndex(vector_db, index, self.inference_api)
 
     async def register_vector_db(self, vector_db: VectorDB) -> None:
-        upsert_models(self.cursor, [(vector_db.identifier, vector_db)])
-
-        index = PGVectorIndex(vector_db, vector_db.embedding_dimension, self.cursor)
-        self.cache[vector_db.identifier] = VectorDBWithIndex(
-            vector_db, index, self.inference_api
-        )
+        await upsert_models(self.pool, [(vector_db.identifier, vector_db)])
+        self.cache[vector_db.identifier] = await self._create_index(vector_db)
 
     async def unregister_vector_db(self, vector_db_id: str) -> None:
         await self.cache[vector_db_id].index.delete()
@@ -192,6 +337,15 @@ class PGVectorVectorDBAdapter(VectorIO, VectorDBsProtocolPrivate):
         index = await self._get_and_cache_vector_db_index(vector_db_id)
         return await index.query_chunks(query, params)
 
+    async def query_chunks_batch(
+        self,
+        vector_db_id: str,
+        queries: List[InterleavedContent],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> QueryChunksBatchResponse:
+        index = await self._get_and_cache_vector_db_index(vector_db_id)
+        return await index.query_chunks_batch(queries, params)
+
     async def _get_and_cache_vector_db_index(
         self, vector_db_id: str
     ) -> VectorDBWithIndex:
@@ -199,8 +353,5 @@ class PGVectorVectorDBAdapter(VectorIO, VectorDBsProtocolPrivate):
             return self.cache[vector_db_id]
 
         vector_db = await self.vector_db_store.get_vector_db(vector_db_id)
-        index = PGVectorIndex(vector_db, vector_db.embedding_dimension, self.cursor)
-        self.cache[vector_db_id] = VectorDBWithIndex(
-            vector_db, index, self.inference_api
-        )
+        self.cache[vector_db_id] = await self._create_index(vector_db)
         return self.cache[vector_db_id]
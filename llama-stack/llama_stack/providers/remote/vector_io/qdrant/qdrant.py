@@ -14,10 +14,16 @@ from qdrant_client.models import PointStruct
 
 from llama_stack.apis.inference import InterleavedContent
 from llama_stack.apis.vector_dbs import VectorDB
-from llama_stack.apis.vector_io import Chunk, QueryChunksResponse, VectorIO
+from llama_stack.apis.vector_io import (
+    Chunk,
+    QueryChunksBatchResponse,
+    QueryChunksResponse,
+    VectorIO,
+)
 from llama_stack.providers.datatypes import Api, VectorDBsProtocolPrivate
 from llama_stack.providers.utils.memory.vector_store import (
     EmbeddingIndex,
+    generate_chunk_id,
     VectorDBWithIndex,
 )
 from .config import QdrantConfig
@@ -56,8 +62,8 @@ class QdrantIndex(EmbeddingIndex):
             )
 
         points = []
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            chunk_id = f"{chunk.document_id}:chunk-{i}"
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk_id = generate_chunk_id(chunk)
             points.append(
                 PointStruct(
                     id=convert_id(chunk_id),
@@ -70,18 +76,39 @@ class QdrantIndex(EmbeddingIndex):
         await self.client.upsert(collection_name=self.collection_name, points=points)
 
     async def query(
-        self, embedding: NDArray, k: int, score_threshold: float
+        self,
+        embedding: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
     ) -> QueryChunksResponse:
-        results = (
-            await self.client.query_points(
-                collection_name=self.collection_name,
-                query=embedding.tolist(),
-                limit=k,
-                with_payload=True,
-                score_threshold=score_threshold,
-            )
-        ).points
+        responses = await self.query_batch(
+            embedding.reshape(1, -1), k, score_threshold, search_params
+        )
+        return responses[0]
+
+    async def query_batch(
+        self,
+        embeddings: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
+    ) -> List[QueryChunksResponse]:
+        responses = await self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                models.QueryRequest(
+                    query=embedding.tolist(),
+                    limit=k,
+                    with_payload=True,
+                    score_threshold=score_threshold,
+                )
+                for embedding in embeddings
+            ],
+        )
+        return [self._to_response(response.points) for response in responses]
 
+    def _to_response(self, results: List[models.ScoredPoint]) -> QueryChunksResponse:
         chunks, scores = [], []
         for point in results:
             assert isinstance(point, models.ScoredPoint)
@@ -165,3 +192,15 @@ class QdrantVectorDBAdapter(VectorIO, VectorDBsProtocolPrivate):
             raise ValueError(f"Vector DB {vector_db_id} not found")
 
         return await index.query_chunks(query, params)
+
+    async def query_chunks_batch(
+        self,
+        vector_db_id: str,
+        queries: List[InterleavedContent],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> QueryChunksBatchResponse:
+        index = await self._get_and_cache_vector_db_index(vector_db_id)
+        if not index:
+            raise ValueError(f"Vector DB {vector_db_id} not found")
+
+        return await index.query_chunks_batch(queries, params)
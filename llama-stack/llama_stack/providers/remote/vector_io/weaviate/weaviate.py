@@ -3,6 +3,7 @@
 #
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
+import asyncio
 import json
 import logging
 
@@ -16,11 +17,18 @@ from weaviate.classes.query import Filter
 
 from llama_stack.apis.common.content_types import InterleavedContent
 from llama_stack.apis.vector_dbs import VectorDB
-from llama_stack.apis.vector_io import Chunk, QueryChunksResponse, VectorIO
+from llama_stack.apis.vector_io import (
+    Chunk,
+    QueryChunksBatchResponse,
+    QueryChunksResponse,
+    VectorIO,
+)
 from llama_stack.distribution.request_headers import NeedsRequestProviderData
 from llama_stack.providers.datatypes import Api, VectorDBsProtocolPrivate
 from llama_stack.providers.utils.memory.vector_store import (
+    cosine_distance_to_score,
     EmbeddingIndex,
+    score_threshold_to_cosine_distance,
     VectorDBWithIndex,
 )
 
@@ -57,14 +65,49 @@ class WeaviateIndex(EmbeddingIndex):
         collection.data.insert_many(data_objects)
 
     async def query(
+        self,
+        embedding: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
+    ) -> QueryChunksResponse:
+        responses = await self.query_batch(
+            embedding.reshape(1, -1), k, score_threshold, search_params
+        )
+        return responses[0]
+
+    async def query_batch(
+        self,
+        embeddings: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
+    ) -> List[QueryChunksResponse]:
+        # the client has no multi-vector near_vector, so the searches run
+        # concurrently; it is blocking, so each in a worker thread
+        return await asyncio.gather(
+            *(
+                asyncio.to_thread(self._near_vector, embedding, k, score_threshold)
+                for embedding in embeddings
+            )
+        )
+
+    def _near_vector(
         self, embedding: NDArray, k: int, score_threshold: float
     ) -> QueryChunksResponse:
         collection = self.client.collections.get(self.collection_name)
 
+        bounds = {}
+        # cosine similarities can be negative, so only a positive threshold is
+        # turned into a distance bound; the default of 0 returns every result
+        if score_threshold > 0:
+            # collections use the default cosine distance
+            bounds["distance"] = score_threshold_to_cosine_distance(score_threshold)
         results = collection.query.near_vector(
             near_vector=embedding.tolist(),
             limit=k,
             return_metadata=wvc.query.MetadataQuery(distance=True),
+            **bounds,
         )
 
         chunks = []
@@ -79,7 +122,7 @@ class WeaviateIndex(EmbeddingIndex):
                 continue
 
             chunks.append(chunk)
-            scores.append(1.0 / doc.metadata.distance)
+            scores.append(cosine_distance_to_score(doc.metadata.distance))
 
         return QueryChunksResponse(chunks=chunks, scores=scores)
 
@@ -194,3 +237,15 @@ class WeaviateMemoryAdapter(
             raise ValueError(f"Vector DB {vector_db_id} not found")
 
         return await index.query_chunks(query, params)
+
+    async def query_chunks_batch(
+        self,
+        vector_db_id: str,
+        queries: List[InterleavedContent],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> QueryChunksBatchResponse:
+        index = await self._get_and_cache_vector_db_index(vector_db_id)
+        if not index:
+            raise ValueError(f"Vector DB {vector_db_id} not found")
+
+        return await index.query_chunks_batch(queries, params)
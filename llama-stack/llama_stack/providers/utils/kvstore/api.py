@@ -5,10 +5,14 @@
 # the root directory of this source tree.
 
 from datetime import datetime
-from typing import List, Optional, Protocol
+from typing import Dict, List, Optional, Protocol
 
 
 class KVStore(Protocol):
+    """Ranges include both `start_key` and `end_key`, and are returned in key
+    order. Stores implement the batch methods in fewer round trips than the
+    defaults here, which are built on get, set and delete."""
+
     # TODO: make the value type bytes instead of str
     async def set(
         self, key: str, value: str, expiration: Optional[datetime] = None
@@ -19,3 +23,32 @@ class KVStore(Protocol):
     async def delete(self, key: str) -> None: ...
 
     async def range(self, start_key: str, end_key: str) -> List[str]: ...
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Returns the values for `keys` in order, with None for missing keys."""
+        return [await self.get(key) for key in keys]
+
+    async def set_many(
+        self, items: Dict[str, str], expiration: Optional[datetime] = None
+    ) -> None:
+        """Sets all `items`, in a single transaction (or pipeline) where the store
+        supports it."""
+        for key, value in items.items():
+            await self.set(key, value, expiration)
+
+    async def delete_range(self, start_key: str, end_key: str) -> None:
+        """Deletes every key that `range(start_key, end_key)` would return."""
+        for key in await self.keys_in_range(start_key, end_key):
+            await self.delete(key)
+
+    async def keys_in_range(self, start_key: str, end_key: str) -> List[str]:
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support listing keys"
+        )
+
+    async def cleanup_expired(self, batch_size: int = 1000) -> int:
+        """Deletes expired keys in batches of `batch_size`, returning how many were removed.
+
+        Expired keys are never returned, so stores that do not keep them around
+        have nothing to delete."""
+        return 0
@@ -0,0 +1,260 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import asyncio
+import logging
+import time
+from collections import defaultdict, OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from llama_stack.providers.utils.telemetry.tracing import log_metric
+
+from .api import KVStore
+from .config import KVStoreCacheConfig
+
+log = logging.getLogger(__name__)
+
+METRICS_REPORT_INTERVAL_SECONDS = 10
+
+# value (None for a cached miss) and expiration
+CacheEntry = Tuple[Optional[str], Optional[datetime]]
+
+
+class CachingKVStore(KVStore):
+    """In-memory LRU cache in front of another KVStore.
+
+    Point reads (`get`/`get_many`) are served from memory when possible; range
+    queries always go to the backing store. Writes are either written through
+    to the backing store before returning, or with `write_behind` buffered and
+    flushed in batches with `set_many`.
+
+    The cache is local to the process: it is only coherent if this process is
+    the sole writer of the backing store.
+    """
+
+    def __init__(self, store: KVStore, config: KVStoreCacheConfig):
+        self.store = store
+        self.config = config
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._size = 0
+        # bumped on every write so that reads racing with a write don't cache stale data
+        self._write_version = 0
+
+        # write-behind state
+        self._dirty: Dict[str, CacheEntry] = {}
+        self._flushing: Dict[str, CacheEntry] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self._reported_hits = 0
+        self._reported_misses = 0
+        self._last_report = time.monotonic()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if hasattr(self.store, "shutdown"):
+            await self.store.shutdown()
+
+    def _entry_size(self, key: str, value: Optional[str]) -> int:
+        return len(key) + (len(value) if value else 0)
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= self._entry_size(key, entry[0])
+
+    def _put(
+        self, key: str, value: Optional[str], expiration: Optional[datetime] = None
+    ) -> None:
+        self._evict(key)
+        if value is None and not self.config.negative_caching:
+            return
+
+        size = self._entry_size(key, value)
+        if size > self.config.max_bytes:
+            return
+
+        self._entries[key] = (value, expiration)
+        self._size += size
+        while (
+            len(self._entries) > self.config.max_entries
+            or self._size > self.config.max_bytes
+        ):
+            oldest_key, (oldest_value, _) = self._entries.popitem(last=False)
+            self._size -= self._entry_size(oldest_key, oldest_value)
+
+    def _lookup(self, key: str) -> Tuple[bool, Optional[str]]:
+        entry = self._dirty.get(key) or self._flushing.get(key)
+        if entry is None:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            self._entries.move_to_end(key)
+
+        value, expiration = entry
+        if expiration is not None and expiration <= datetime.now():
+            self._evict(key)
+            return True, None
+        return True, value
+
+    def _record(self, hits: int, misses: int) -> None:
+        self.hits += hits
+        self.misses += misses
+
+        now = time.monotonic()
+        if now - self._last_report < METRICS_REPORT_INTERVAL_SECONDS:
+            return
+        self._last_report = now
+
+        attributes = {"store": type(self.store).__name__}
+        if self.hits > self._reported_hits:
+            log_metric(
+                "kvstore_cache_hits",
+                self.hits - self._reported_hits,
+                "count",
+                attributes,
+            )
+        if self.misses > self._reported_misses:
+            log_metric(
+                "kvstore_cache_misses",
+                self.misses - self._reported_misses,
+                "count",
+                attributes,
+            )
+        self._reported_hits = self.hits
+        self._reported_misses = self.misses
+
+    async def get(self, key: str) -> Optional[str]:
+        found, value = self._lookup(key)
+        if found:
+            self._record(hits=1, misses=0)
+            return value
+
+        self._record(hits=0, misses=1)
+        version = self._write_version
+        value = await self.store.get(key)
+        if version == self._write_version:
+            self._put(key, value)
+        return value
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        values: Dict[str, Optional[str]] = {}
+        missing = []
+        for key in keys:
+            found, value = self._lookup(key)
+            if found:
+                values[key] = value
+            else:
+                missing.append(key)
+        self._record(hits=len(keys) - len(missing), misses=len(missing))
+
+        if missing:
+            version = self._write_version
+            fetched = await self.store.get_many(missing)
+            for key, value in zip(missing, fetched):
+                values[key] = value
+                if version == self._write_version:
+                    self._put(key, value)
+
+        return [values[key] for key in keys]
+
+    async def set(
+        self, key: str, value: str, expiration: Optional[datetime] = None
+    ) -> None:
+        self._write_version += 1
+        if self.config.write_behind:
+            self._dirty[key] = (value, expiration)
+            self._schedule_flush()
+        else:
+            await self.store.set(key, value, expiration)
+        self._put(key, value, expiration)
+
+    async def set_many(
+        self, items: Dict[str, str], expiration: Optional[datetime] = None
+    ) -> None:
+        self._write_version += 1
+        if self.config.write_behind:
+            for key, value in items.items():
+                self._dirty[key] = (value, expiration)
+            self._schedule_flush()
+        else:
+            await self.store.set_many(items, expiration)
+        for key, value in items.items():
+            self._put(key, value, expiration)
+
+    async def delete(self, key: str) -> None:
+        self._write_version += 1
+        async with self._flush_lock:
+            self._dirty.pop(key, None)
+            await self.store.delete(key)
+        self._put(key, None)
+
+    async def range(self, start_key: str, end_key: str) -> List[str]:
+        await self.flush()
+        return await self.store.range(start_key, end_key)
+
+    async def keys_in_range(self, start_key: str, end_key: str) -> List[str]:
+        await self.flush()
+        return await self.store.keys_in_range(start_key, end_key)
+
+    async def delete_range(self, start_key: str, end_key: str) -> None:
+        self._write_version += 1
+        await self.flush()
+        await self.store.delete_range(start_key, end_key)
+        for key in [k for k in self._entries if start_key <= k <= end_key]:
+            self._evict(key)
+
+    async def cleanup_expired(self, batch_size: int = 1000) -> int:
+        now = datetime.now()
+        for key in [
+            key
+            for key, (_, expiration) in self._entries.items()
+            if expiration is not None and expiration <= now
+        ]:
+            self._evict(key)
+        await self.flush()
+        return await self.store.cleanup_expired(batch_size)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_after_interval())
+
+    async def _flush_after_interval(self) -> None:
+        await asyncio.sleep(self.config.write_behind_interval_ms / 1000)
+        try:
+            await self.flush()
+        except Exception:
+            log.exception("Failed to flush buffered kvstore writes")
+
+    async def flush(self) -> None:
+        """Writes all buffered write-behind entries to the backing store."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            self._flushing, self._dirty = self._dirty, {}
+            by_expiration: Dict[Optional[datetime], Dict[str, str]] = defaultdict(dict)
+            for key, (value, expiration) in self._flushing.items():
+                by_expiration[expiration][key] = value
+            try:
+                for expiration, items in by_expiration.items():
+                    await self.store.set_many(items, expiration)
+            except Exception:
+                # keep the entries so that the next flush retries them
+                self._dirty = {**self._flushing, **self._dirty}
+                raise
+            finally:
+                self._flushing = {}
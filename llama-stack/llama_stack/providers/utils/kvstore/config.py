@@ -20,17 +20,59 @@ class KVStoreType(Enum):
     postgres = "postgres"
 
 
+class KVStoreCacheConfig(BaseModel):
+    max_entries: int = Field(
+        default=10_000,
+        description="Maximum number of keys held in the in-memory LRU cache",
+    )
+    max_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="Maximum combined size of cached keys and values",
+    )
+    negative_caching: bool = Field(
+        default=True,
+        description="Also cache lookups of keys that do not exist",
+    )
+    write_behind: bool = Field(
+        default=False,
+        description="Acknowledge writes once cached and flush them to the backing "
+        "store in batches. Unflushed writes are lost if the process dies",
+    )
+    write_behind_interval_ms: int = Field(
+        default=100,
+        description="How long writes are buffered before being flushed when write_behind is set",
+    )
+
+
 class CommonConfig(BaseModel):
     namespace: Optional[str] = Field(
         default=None,
         description="All keys will be prefixed with this namespace",
     )
+    cache: Optional[KVStoreCacheConfig] = Field(
+        default=None,
+        description="Serve repeated reads from an in-memory LRU cache in front of the store. "
+        "Disabled by default; only enable it when this process is the only writer of the store",
+    )
+    expiration_cleanup_interval_seconds: Optional[float] = Field(
+        default=None,
+        description="How often a background task deletes expired keys, disabled by default. "
+        "Expired keys are never returned either way. The task runs until the store is shut down",
+    )
+    expiration_cleanup_batch_size: int = Field(
+        default=1000,
+        description="Maximum number of expired keys deleted per statement",
+    )
 
 
 class RedisKVStoreConfig(CommonConfig):
     type: Literal[KVStoreType.redis.value] = KVStoreType.redis.value
     host: str = "localhost"
     port: int = 6379
+    max_connections: Optional[int] = Field(
+        default=None,
+        description="Size of the connection pool. Unbounded if not set",
+    )
 
     @property
     def url(self) -> str:
@@ -52,6 +94,19 @@ class SqliteKVStoreConfig(CommonConfig):
         default=(RUNTIME_BASE_DIR / "kvstore.db").as_posix(),
         description="File path for the sqlite database",
     )
+    journal_mode: Literal["wal", "delete", "truncate", "persist", "memory"] = Field(
+        default="wal",
+        description="SQLite journal mode. WAL lets readers proceed while a write is in progress",
+    )
+    synchronous: Literal["off", "normal", "full", "extra"] = Field(
+        default="normal",
+        description="SQLite synchronous level. 'normal' is durable across crashes in WAL mode",
+    )
+    commit_window_ms: Optional[float] = Field(
+        default=None,
+        description="If set, concurrent writes arriving within this window are "
+        "committed together in a single transaction",
+    )
 
     @classmethod
     def sample_run_config(
@@ -75,6 +130,18 @@ class PostgresKVStoreConfig(CommonConfig):
     user: str
     password: Optional[str] = None
     table_name: str = "llamastack_kvstore"
+    pool_min_size: int = Field(
+        default=1,
+        description="Minimum number of connections kept open in the pool",
+    )
+    pool_max_size: int = Field(
+        default=10,
+        description="Maximum number of concurrent connections to the database",
+    )
+    statement_cache_size: int = Field(
+        default=100,
+        description="Number of prepared statements cached per connection",
+    )
 
     @classmethod
     def sample_run_config(cls, table_name: str = "llamastack_kvstore"):
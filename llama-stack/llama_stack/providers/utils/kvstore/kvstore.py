@@ -4,35 +4,90 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
-from typing import List, Optional
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 from .api import KVStore
 from .config import KVStoreConfig, KVStoreType
 
 
 def kvstore_dependencies():
-    return ["aiosqlite", "psycopg2-binary", "redis"]
+    return ["aiosqlite", "asyncpg", "redis"]
 
 
 class InmemoryKVStoreImpl(KVStore):
     def __init__(self):
-        self._store = {}
+        self._store: Dict[str, Tuple[str, Optional[datetime]]] = {}
 
     async def initialize(self) -> None:
         pass
 
+    def _get(self, key: str) -> Optional[str]:
+        entry = self._store.get(key)
+        if entry is None:
+            return None
+        value, expiration = entry
+        if expiration is not None and expiration <= datetime.now():
+            del self._store[key]
+            return None
+        return value
+
+    def _keys_in_range(self, start_key: str, end_key: str) -> List[str]:
+        return sorted(key for key in self._store.keys() if start_key <= key <= end_key)
+
     async def get(self, key: str) -> Optional[str]:
-        return self._store.get(key)
+        return self._get(key)
+
+    async def set(
+        self, key: str, value: str, expiration: Optional[datetime] = None
+    ) -> None:
+        self._store[key] = (value, expiration)
 
-    async def set(self, key: str, value: str) -> None:
-        self._store[key] = value
+    async def delete(self, key: str) -> None:
+        self._store.pop(key, None)
 
     async def range(self, start_key: str, end_key: str) -> List[str]:
+        values = [self._get(key) for key in self._keys_in_range(start_key, end_key)]
+        return [value for value in values if value is not None]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return [self._get(key) for key in keys]
+
+    async def set_many(
+        self, items: Dict[str, str], expiration: Optional[datetime] = None
+    ) -> None:
+        for key, value in items.items():
+            self._store[key] = (value, expiration)
+
+    async def delete_range(self, start_key: str, end_key: str) -> None:
+        for key in self._keys_in_range(start_key, end_key):
+            del self._store[key]
+
+    async def keys_in_range(self, start_key: str, end_key: str) -> List[str]:
         return [
-            self._store[key]
-            for key in self._store.keys()
-            if key >= start_key and key < end_key
+            key
+            for key in self._keys_in_range(start_key, end_key)
+            if self._get(key) is not None
+        ]
+
+    async def cleanup_expired(self, batch_size: int = 1000) -> int:
+        now = datetime.now()
+        expired = [
+            key
+            for key, (_, expiration) in self._store.items()
+            if expiration is not None and expiration <= now
         ]
+        deleted = 0
+        for start in range(0, len(expired), batch_size):
+            for key in expired[start : start + batch_size]:
+                # the key may have been set again while other tasks ran
+                entry = self._store.get(key)
+                if entry is not None and entry[1] is not None and entry[1] <= now:
+                    del self._store[key]
+                    deleted += 1
+            await asyncio.sleep(0)
+        return deleted
 
 
 async def kvstore_impl(config: KVStoreConfig) -> KVStore:
@@ -52,4 +107,9 @@ async def kvstore_impl(config: KVStoreConfig) -> KVStore:
         raise ValueError(f"Unknown kvstore type {config.type}")
 
     await impl.initialize()
+
+    if config.cache:
+        from .caching import CachingKVStore
+
+        impl = CachingKVStore(impl, config.cache)
     return impl
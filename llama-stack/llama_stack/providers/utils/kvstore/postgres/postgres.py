@@ -4,15 +4,16 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
+import asyncio
 import logging
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-import psycopg2
-from psycopg2.extras import DictCursor
+import asyncpg
 
 from ..api import KVStore
 from ..config import PostgresKVStoreConfig
+from ..sweeper import start_expiration_sweeper
 
 log = logging.getLogger(__name__)
 
@@ -20,29 +21,33 @@ log = logging.getLogger(__name__)
 class PostgresKVStoreImpl(KVStore):
     def __init__(self, config: PostgresKVStoreConfig):
         self.config = config
-        self.conn = None
-        self.cursor = None
+        self.pool: Optional[asyncpg.Pool] = None
+        self._sweeper_task: Optional[asyncio.Task] = None
 
     async def initialize(self) -> None:
         try:
-            self.conn = psycopg2.connect(
+            self.pool = await asyncpg.create_pool(
                 host=self.config.host,
                 port=self.config.port,
                 database=self.config.db,
                 user=self.config.user,
                 password=self.config.password,
+                min_size=self.config.pool_min_size,
+                max_size=self.config.pool_max_size,
+                statement_cache_size=self.config.statement_cache_size,
             )
-            self.conn.autocommit = True
-            self.cursor = self.conn.cursor(cursor_factory=DictCursor)
 
             # Create table if it doesn't exist
-            self.cursor.execute(
+            await self.pool.execute(
                 f"""
                 CREATE TABLE IF NOT EXISTS {self.config.table_name} (
                     key TEXT PRIMARY KEY,
                     value TEXT,
                     expiration TIMESTAMP
-                )
+                );
+                CREATE INDEX IF NOT EXISTS {self.config.table_name}_expiration_idx
+                    ON {self.config.table_name} (expiration)
+                    WHERE expiration IS NOT NULL;
                 """
             )
         except Exception as e:
@@ -50,56 +55,146 @@ class PostgresKVStoreImpl(KVStore):
             log.exception("Could not connect to PostgreSQL database server")
             raise RuntimeError("Could not connect to PostgreSQL database server") from e
 
+        self._sweeper_task = start_expiration_sweeper(self, self.config)
+
+    async def shutdown(self) -> None:
+        if self._sweeper_task:
+            self._sweeper_task.cancel()
+            self._sweeper_task = None
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def cleanup_expired(self, batch_size: int = 1000) -> int:
+        total = 0
+        while True:
+            status = await self.pool.execute(
+                f"""
+                DELETE FROM {self.config.table_name}
+                WHERE key IN (
+                    SELECT key FROM {self.config.table_name}
+                    WHERE expiration < NOW()
+                    LIMIT $1
+                )
+                """,
+                batch_size,
+            )
+            # status looks like "DELETE <count>"
+            deleted = int(status.split()[-1])
+            total += deleted
+            if deleted < batch_size:
+                return total
+
     def _namespaced_key(self, key: str) -> str:
         if not self.config.namespace:
             return key
         return f"{self.config.namespace}:{key}"
 
+    def _strip_namespace(self, key: str) -> str:
+        if not self.config.namespace:
+            return key
+        return key[len(self.config.namespace) + 1 :]
+
     async def set(
         self, key: str, value: str, expiration: Optional[datetime] = None
     ) -> None:
         key = self._namespaced_key(key)
-        self.cursor.execute(
+        await self.pool.execute(
             f"""
             INSERT INTO {self.config.table_name} (key, value, expiration)
-            VALUES (%s, %s, %s)
+            VALUES ($1, $2, $3)
             ON CONFLICT (key) DO UPDATE
             SET value = EXCLUDED.value, expiration = EXCLUDED.expiration
             """,
-            (key, value, expiration),
+            key,
+            value,
+            expiration,
         )
 
     async def get(self, key: str) -> Optional[str]:
         key = self._namespaced_key(key)
-        self.cursor.execute(
+        return await self.pool.fetchval(
             f"""
             SELECT value FROM {self.config.table_name}
-            WHERE key = %s
+            WHERE key = $1
             AND (expiration IS NULL OR expiration > NOW())
             """,
-            (key,),
+            key,
         )
-        result = self.cursor.fetchone()
-        return result[0] if result else None
 
     async def delete(self, key: str) -> None:
         key = self._namespaced_key(key)
-        self.cursor.execute(
-            f"DELETE FROM {self.config.table_name} WHERE key = %s",
-            (key,),
+        await self.pool.execute(
+            f"DELETE FROM {self.config.table_name} WHERE key = $1",
+            key,
         )
 
     async def range(self, start_key: str, end_key: str) -> List[str]:
         start_key = self._namespaced_key(start_key)
         end_key = self._namespaced_key(end_key)
 
-        self.cursor.execute(
+        rows = await self.pool.fetch(
             f"""
             SELECT value FROM {self.config.table_name}
-            WHERE key >= %s AND key < %s
+            WHERE key >= $1 AND key <= $2
+            AND (expiration IS NULL OR expiration > NOW())
+            ORDER BY key
+            """,
+            start_key,
+            end_key,
+        )
+        return [row["value"] for row in rows]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        namespaced_keys = [self._namespaced_key(key) for key in keys]
+        rows = await self.pool.fetch(
+            f"""
+            SELECT key, value FROM {self.config.table_name}
+            WHERE key = ANY($1::text[])
+            AND (expiration IS NULL OR expiration > NOW())
+            """,
+            namespaced_keys,
+        )
+        values = {row["key"]: row["value"] for row in rows}
+        return [values.get(key) for key in namespaced_keys]
+
+    async def set_many(
+        self, items: Dict[str, str], expiration: Optional[datetime] = None
+    ) -> None:
+        if not items:
+            return
+        # a single statement so the whole batch is applied atomically
+        await self.pool.execute(
+            f"""
+            INSERT INTO {self.config.table_name} (key, value, expiration)
+            SELECT key, value, $3::timestamp
+            FROM unnest($1::text[], $2::text[]) AS batch(key, value)
+            ON CONFLICT (key) DO UPDATE
+            SET value = EXCLUDED.value, expiration = EXCLUDED.expiration
+            """,
+            [self._namespaced_key(key) for key in items.keys()],
+            list(items.values()),
+            expiration,
+        )
+
+    async def delete_range(self, start_key: str, end_key: str) -> None:
+        await self.pool.execute(
+            f"DELETE FROM {self.config.table_name} WHERE key >= $1 AND key <= $2",
+            self._namespaced_key(start_key),
+            self._namespaced_key(end_key),
+        )
+
+    async def keys_in_range(self, start_key: str, end_key: str) -> List[str]:
+        rows = await self.pool.fetch(
+            f"""
+            SELECT key FROM {self.config.table_name}
+            WHERE key >= $1 AND key <= $2
             AND (expiration IS NULL OR expiration > NOW())
             ORDER BY key
             """,
-            (start_key, end_key),
+            self._namespaced_key(start_key),
+            self._namespaced_key(end_key),
         )
-        return [row[0] for row in self.cursor.fetchall()]
+        return [self._strip_namespace(row["key"]) for row in rows]
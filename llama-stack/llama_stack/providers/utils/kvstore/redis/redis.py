@@ -4,21 +4,111 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
+import asyncio
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
 
 from redis.asyncio import Redis
 
 from ..api import KVStore
 from ..config import RedisKVStoreConfig
+from ..sweeper import start_expiration_sweeper
+
+# Sorted set holding every key of a namespace (all with score 0) so that range
+# queries are a ZRANGEBYLEX over the namespace instead of a SCAN of the keyspace.
+INDEX_KEY = "__kvstore_index__"
+# Set once the index has been backfilled. Redis drops the index when it becomes
+# empty, so its absence alone does not mean the backfill is still needed.
+INDEX_BUILT_KEY = "__kvstore_index_built__"
+
+# Drops the index entries (ARGV) of values (KEYS[2:]) that no longer exist. The
+# check and the removal must be atomic, or a concurrent set of the same key
+# would lose its index entry while its value stays.
+PRUNE_INDEX_SCRIPT = """
+local removed = 0
+for i = 2, #KEYS do
+    if redis.call("EXISTS", KEYS[i]) == 0 then
+        removed = removed + redis.call("ZREM", KEYS[1], ARGV[i - 1])
+    end
+end
+return removed
+"""
+
+BATCH_SIZE = 1000
+
+
+def _decode(value: Optional[Union[bytes, str]]) -> Optional[str]:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
 
 
 class RedisKVStoreImpl(KVStore):
     def __init__(self, config: RedisKVStoreConfig):
         self.config = config
+        self._sweeper_task: Optional[asyncio.Task] = None
 
     async def initialize(self) -> None:
-        self.redis = Redis.from_url(self.config.url)
+        self.redis = Redis.from_url(
+            self.config.url, max_connections=self.config.max_connections
+        )
+        self.index_key = self._namespaced_key(INDEX_KEY)
+        self._prune_index_script = self.redis.register_script(PRUNE_INDEX_SCRIPT)
+        await self._ensure_index()
+        self._sweeper_task = start_expiration_sweeper(self, self.config)
+
+    async def shutdown(self) -> None:
+        if self._sweeper_task:
+            self._sweeper_task.cancel()
+            self._sweeper_task = None
+        await self.redis.aclose()
+
+    async def cleanup_expired(self, batch_size: int = 1000) -> int:
+        """Redis evicts expired values itself; this prunes their leftover index entries."""
+        removed = 0
+        batch = []
+        async for key, _ in self.redis.zscan_iter(self.index_key, count=batch_size):
+            batch.append(_decode(key))
+            if len(batch) >= batch_size:
+                removed += await self._prune_index(batch)
+                batch = []
+        if batch:
+            removed += await self._prune_index(batch)
+        return removed
+
+    async def _prune_index(self, keys: List[str]) -> int:
+        return await self._prune_index_script(
+            keys=[self.index_key, *(self._namespaced_key(key) for key in keys)],
+            args=keys,
+        )
+
+    async def _ensure_index(self) -> None:
+        built_key = self._namespaced_key(INDEX_BUILT_KEY)
+        if not await self.redis.exists(built_key):
+            await self._build_index()
+            await self.redis.set(built_key, 1)
+
+    async def _build_index(self) -> None:
+        """One-time backfill of the range index for keys written before it existed.
+
+        With a namespace configured only that namespace's keys are scanned.
+        """
+        if self.config.namespace:
+            pattern = f"{self.config.namespace}:*"
+            prefix_len = len(self.config.namespace) + 1
+        else:
+            pattern = "*"
+            prefix_len = 0
+        batch = []
+        async for key in self.redis.scan_iter(match=pattern, count=BATCH_SIZE):
+            key = _decode(key)
+            # skip our own index keys and, without a namespace, those of namespaced stores
+            if key.endswith((INDEX_KEY, INDEX_BUILT_KEY)):
+                continue
+            batch.append(key[prefix_len:])
+            if len(batch) >= BATCH_SIZE:
+                await self.redis.zadd(self.index_key, dict.fromkeys(batch, 0))
+                batch = []
+        if batch:
+            await self.redis.zadd(self.index_key, dict.fromkeys(batch, 0))
 
     def _namespaced_key(self, key: str) -> str:
         if not self.config.namespace:
@@ -28,47 +118,69 @@ class RedisKVStoreImpl(KVStore):
     async def set(
         self, key: str, value: str, expiration: Optional[datetime] = None
     ) -> None:
-        key = self._namespaced_key(key)
-        await self.redis.set(key, value)
-        if expiration:
-            await self.redis.expireat(key, expiration)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._namespaced_key(key), value, exat=expiration)
+            pipe.zadd(self.index_key, {key: 0})
+            await pipe.execute()
 
     async def get(self, key: str) -> Optional[str]:
         key = self._namespaced_key(key)
-        value = await self.redis.get(key)
-        if value is None:
-            return None
-        ttl = await self.redis.ttl(key)
-        return value
+        return _decode(await self.redis.get(key))
 
     async def delete(self, key: str) -> None:
-        key = self._namespaced_key(key)
-        await self.redis.delete(key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._namespaced_key(key))
+            pipe.zrem(self.index_key, key)
+            await pipe.execute()
+
+    async def keys_in_range(self, start_key: str, end_key: str) -> List[str]:
+        keys = await self.redis.zrangebylex(
+            self.index_key, f"[{start_key}", f"[{end_key}"
+        )
+        return [_decode(key) for key in keys]
 
     async def range(self, start_key: str, end_key: str) -> List[str]:
-        start_key = self._namespaced_key(start_key)
-        end_key = self._namespaced_key(end_key)
-        cursor = 0
-        pattern = start_key + "*"  # Match all keys starting with start_key prefix
-        matching_keys = []
-        while True:
-            cursor, keys = await self.redis.scan(cursor, match=pattern, count=1000)
-
-            for key in keys:
-                key_str = key.decode("utf-8") if isinstance(key, bytes) else key
-                if start_key <= key_str <= end_key:
-                    matching_keys.append(key)
-
-            if cursor == 0:
-                break
-
-        # Then fetch all values in a single MGET call
-        if matching_keys:
-            values = await self.redis.mget(matching_keys)
-            return [
-                value.decode("utf-8") if isinstance(value, bytes) else value
-                for value in values
-                if value is not None
-            ]
-
-        return []
+        keys = await self.keys_in_range(start_key, end_key)
+        values = []
+        expired = []
+        for i in range(0, len(keys), BATCH_SIZE):
+            batch = keys[i : i + BATCH_SIZE]
+            batch_values = await self.redis.mget(
+                [self._namespaced_key(key) for key in batch]
+            )
+            for key, value in zip(batch, batch_values):
+                if value is None:
+                    expired.append(key)
+                else:
+                    values.append(_decode(value))
+
+        # keys that expired through their TTL are still in the index; drop them lazily
+        if expired:
+            await self._prune_index(expired)
+        return values
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        values = await self.redis.mget([self._namespaced_key(key) for key in keys])
+        return [_decode(value) for value in values]
+
+    async def set_many(
+        self, items: Dict[str, str], expiration: Optional[datetime] = None
+    ) -> None:
+        if not items:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for key, value in items.items():
+                pipe.set(self._namespaced_key(key), value, exat=expiration)
+            pipe.zadd(self.index_key, dict.fromkeys(items.keys(), 0))
+            await pipe.execute()
+
+    async def delete_range(self, start_key: str, end_key: str) -> None:
+        keys = await self.keys_in_range(start_key, end_key)
+        for i in range(0, len(keys), BATCH_SIZE):
+            batch = keys[i : i + BATCH_SIZE]
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(*[self._namespaced_key(key) for key in batch])
+                pipe.zrem(self.index_key, *batch)
+                await pipe.execute()
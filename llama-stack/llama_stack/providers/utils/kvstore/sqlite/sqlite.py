@@ -4,70 +4,229 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
+import asyncio
 import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 
 from datetime import datetime
-from typing import List, Optional
-
-import aiosqlite
+from typing import Any, Callable, Dict, List, Optional
 
 from ..api import KVStore
 from ..config import SqliteKVStoreConfig
+from ..sweeper import start_expiration_sweeper
+
+# stay well below SQLITE_MAX_VARIABLE_NUMBER on older sqlite builds
+MAX_VARIABLES_PER_QUERY = 500
+
+NOT_EXPIRED = "(expiration IS NULL OR expiration > ?)"
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    # stored as text in the same format sqlite3's (deprecated) default adapter used,
+    # which sorts chronologically so expirations can be compared in SQL
+    return value.isoformat(" ") if value is not None else None
+
+
+def _now() -> str:
+    return _timestamp(datetime.now())
 
 
 class SqliteKVStoreImpl(KVStore):
+    """KVStore backed by a single long-lived sqlite connection.
+
+    All statements run on one dedicated worker thread so the connection is never
+    shared across threads, and sqlite's per-connection statement cache means each
+    query is only prepared once. Writes can optionally be group-committed: every
+    `set`/`delete` issued within `commit_window_ms` of the first one shares a
+    single transaction (and a single fsync). `set_many` and `delete_range` are
+    written and committed in a transaction of their own, all or nothing.
+    """
+
     def __init__(self, config: SqliteKVStoreConfig):
+        self.config = config
         self.db_path = config.db_path
         self.table_name = "kvstore"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sqlite-kvstore"
+        )
+        self._pending_commit: Optional[asyncio.Future] = None
+        self._sweeper_task: Optional[asyncio.Task] = None
+
+    async def _run(self, fn: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _connect(self) -> None:
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={self.config.journal_mode}")
+        self._conn.execute(f"PRAGMA synchronous={self.config.synchronous}")
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table_name} (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                expiration TIMESTAMP
+            )
+            """
+        )
+        self._conn.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS {self.table_name}_expiration_idx
+            ON {self.table_name} (expiration) WHERE expiration IS NOT NULL
+            """
+        )
+        self._conn.commit()
 
     async def initialize(self):
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                f"""
-                CREATE TABLE IF NOT EXISTS {self.table_name} (
-                    key TEXT PRIMARY KEY,
-                    value TEXT,
-                    expiration TIMESTAMP
-                )
-            """
-            )
-            await db.commit()
+        await self._run(self._connect)
+        self._sweeper_task = start_expiration_sweeper(self, self.config)
+
+    async def shutdown(self) -> None:
+        if self._conn is None:
+            return
+        if self._sweeper_task:
+            self._sweeper_task.cancel()
+            self._sweeper_task = None
+        if self._pending_commit is not None:
+            await self._pending_commit
+        await self._run(self._conn.commit)
+        await self._run(self._conn.close)
+        self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def _commit(self) -> None:
+        if not self.config.commit_window_ms:
+            await self._run(self._conn.commit)
+            return
+
+        if self._pending_commit is None:
+            self._pending_commit = asyncio.ensure_future(self._commit_after_window())
+        # shield so that a cancelled writer does not cancel the commit for the others
+        await asyncio.shield(self._pending_commit)
+
+    async def _commit_after_window(self) -> None:
+        await asyncio.sleep(self.config.commit_window_ms / 1000)
+        # writes issued from here on open a new window
+        self._pending_commit = None
+        await self._run(self._conn.commit)
+
+    def _write_batch(self, sql: str, params: List[tuple]) -> None:
+        # a savepoint, so that a failing row only rolls back this batch and not
+        # the writes of others still waiting for the grouped commit
+        self._conn.execute("SAVEPOINT batch")
+        try:
+            self._conn.executemany(sql, params)
+        except BaseException:
+            self._conn.execute("ROLLBACK TO batch")
+            self._conn.execute("RELEASE batch")
+            raise
+        self._conn.execute("RELEASE batch")
+        self._conn.commit()
 
     async def set(
         self, key: str, value: str, expiration: Optional[datetime] = None
     ) -> None:
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                f"INSERT OR REPLACE INTO {self.table_name} (key, value, expiration) VALUES (?, ?, ?)",
-                (key, value, expiration),
-            )
-            await db.commit()
+        await self._run(
+            self._conn.execute,
+            f"INSERT OR REPLACE INTO {self.table_name} (key, value, expiration) VALUES (?, ?, ?)",
+            (key, value, _timestamp(expiration)),
+        )
+        await self._commit()
+
+    def _get(self, key: str) -> Optional[str]:
+        row = self._conn.execute(
+            f"SELECT value FROM {self.table_name} WHERE key = ? AND {NOT_EXPIRED}",
+            (key, _now()),
+        ).fetchone()
+        return row[0] if row else None
 
     async def get(self, key: str) -> Optional[str]:
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(
-                f"SELECT value, expiration FROM {self.table_name} WHERE key = ?", (key,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                if row is None:
-                    return None
-                value, expiration = row
-                return value
+        return await self._run(self._get, key)
 
     async def delete(self, key: str) -> None:
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(f"DELETE FROM {self.table_name} WHERE key = ?", (key,))
-            await db.commit()
+        await self._run(
+            self._conn.execute, f"DELETE FROM {self.table_name} WHERE key = ?", (key,)
+        )
+        await self._commit()
+
+    def _range(self, start_key: str, end_key: str) -> List[str]:
+        cursor = self._conn.execute(
+            f"SELECT value FROM {self.table_name} WHERE key >= ? AND key <= ? AND {NOT_EXPIRED}",
+            (start_key, end_key, _now()),
+        )
+        return [value for (value,) in cursor]
 
     async def range(self, start_key: str, end_key: str) -> List[str]:
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(
-                f"SELECT key, value, expiration FROM {self.table_name} WHERE key >= ? AND key <= ?",
-                (start_key, end_key),
-            ) as cursor:
-                result = []
-                async for row in cursor:
-                    _, value, _ = row
-                    result.append(value)
-                return result
+        return await self._run(self._range, start_key, end_key)
+
+    def _get_many(self, keys: List[str]) -> List[Optional[str]]:
+        now = _now()
+        values = {}
+        for i in range(0, len(keys), MAX_VARIABLES_PER_QUERY):
+            batch = keys[i : i + MAX_VARIABLES_PER_QUERY]
+            placeholders = ", ".join("?" * len(batch))
+            values.update(
+                self._conn.execute(
+                    f"SELECT key, value FROM {self.table_name} "
+                    f"WHERE key IN ({placeholders}) AND {NOT_EXPIRED}",
+                    [*batch, now],
+                )
+            )
+        return [values.get(key) for key in keys]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return await self._run(self._get_many, keys)
+
+    async def set_many(
+        self, items: Dict[str, str], expiration: Optional[datetime] = None
+    ) -> None:
+        if not items:
+            return
+        await self._run(
+            self._write_batch,
+            f"INSERT OR REPLACE INTO {self.table_name} (key, value, expiration) VALUES (?, ?, ?)",
+            [(key, value, _timestamp(expiration)) for key, value in items.items()],
+        )
+
+    async def delete_range(self, start_key: str, end_key: str) -> None:
+        await self._run(
+            self._write_batch,
+            f"DELETE FROM {self.table_name} WHERE key >= ? AND key <= ?",
+            [(start_key, end_key)],
+        )
+
+    def _keys_in_range(self, start_key: str, end_key: str) -> List[str]:
+        cursor = self._conn.execute(
+            f"SELECT key FROM {self.table_name} WHERE key >= ? AND key <= ? AND {NOT_EXPIRED}",
+            (start_key, end_key, _now()),
+        )
+        return [key for (key,) in cursor]
+
+    async def keys_in_range(self, start_key: str, end_key: str) -> List[str]:
+        return await self._run(self._keys_in_range, start_key, end_key)
+
+    def _cleanup_expired(self, batch_size: int) -> int:
+        now = _now()
+        total = 0
+        while True:
+            # bounded batches keep the write lock short so readers are not starved
+            cursor = self._conn.execute(
+                f"""
+                DELETE FROM {self.table_name} WHERE key IN (
+                    SELECT key FROM {self.table_name} WHERE expiration <= ? LIMIT ?
+                )
+                """,
+                (now, batch_size),
+            )
+            self._conn.commit()
+            total += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return total
+
+    async def cleanup_expired(self, batch_size: int = 1000) -> int:
+        return await self._run(self._cleanup_expired, batch_size)
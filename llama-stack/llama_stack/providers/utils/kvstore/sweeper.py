@@ -0,0 +1,40 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import asyncio
+import logging
+from typing import Optional
+
+from .api import KVStore
+from .config import CommonConfig
+
+log = logging.getLogger(__name__)
+
+
+def start_expiration_sweeper(
+    store: KVStore, config: CommonConfig
+) -> Optional[asyncio.Task]:
+    """Starts a background task that periodically deletes expired keys from `store`."""
+    if not config.expiration_cleanup_interval_seconds:
+        return None
+    return asyncio.create_task(
+        _sweep_expired(
+            store,
+            config.expiration_cleanup_interval_seconds,
+            config.expiration_cleanup_batch_size,
+        )
+    )
+
+
+async def _sweep_expired(store: KVStore, interval_seconds: float, batch_size: int):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            deleted = await store.cleanup_expired(batch_size)
+            if deleted:
+                log.info(f"Deleted {deleted} expired keys from {type(store).__name__}")
+        except Exception:
+            log.exception("Failed to delete expired keys")
@@ -0,0 +1,125 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from llama_stack.providers.utils.kvstore import InmemoryKVStoreImpl, kvstore_impl
+from llama_stack.providers.utils.kvstore.caching import CachingKVStore
+from llama_stack.providers.utils.kvstore.config import (
+    KVStoreCacheConfig,
+    SqliteKVStoreConfig,
+)
+
+
+class CountingKVStore(InmemoryKVStoreImpl):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    async def get(self, key):
+        self.reads += 1
+        return await super().get(key)
+
+    async def get_many(self, keys):
+        self.reads += 1
+        return await super().get_many(keys)
+
+
+@pytest.fixture
+def backend():
+    return CountingKVStore()
+
+
+@pytest.mark.asyncio
+async def test_read_through_and_negative_caching(backend):
+    await backend.set("key", "value")
+    cache = CachingKVStore(backend, KVStoreCacheConfig())
+
+    assert await cache.get("key") == "value"
+    assert await cache.get("key") == "value"
+    assert await cache.get("missing") is None
+    assert await cache.get("missing") is None
+    assert backend.reads == 2
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    assert await cache.get_many(["key", "missing", "other"]) == ["value", None, None]
+    assert backend.reads == 3
+
+
+@pytest.mark.asyncio
+async def test_write_through_and_delete_invalidation(backend):
+    cache = CachingKVStore(backend, KVStoreCacheConfig())
+
+    await cache.set("key", "value")
+    assert await cache.get("key") == "value"
+    assert backend.reads == 0
+    assert await backend.get("key") == "value"
+
+    await cache.delete("key")
+    assert await backend.get("key") is None
+    assert await cache.get("key") is None
+
+    await cache.set_many({"a:1": "1", "a:2": "2"})
+    await cache.delete_range("a:", "a:\xff")
+    assert await cache.get_many(["a:1", "a:2"]) == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_lru_bounds(backend):
+    cache = CachingKVStore(backend, KVStoreCacheConfig(max_entries=2, max_bytes=20))
+
+    await cache.set("a", "1")
+    await cache.set("b", "2")
+    await cache.get("a")
+    await cache.set("c", "3")
+    assert list(cache._entries) == ["a", "c"]
+
+    await cache.set("d", "x" * 18)
+    assert list(cache._entries) == ["d"]
+    assert cache._size == 19
+
+
+@pytest.mark.asyncio
+async def test_expiration(backend):
+    cache = CachingKVStore(backend, KVStoreCacheConfig())
+    await cache.set("key", "value", expiration=datetime.now() - timedelta(seconds=1))
+    assert await cache.get("key") is None
+    assert await backend.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_write_behind(backend):
+    cache = CachingKVStore(
+        backend, KVStoreCacheConfig(write_behind=True, write_behind_interval_ms=10_000)
+    )
+
+    await cache.set("session:1", "a")
+    await cache.set_many({"session:2": "b"})
+    assert await backend.get("session:1") is None
+    assert await cache.get("session:1") == "a"
+
+    # range queries see buffered writes
+    assert await cache.range("session:", "session:\xff") == ["a", "b"]
+    assert await backend.get("session:2") == "b"
+
+    await cache.set("session:3", "c")
+    await cache.shutdown()
+    assert await backend.get("session:3") == "c"
+
+
+@pytest.mark.asyncio
+async def test_kvstore_impl_wraps_when_configured(tmp_path):
+    store = await kvstore_impl(
+        SqliteKVStoreConfig(
+            db_path=(tmp_path / "kvstore.db").as_posix(), cache=KVStoreCacheConfig()
+        )
+    )
+    assert isinstance(store, CachingKVStore)
+    await store.set("key", "value")
+    assert await store.get("key") == "value"
+    await store.shutdown()
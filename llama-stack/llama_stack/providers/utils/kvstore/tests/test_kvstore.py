@@ -0,0 +1,131 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pytest
+import pytest_asyncio
+
+from llama_stack.providers.utils.kvstore import InmemoryKVStoreImpl, kvstore_impl
+from llama_stack.providers.utils.kvstore.api import KVStore
+from llama_stack.providers.utils.kvstore.config import (
+    KVStoreCacheConfig,
+    PostgresKVStoreConfig,
+    RedisKVStoreConfig,
+    SqliteKVStoreConfig,
+)
+
+
+class MinimalKVStore(KVStore):
+    """Only the required methods; the batch methods are the protocol's defaults."""
+
+    def __init__(self):
+        self._store: Dict[str, str] = {}
+
+    async def set(
+        self, key: str, value: str, expiration: Optional[datetime] = None
+    ) -> None:
+        self._store[key] = value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._store.get(key)
+
+    async def delete(self, key: str) -> None:
+        self._store.pop(key, None)
+
+    async def keys_in_range(self, start_key: str, end_key: str) -> List[str]:
+        return sorted(key for key in self._store if start_key <= key <= end_key)
+
+    async def range(self, start_key: str, end_key: str) -> List[str]:
+        return [
+            self._store[key] for key in await self.keys_in_range(start_key, end_key)
+        ]
+
+
+BACKENDS = ["inmemory", "minimal", "sqlite", "sqlite_cached", "redis", "postgres"]
+
+
+@pytest_asyncio.fixture(params=BACKENDS)
+async def kvstore(request, tmp_path):
+    backend = request.param
+    if backend == "inmemory":
+        yield InmemoryKVStoreImpl()
+        return
+    if backend == "minimal":
+        yield MinimalKVStore()
+        return
+
+    if backend.startswith("sqlite"):
+        config = SqliteKVStoreConfig(
+            db_path=(tmp_path / "kvstore.db").as_posix(),
+            cache=KVStoreCacheConfig() if backend == "sqlite_cached" else None,
+        )
+    elif backend == "redis":
+        if "REDIS_HOST" not in os.environ:
+            pytest.skip("REDIS_HOST is not set")
+        config = RedisKVStoreConfig(
+            host=os.environ["REDIS_HOST"],
+            port=int(os.environ.get("REDIS_PORT", 6379)),
+            namespace=f"test-{uuid.uuid4().hex}",
+        )
+    else:
+        if "POSTGRES_HOST" not in os.environ:
+            pytest.skip("POSTGRES_HOST is not set")
+        config = PostgresKVStoreConfig(
+            host=os.environ["POSTGRES_HOST"],
+            port=int(os.environ.get("POSTGRES_PORT", 5432)),
+            db=os.environ.get("POSTGRES_DB", "llamastack"),
+            user=os.environ.get("POSTGRES_USER", "postgres"),
+            password=os.environ.get("POSTGRES_PASSWORD"),
+            table_name=f"test_{uuid.uuid4().hex}",
+        )
+    store = await kvstore_impl(config)
+    await store.delete_range("", "\xff")
+    yield store
+    await store.delete_range("", "\xff")
+    await store.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_batch_methods_and_inclusive_ranges(kvstore):
+    await kvstore.set_many({f"key:{i}": str(i) for i in range(5)})
+    await kvstore.set("other", "x")
+    assert await kvstore.get_many(["key:3", "missing", "key:0"]) == ["3", None, "0"]
+
+    # both ends of a range are included
+    assert await kvstore.range("key:1", "key:3") == ["1", "2", "3"]
+    assert await kvstore.keys_in_range("key:1", "key:3") == [
+        "key:1",
+        "key:2",
+        "key:3",
+    ]
+    await kvstore.delete_range("key:1", "key:3")
+    assert await kvstore.keys_in_range("key:", "key:\xff") == ["key:0", "key:4"]
+    assert await kvstore.get("other") == "x"
+    assert await kvstore.cleanup_expired() == 0
+
+
+@pytest.mark.asyncio
+async def test_inmemory_cleanup_expired_in_batches(monkeypatch):
+    store = InmemoryKVStoreImpl()
+    expired = datetime.now() - timedelta(seconds=1)
+    await store.set_many({f"key:{i}": "x" for i in range(5)}, expiration=expired)
+    await store.set("key:kept", "x")
+
+    batches = []
+
+    async def sleep(_):
+        batches.append(len(store._store))
+        # a key that is set again meanwhile is not deleted
+        await store.set("key:4", "fresh")
+
+    monkeypatch.setattr("asyncio.sleep", sleep)
+    assert await store.cleanup_expired(batch_size=2) == 4
+    assert batches == [4, 2, 2]
+    assert await store.keys_in_range("key:", "key:\xff") == ["key:4", "key:kept"]
@@ -0,0 +1,107 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import os
+import uuid
+from fnmatch import fnmatchcase
+
+import pytest
+
+from llama_stack.providers.utils.kvstore.config import RedisKVStoreConfig
+from llama_stack.providers.utils.kvstore.redis.redis import (
+    INDEX_BUILT_KEY,
+    INDEX_KEY,
+    RedisKVStoreImpl,
+)
+
+
+class ScanRecordingRedis:
+    """Just enough of the client for _build_index, recording the SCAN patterns."""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.patterns = []
+        self.index = {}
+
+    async def scan_iter(self, match=None, count=None):
+        self.patterns.append(match)
+        for key in self.keys:
+            if fnmatchcase(key, match):
+                yield key.encode()
+
+    async def zadd(self, name, mapping):
+        self.index.setdefault(name, set()).update(mapping)
+
+    async def exists(self, key):
+        return int(key in self.keys)
+
+    async def set(self, key, value):
+        self.keys.append(key)
+
+
+@pytest.mark.asyncio
+async def test_build_index_scans_only_the_namespace():
+    store = RedisKVStoreImpl(RedisKVStoreConfig(namespace="ns"))
+    store.redis = ScanRecordingRedis(
+        ["ns:a", "ns:b", f"ns:{INDEX_KEY}", "other:c", "d"]
+    )
+    store.index_key = store._namespaced_key(INDEX_KEY)
+
+    await store._build_index()
+
+    assert store.redis.patterns == ["ns:*"]
+    assert store.redis.index == {f"ns:{INDEX_KEY}": {"a", "b"}}
+
+
+@pytest.mark.asyncio
+async def test_build_index_without_namespace_skips_other_indexes():
+    store = RedisKVStoreImpl(RedisKVStoreConfig())
+    store.redis = ScanRecordingRedis(["a", f"ns:{INDEX_KEY}", INDEX_KEY])
+    store.index_key = store._namespaced_key(INDEX_KEY)
+
+    await store._build_index()
+
+    assert store.redis.patterns == ["*"]
+    assert store.redis.index == {INDEX_KEY: {"a"}}
+
+
+@pytest.mark.asyncio
+async def test_index_is_built_once():
+    store = RedisKVStoreImpl(RedisKVStoreConfig())
+    # an empty store: redis drops the index set, so only the marker is left
+    store.redis = ScanRecordingRedis([])
+    store.index_key = store._namespaced_key(INDEX_KEY)
+
+    await store._ensure_index()
+    await store._ensure_index()
+
+    assert store.redis.patterns == ["*"]
+    assert store.redis.keys == [INDEX_BUILT_KEY]
+
+
+@pytest.mark.asyncio
+async def test_prune_index_keeps_existing_keys():
+    if "REDIS_HOST" not in os.environ:
+        pytest.skip("REDIS_HOST is not set")
+    store = RedisKVStoreImpl(
+        RedisKVStoreConfig(
+            host=os.environ["REDIS_HOST"],
+            port=int(os.environ.get("REDIS_PORT", 6379)),
+            namespace=f"test-{uuid.uuid4().hex}",
+        )
+    )
+    await store.initialize()
+    try:
+        await store.set_many({"a": "1", "b": "2"})
+        # drop the value behind the store's back, leaving its index entry
+        await store.redis.delete(store._namespaced_key("a"))
+
+        assert await store._prune_index(["a", "b"]) == 1
+        assert await store.keys_in_range("", "\xff") == ["b"]
+    finally:
+        await store.delete_range("", "\xff")
+        await store.redis.delete(store._namespaced_key(INDEX_BUILT_KEY))
+        await store.shutdown()
@@ -0,0 +1,178 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+
+from llama_stack.providers.utils.kvstore import kvstore_impl
+from llama_stack.providers.utils.kvstore.config import SqliteKVStoreConfig
+
+
+@pytest.fixture
+def config(tmp_path):
+    return SqliteKVStoreConfig(db_path=(tmp_path / "kvstore.db").as_posix())
+
+
+@pytest_asyncio.fixture(scope="function")
+async def kvstore(config):
+    store = await kvstore_impl(config)
+    yield store
+    await store.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_set_get_delete(kvstore):
+    assert await kvstore.get("missing") is None
+
+    await kvstore.set("key", "value")
+    assert await kvstore.get("key") == "value"
+
+    await kvstore.set("key", "updated")
+    assert await kvstore.get("key") == "updated"
+
+    await kvstore.delete("key")
+    assert await kvstore.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_range(kvstore):
+    for i in range(5):
+        await kvstore.set(f"session:{i}", str(i))
+    await kvstore.set("other", "x")
+
+    assert await kvstore.range("session:", "session:\xff") == [str(i) for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_wal_mode(kvstore, config):
+    await kvstore.set("key", "value")
+    conn = sqlite3.connect(config.db_path)
+    try:
+        (mode,) = conn.execute("PRAGMA journal_mode").fetchone()
+        assert mode == "wal"
+        # committed writes are visible to other connections
+        assert conn.execute("SELECT value FROM kvstore").fetchall() == [("value",)]
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_group_commit(config):
+    config.commit_window_ms = 5
+    store = await kvstore_impl(config)
+
+    await asyncio.gather(*[store.set(f"key:{i:03d}", str(i)) for i in range(100)])
+    assert store._pending_commit is None
+
+    conn = sqlite3.connect(config.db_path)
+    try:
+        (count,) = conn.execute("SELECT COUNT(*) FROM kvstore").fetchone()
+        assert count == 100
+    finally:
+        conn.close()
+
+    await store.delete("key:000")
+    assert await store.get("key:000") is None
+    await store.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_batch_operations(kvstore):
+    await kvstore.set_many({f"turn:{i:03d}": str(i) for i in range(10)})
+    await kvstore.set("other", "x")
+
+    assert await kvstore.get_many(["turn:003", "missing", "turn:001"]) == [
+        "3",
+        None,
+        "1",
+    ]
+    assert await kvstore.keys_in_range("turn:", "turn:\xff") == [
+        f"turn:{i:03d}" for i in range(10)
+    ]
+
+    await kvstore.delete_range("turn:", "turn:\xff")
+    assert await kvstore.range("turn:", "turn:\xff") == []
+    assert await kvstore.get("other") == "x"
+
+
+@pytest.mark.asyncio
+async def test_failing_batch_writes_nothing(config):
+    config.commit_window_ms = 5
+    store = await kvstore_impl(config)
+
+    # the second row cannot be bound, after the first one was inserted
+    batch = {"batch:0": "0", "batch:1": object(), "batch:2": "2"}
+    single, failed = await asyncio.gather(
+        store.set("single", "x"), store.set_many(batch), return_exceptions=True
+    )
+    assert single is None
+    assert isinstance(failed, sqlite3.Error)
+    await store.shutdown()
+
+    conn = sqlite3.connect(config.db_path)
+    try:
+        assert conn.execute("SELECT key FROM kvstore").fetchall() == [("single",)]
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_get_many_large_batch(kvstore):
+    keys = [f"key:{i:05d}" for i in range(1200)]
+    await kvstore.set_many({key: key for key in keys})
+    assert await kvstore.get_many(keys) == keys
+
+
+@pytest.mark.asyncio
+async def test_expiration(kvstore, config):
+    expired = datetime.now() - timedelta(seconds=1)
+    await kvstore.set("session:old", "old", expiration=expired)
+    await kvstore.set_many({"session:a": "a", "session:b": "b"}, expiration=expired)
+    await kvstore.set(
+        "session:new", "new", expiration=datetime.now() + timedelta(hours=1)
+    )
+    await kvstore.set("session:forever", "forever")
+
+    assert await kvstore.get("session:old") is None
+    assert await kvstore.get_many(["session:a", "session:new"]) == [None, "new"]
+    assert await kvstore.range("session:", "session:\xff") == ["forever", "new"]
+    assert await kvstore.keys_in_range("session:", "session:\xff") == [
+        "session:forever",
+        "session:new",
+    ]
+
+    assert await kvstore.cleanup_expired(batch_size=2) == 3
+    conn = sqlite3.connect(config.db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM kvstore").fetchone() == (2,)
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_expiration_sweeper_is_opt_in(kvstore):
+    assert kvstore._sweeper_task is None
+
+
+@pytest.mark.asyncio
+async def test_expiration_sweeper(tmp_path):
+    config = SqliteKVStoreConfig(
+        db_path=(tmp_path / "kvstore.db").as_posix(),
+        expiration_cleanup_interval_seconds=0.01,
+    )
+    store = await kvstore_impl(config)
+    try:
+        await store.set(
+            "key", "value", expiration=datetime.now() + timedelta(milliseconds=50)
+        )
+        await asyncio.sleep(0.2)
+        assert await store.cleanup_expired() == 0
+    finally:
+        await store.shutdown()
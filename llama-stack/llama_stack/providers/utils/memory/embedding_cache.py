@@ -0,0 +1,147 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import base64
+import hashlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+from pydantic import BaseModel, Field
+
+from llama_stack.apis.common.content_types import InterleavedContent
+from llama_stack.apis.inference import Inference
+from llama_stack.providers.utils.kvstore import KVStore, kvstore_impl
+from llama_stack.providers.utils.kvstore.config import KVStoreConfig
+from llama_stack.providers.utils.telemetry.tracing import log_metric
+
+EMBEDDING_CACHE_PREFIX = "embedding_cache:v1::"
+
+
+class EmbeddingCacheConfig(BaseModel):
+    max_entries: int = Field(
+        default=10_000,
+        description="Maximum number of embeddings held in the in-memory LRU cache",
+    )
+    kvstore: Optional[KVStoreConfig] = Field(
+        default=None,
+        description="Also persist embeddings in this store, so they outlive the process",
+    )
+
+
+class EmbeddingCache:
+    """Content addressed cache for `Inference.embeddings`.
+
+    Embeddings are keyed by the embedding model and a hash of the text, so the same
+    text is embedded once per model no matter which vector db or inference
+    provider it goes through. Only plain string contents are cached.
+    """
+
+    def __init__(self, max_entries: int = 10_000, kvstore: Optional[KVStore] = None):
+        self.max_entries = max_entries
+        self.kvstore = kvstore
+        self._entries: "OrderedDict[str, NDArray]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    async def create(cls, config: EmbeddingCacheConfig) -> "EmbeddingCache":
+        kvstore = await kvstore_impl(config.kvstore) if config.kvstore else None
+        return cls(config.max_entries, kvstore)
+
+    async def shutdown(self) -> None:
+        if self.kvstore is not None and hasattr(self.kvstore, "shutdown"):
+            await self.kvstore.shutdown()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _key(self, model_id: str, content: InterleavedContent) -> Optional[str]:
+        if not isinstance(content, str):
+            return None
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        return f"{EMBEDDING_CACHE_PREFIX}{model_id}:{digest}"
+
+    def _put(self, key: str, embedding: NDArray) -> None:
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def embed(
+        self,
+        inference_api: Inference,
+        model_id: str,
+        contents: List[InterleavedContent],
+    ) -> NDArray:
+        """Returns the embeddings of `contents`, calling `inference_api` only for misses."""
+        keys = [self._key(model_id, content) for content in contents]
+        first_index: Dict[str, int] = {}
+        for i, key in enumerate(keys):
+            if key is not None:
+                first_index.setdefault(key, i)
+
+        found: Dict[str, NDArray] = {}
+        for key in first_index:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[key] = self._entries[key]
+
+        missing = [key for key in first_index if key not in found]
+        if missing and self.kvstore is not None:
+            for key, value in zip(missing, await self.kvstore.get_many(missing)):
+                if value is not None:
+                    found[key] = np.frombuffer(
+                        base64.b64decode(value), dtype=np.float32
+                    )
+                    self._put(key, found[key])
+            missing = [key for key in missing if key not in found]
+
+        # each missing text is embedded once; contents that can't be keyed always are
+        uncached = [i for i, key in enumerate(keys) if key is None]
+        to_embed = [contents[first_index[key]] for key in missing] + [
+            contents[i] for i in uncached
+        ]
+        uncached_embeddings: Dict[int, NDArray] = {}
+        if to_embed:
+            response = await inference_api.embeddings(model_id, to_embed)
+            embeddings = [
+                np.asarray(embedding, dtype=np.float32)
+                for embedding in response.embeddings
+            ]
+            for key, embedding in zip(missing, embeddings):
+                found[key] = embedding
+                self._put(key, embedding)
+            uncached_embeddings = dict(zip(uncached, embeddings[len(missing) :]))
+            if missing and self.kvstore is not None:
+                await self.kvstore.set_many(
+                    {
+                        key: base64.b64encode(found[key].tobytes()).decode("utf-8")
+                        for key in missing
+                    }
+                )
+
+        misses = len(missing) + len(uncached)
+        self._record(model_id, hits=len(contents) - misses, misses=misses)
+        return np.stack(
+            [
+                found[key] if key is not None else uncached_embeddings[i]
+                for i, key in enumerate(keys)
+            ]
+        )
+
+    def _record(self, model_id: str, hits: int, misses: int) -> None:
+        self.hits += hits
+        self.misses += misses
+        attributes = {"model_id": model_id}
+        if hits:
+            log_metric("embedding_cache_hits", hits, "count", attributes)
+        if misses:
+            log_metric("embedding_cache_misses", misses, "count", attributes)
@@ -0,0 +1,112 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import base64
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+TERM_PATTERN = re.compile(r"\w+")
+
+
+def analyze(text: str) -> List[str]:
+    """Splits text into lowercase word terms; numbers and codes are kept as is."""
+    return TERM_PATTERN.findall(text.lower())
+
+
+def _encode(values: array) -> str:
+    return base64.b64encode(values.tobytes()).decode("utf-8")
+
+
+def _decode(data: str) -> array:
+    values = array("I")
+    values.frombytes(base64.b64decode(data))
+    return values
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over documents numbered 0, 1, 2, ... in insertion order.
+
+    Postings are append-only arrays of document ids and term frequencies, so
+    adding a document only touches the postings of its own terms.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_lengths = array("I")
+        self.total_length = 0
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, text: str) -> int:
+        doc_id = self.num_docs
+        terms = Counter(analyze(text))
+        for term, tf in terms.items():
+            ids, tfs = self.postings.setdefault(term, (array("I"), array("I")))
+            ids.append(doc_id)
+            tfs.append(tf)
+
+        length = sum(terms.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+        return doc_id
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Returns up to k (doc id, score) pairs, best first, of documents with a query term."""
+        num_docs = self.num_docs
+        terms = [term for term in set(analyze(query)) if term in self.postings]
+        if num_docs == 0 or not terms or k <= 0:
+            return []
+
+        lengths = np.asarray(self.doc_lengths, dtype=np.float64)
+        avg_length = max(self.total_length / num_docs, 1.0)
+        norms = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+
+        scores = np.zeros(num_docs)
+        for term in terms:
+            ids, tfs = self.postings[term]
+            ids = np.asarray(ids, dtype=np.int64)
+            tfs = np.asarray(tfs, dtype=np.float64)
+            df = len(ids)
+            idf = math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+            # a document appears once per term, so there are no repeated ids
+            scores[ids] += idf * tfs * (self.k1 + 1.0) / (tfs + norms[ids])
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in order]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_lengths": _encode(self.doc_lengths),
+            "postings": {
+                term: [_encode(ids), _encode(tfs)]
+                for term, (ids, tfs) in self.postings.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BM25Index":
+        index = cls(data["k1"], data["b"])
+        index.doc_lengths = _decode(data["doc_lengths"])
+        index.total_length = sum(index.doc_lengths)
+        index.postings = {
+            term: (_decode(ids), _decode(tfs))
+            for term, (ids, tfs) in data["postings"].items()
+        }
+        return index
@@ -0,0 +1,81 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import re
+
+import pytest
+from llama_models.llama3.api.tokenizer import Tokenizer
+
+from llama_stack.providers.utils.memory.vector_store import (
+    ChunkBoundary,
+    generate_chunk_id,
+    make_overlapped_chunks,
+)
+
+TEXTS = [
+    "x" * 30_000 + " " * 30_000 + "end",
+    "The quick brown fox jumps over the lazy dog. " * 100,
+    "héllo wörld, 日本語のテキスト 🙂 " * 60,
+    "<|eot_id|> looks special but is text\n\n" * 30,
+    "",
+]
+
+
+def decoded_windows(text, window_len, overlap_len):
+    tokenizer = Tokenizer.get_instance()
+    tokens = tokenizer.encode(text, bos=False, eos=False)
+    return [
+        tokenizer.decode(tokens[i : i + window_len])
+        for i in range(0, len(tokens), window_len - overlap_len)
+    ]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_token_chunks_match_decoded_windows(text):
+    chunks = make_overlapped_chunks("doc", text, 64, 16)
+    assert [c.content for c in chunks] == decoded_windows(text, 64, 16)
+    assert all(c.metadata["document_id"] == "doc" for c in chunks)
+    assert all(c.metadata["token_count"] <= 64 for c in chunks)
+
+
+@pytest.mark.parametrize(
+    "boundary, pattern",
+    [
+        (ChunkBoundary.sentence, r"[.!?]\s*$"),
+        (ChunkBoundary.paragraph, r"\n\s*$"),
+    ],
+)
+def test_boundary_chunks_end_at_boundaries(boundary, pattern):
+    paragraph = "One sentence here. Another one follows! And a question? " * 3
+    text = "\n\n".join([paragraph] * 20)
+    chunks = make_overlapped_chunks("doc", text, 64, 16, boundary)
+
+    assert all(c.metadata["token_count"] <= 64 for c in chunks)
+    # every chunk but the last ends right before a boundary
+    for chunk in chunks[:-1]:
+        assert re.search(pattern, chunk.content), chunk.content
+    # and the chunks still cover the whole text, in order
+    assert chunks[0].content.startswith("One sentence")
+    assert text.endswith(chunks[-1].content)
+
+
+def test_boundary_falls_back_to_token_windows():
+    text = "no punctuation at all " * 200
+    sentence = make_overlapped_chunks("doc", text, 64, 16, ChunkBoundary.sentence)
+    token = make_overlapped_chunks("doc", text, 64, 16)
+    assert [c.content for c in sentence] == [c.content for c in token][: len(sentence)]
+
+
+def test_chunk_ids_are_stable_and_unique():
+    first = make_overlapped_chunks("doc", TEXTS[1], 64, 16)
+    second = make_overlapped_chunks("doc", TEXTS[0], 64, 16)
+    ids = [generate_chunk_id(chunk) for chunk in first + second]
+    # chunks of separate insert calls used to share "doc:chunk-0", "doc:chunk-1", ...
+    assert len(set(ids)) == len({c.content for c in first + second})
+    assert generate_chunk_id(first[0]) == generate_chunk_id(
+        make_overlapped_chunks("doc", TEXTS[1], 64, 16)[0]
+    )
+    assert generate_chunk_id(first[0]).startswith("doc:")
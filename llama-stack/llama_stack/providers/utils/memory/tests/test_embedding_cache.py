@@ -0,0 +1,71 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import pytest
+
+from llama_stack.apis.common.content_types import TextContentItem
+from llama_stack.apis.inference import EmbeddingsResponse
+from llama_stack.providers.utils.kvstore import InmemoryKVStoreImpl
+from llama_stack.providers.utils.memory.embedding_cache import EmbeddingCache
+
+
+class FakeInference:
+    def __init__(self):
+        self.embedded = []
+
+    async def embeddings(self, model_id, contents):
+        self.embedded.append(list(contents))
+        return EmbeddingsResponse(
+            embeddings=[[float(len(str(content))), 1.0] for content in contents]
+        )
+
+
+@pytest.mark.asyncio
+async def test_embeddings_are_cached_per_model():
+    inference = FakeInference()
+    cache = EmbeddingCache(max_entries=2)
+
+    embeddings = await cache.embed(inference, "model", ["a", "bb", "a"])
+    assert embeddings.tolist() == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    # duplicate texts in a batch are embedded once
+    assert inference.embedded == [["a", "bb"]]
+
+    embeddings = await cache.embed(inference, "model", ["bb", "ccc"])
+    assert embeddings.tolist() == [[2.0, 1.0], [3.0, 1.0]]
+    assert inference.embedded[-1] == ["ccc"]
+
+    # "a" was evicted, and other models don't share entries
+    await cache.embed(inference, "model", ["a"])
+    await cache.embed(inference, "other-model", ["bb"])
+    assert inference.embedded[-2:] == [["a"], ["bb"]]
+    assert (cache.hits, cache.misses) == (2, 5)
+    assert cache.hit_rate == pytest.approx(2 / 7)
+
+
+@pytest.mark.asyncio
+async def test_embeddings_are_persisted():
+    inference = FakeInference()
+    store = InmemoryKVStoreImpl()
+    await EmbeddingCache(kvstore=store).embed(inference, "model", ["a", "bb"])
+
+    cache = EmbeddingCache(kvstore=store)
+    embeddings = await cache.embed(inference, "model", ["bb", "a"])
+    assert embeddings.tolist() == [[2.0, 1.0], [1.0, 1.0]]
+    assert len(inference.embedded) == 1
+    assert cache.hits == 2
+
+
+@pytest.mark.asyncio
+async def test_non_text_contents_are_not_cached():
+    inference = FakeInference()
+    cache = EmbeddingCache()
+    item = TextContentItem(text="a")
+
+    embeddings = await cache.embed(inference, "model", [item, "a", item])
+    assert len(embeddings) == 3
+    assert inference.embedded == [["a", item, item]]
+    await cache.embed(inference, "model", [item])
+    assert len(inference.embedded) == 2
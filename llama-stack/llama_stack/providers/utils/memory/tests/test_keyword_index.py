@@ -0,0 +1,80 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import json
+
+import pytest
+
+from llama_stack.apis.vector_io import Chunk, QueryChunksResponse
+from llama_stack.providers.utils.memory.keyword_index import analyze, BM25Index
+from llama_stack.providers.utils.memory.vector_store import reciprocal_rank_fusion
+
+DOCS = [
+    "Metformin is prescribed for type 2 diabetes.",
+    "A cardiologist treats heart conditions; see a cardiologist for chest pain.",
+    "The clinic at pincode 560001 is open on weekdays.",
+    "Insulin and metformin are both used to manage diabetes.",
+    "Dermatologists treat skin conditions.",
+]
+
+
+def make_index() -> BM25Index:
+    index = BM25Index()
+    for doc in DOCS:
+        index.add(doc)
+    return index
+
+
+def test_analyze_keeps_codes_and_numbers():
+    assert analyze("Pincode 560001, Dr. O'Brien") == [
+        "pincode",
+        "560001",
+        "dr",
+        "o",
+        "brien",
+    ]
+
+
+def test_bm25_ranks_exact_terms():
+    index = make_index()
+    assert [i for i, _ in index.search("560001", 3)] == [2]
+    assert [i for i, _ in index.search("cardiologist", 3)] == [1]
+
+    results = index.search("metformin diabetes", 5)
+    assert {i for i, _ in results} == {0, 3}
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+    assert index.search("unknown words", 3) == []
+    assert len(index.search("conditions treat", 1)) == 1
+
+
+def test_bm25_roundtrips_and_keeps_growing():
+    index = make_index()
+    restored = BM25Index.from_dict(json.loads(json.dumps(index.to_dict())))
+    assert restored.search("metformin diabetes", 5) == index.search(
+        "metformin diabetes", 5
+    )
+
+    assert restored.add("Metformin dosage for diabetes") == len(DOCS)
+    assert len(restored.search("metformin", 5)) == 3
+
+
+def test_reciprocal_rank_fusion():
+    def response(*contents):
+        return QueryChunksResponse(
+            chunks=[
+                Chunk(content=c, metadata={"document_id": "doc"}) for c in contents
+            ],
+            scores=[1.0] * len(contents),
+        )
+
+    fused = reciprocal_rank_fusion(
+        [response("a", "b", "c"), response("c", "d")], k=3, rrf_k=60
+    )
+    # c is found by both rankers; b and d tie, in the order of the rankers
+    assert [c.content for c in fused.chunks] == ["c", "a", "b"]
+    assert fused.scores == pytest.approx([1 / 63 + 1 / 61, 1 / 61, 1 / 62])
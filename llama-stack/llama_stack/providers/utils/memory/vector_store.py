@@ -4,19 +4,27 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 import base64
+import hashlib
 import io
 import logging
 import re
+import sys
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 from urllib.parse import unquote
 
 import chardet
 import httpx
 import numpy as np
 
-from llama_models.llama3.api.tokenizer import Tokenizer
+from llama_models.llama3.api.tokenizer import (
+    MAX_NO_WHITESPACES_CHARS,
+    TIKTOKEN_MAX_ENCODE_CHARS,
+    Tokenizer,
+)
 from numpy.typing import NDArray
 
 from pypdf import PdfReader
@@ -28,11 +36,16 @@ from llama_stack.apis.common.content_types import (
 )
 from llama_stack.apis.tools import RAGDocument
 from llama_stack.apis.vector_dbs import VectorDB
-from llama_stack.apis.vector_io import Chunk, QueryChunksResponse
+from llama_stack.apis.vector_io import (
+    Chunk,
+    QueryChunksBatchResponse,
+    QueryChunksResponse,
+)
 from llama_stack.providers.datatypes import Api
 from llama_stack.providers.utils.inference.prompt_adapter import (
     interleaved_content_as_str,
 )
+from llama_stack.providers.utils.memory.embedding_cache import EmbeddingCache
 
 log = logging.getLogger(__name__)
 
@@ -114,55 +127,243 @@ def concat_interleaved_content(content: List[InterleavedContent]) -> Interleaved
     return ret
 
 
-async def content_from_doc(doc: RAGDocument) -> str:
+async def _get(uri: str, client: Optional[httpx.AsyncClient]) -> httpx.Response:
+    if client is not None:
+        return await client.get(uri)
+    async with httpx.AsyncClient() as client:
+        return await client.get(uri)
+
+
+async def fetch_doc(
+    doc: RAGDocument, client: Optional[httpx.AsyncClient] = None
+) -> Union[str, bytes, URL]:
+    """Fetches `doc` without parsing it, see `parse_doc`.
+
+    Returns the text of the document, the bytes of a fetched PDF, or the data URL
+    to decode.
+    """
     if isinstance(doc.content, URL):
-        if doc.content.uri.startswith("data:"):
-            return content_from_data(doc.content.uri)
-        else:
-            async with httpx.AsyncClient() as client:
-                r = await client.get(doc.content.uri)
-            if doc.mime_type == "application/pdf":
-                return parse_pdf(r.content)
-            else:
-                return r.text
-
-    pattern = re.compile("^(https?://|file://|data:)")
-    if pattern.match(doc.content):
-        if doc.content.startswith("data:"):
-            return content_from_data(doc.content)
-        else:
-            async with httpx.AsyncClient() as client:
-                r = await client.get(doc.content)
-            if doc.mime_type == "application/pdf":
-                return parse_pdf(r.content)
-            else:
-                return r.text
+        uri = doc.content.uri
+    elif isinstance(doc.content, str) and re.match(
+        "^(https?://|file://|data:)", doc.content
+    ):
+        uri = doc.content
+    else:
+        return interleaved_content_as_str(doc.content)
+
+    if uri.startswith("data:"):
+        return URL(uri=uri)
+
+    r = await _get(uri, client)
+    if doc.mime_type == "application/pdf":
+        return r.content
+    return r.text
+
+
+def parse_doc(raw: Union[str, bytes, URL]) -> str:
+    # the CPU bound half of content_from_doc, safe to run in another process
+    if isinstance(raw, URL):
+        return content_from_data(raw.uri)
+    if isinstance(raw, bytes):
+        return parse_pdf(raw)
+    return raw
+
+
+async def content_from_doc(
+    doc: RAGDocument, client: Optional[httpx.AsyncClient] = None
+) -> str:
+    return parse_doc(await fetch_doc(doc, client))
+
+
+class ChunkBoundary(Enum):
+    token = "token"
+    sentence = "sentence"
+    paragraph = "paragraph"
+
 
-    return interleaved_content_as_str(doc.content)
+# text offsets of boundaries, at the whitespace between sentences or paragraphs
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"[.!?](?=\s)")
+
+
+def _boundary_offsets(text: str, boundary: ChunkBoundary) -> List[int]:
+    offsets = [m.start() for m in PARAGRAPH_BREAK.finditer(text)]
+    if boundary == ChunkBoundary.sentence:
+        offsets.extend(m.end() for m in SENTENCE_END.finditer(text))
+    return offsets
+
+
+@lru_cache(maxsize=None)
+def _token_byte_lengths(tokenizer: Tokenizer) -> NDArray:
+    return np.array(
+        [
+            len(tokenizer.model.decode_single_token_bytes(token))
+            for token in range(tokenizer.n_words)
+        ],
+        dtype=np.int64,
+    )
+
+
+@lru_cache(maxsize=None)
+def _whitespace_table() -> NDArray:
+    # is_space[c] for every code point up to the last whitespace one, then False
+    spaces = [c for c in range(sys.maxunicode + 1) if chr(c).isspace()]
+    table = np.zeros(max(spaces) + 2, dtype=bool)
+    table[spaces] = True
+    return table
+
+
+def _longest_run(text: str) -> int:
+    # longest run of whitespace or non-whitespace characters in text
+    table = _whitespace_table()
+    code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    is_space = table[np.minimum(code_points, len(table) - 1)]
+    changes = np.flatnonzero(is_space[1:] != is_space[:-1])
+    return int(np.diff(changes, prepend=-1, append=len(code_points) - 1).max())
+
+
+def _encode(tokenizer: Tokenizer, text: str) -> NDArray:
+    # Same tokens as tokenizer.encode(text, bos=False, eos=False). That splits
+    # every slice of the text on overly long runs with a loop over each character,
+    # which costs more than the tokenization itself and is a no-op for most text.
+    slices = [
+        text[i : i + TIKTOKEN_MAX_ENCODE_CHARS]
+        for i in range(0, len(text), TIKTOKEN_MAX_ENCODE_CHARS)
+    ]
+    if any(_longest_run(s) > MAX_NO_WHITESPACES_CHARS for s in slices):
+        return np.array(tokenizer.encode(text, bos=False, eos=False), dtype=np.int64)
+    return np.concatenate(
+        [np.zeros(0, dtype=np.int64)]
+        + [np.array(tokenizer.model.encode_ordinary(s), dtype=np.int64) for s in slices]
+    )
+
+
+def token_offsets(tokenizer: Tokenizer, text: str) -> NDArray:
+    """Tokenizes `text` and returns the offset in `text` where each token starts.
+
+    The returned array has one extra entry, `len(text)`, so token i spans
+    `text[offsets[i] : offsets[i + 1]]`. A token that starts inside a multi-byte
+    character starts at that character.
+    """
+    tokens = _encode(tokenizer, text)
+    data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    byte_offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(_token_byte_lengths(tokenizer)[tokens], out=byte_offsets[1:])
+    assert byte_offsets[-1] == len(data), "tokens do not cover the text"
+
+    if len(data) == len(text):
+        return byte_offsets
+
+    # each continuation byte (10xxxxxx) before a token start is one character less
+    continuation = np.flatnonzero((data & 0xC0) == 0x80)
+    offsets = byte_offsets - np.searchsorted(continuation, byte_offsets)
+    # a token starting on a continuation byte starts with its character
+    offsets -= np.isin(byte_offsets, continuation)
+    return offsets
+
+
+def _window_ends(
+    offsets: NDArray, boundaries: Optional[NDArray], window_len: int, overlap_len: int
+) -> Iterator[Tuple[int, int]]:
+    num_tokens = len(offsets) - 1
+    if boundaries is None:
+        for start in range(0, num_tokens, window_len - overlap_len):
+            yield start, min(start + window_len, num_tokens)
+        return
+
+    start = 0
+    while start < num_tokens:
+        end = min(start + window_len, num_tokens)
+        if end < num_tokens:
+            # end at the last boundary that still leaves room for the overlap
+            i = np.searchsorted(boundaries, end, side="right") - 1
+            if i >= 0 and boundaries[i] > start + overlap_len:
+                end = int(boundaries[i])
+        yield start, end
+        if end == num_tokens:
+            return
+        # and start the next window at the first boundary within the overlap
+        next_start = max(end - overlap_len, start + 1)
+        i = np.searchsorted(boundaries, next_start, side="left")
+        if i < len(boundaries) and boundaries[i] < end:
+            next_start = int(boundaries[i])
+        start = next_start
 
 
 def make_overlapped_chunks(
-    document_id: str, text: str, window_len: int, overlap_len: int
+    document_id: str,
+    text: str,
+    window_len: int,
+    overlap_len: int,
+    boundary: ChunkBoundary = ChunkBoundary.token,
 ) -> List[Chunk]:
+    """Returns chunks of at most `window_len` tokens of `text`, overlapping by `overlap_len`.
+
+    Chunks are sliced out of `text` by token offsets, so the text is tokenized
+    once and never decoded. With a sentence or paragraph `boundary`, windows are
+    shortened to end, and the next one to start, where a sentence or paragraph
+    does, when there is one in reach.
+    """
     tokenizer = Tokenizer.get_instance()
-    tokens = tokenizer.encode(text, bos=False, eos=False)
-
-    chunks = []
-    for i in range(0, len(tokens), window_len - overlap_len):
-        toks = tokens[i : i + window_len]
-        chunk = tokenizer.decode(toks)
-        # chunk is a string
-        chunks.append(
-            Chunk(
-                content=chunk,
-                metadata={
-                    "token_count": len(toks),
-                    "document_id": document_id,
-                },
+    offsets = token_offsets(tokenizer, text)
+
+    boundaries = None
+    if boundary != ChunkBoundary.token:
+        # the first token starting at or after each boundary
+        boundaries = np.unique(
+            np.searchsorted(
+                offsets[:-1], _boundary_offsets(text, boundary), side="left"
             )
         )
 
-    return chunks
+    return [
+        Chunk(
+            content=text[offsets[start] : offsets[end]],
+            metadata={
+                "token_count": end - start,
+                "document_id": document_id,
+            },
+        )
+        for start, end in _window_ends(offsets, boundaries, window_len, overlap_len)
+    ]
+
+
+def generate_chunk_id(chunk: Chunk) -> str:
+    """Id of a chunk for stores that key rows by id.
+
+    Derived from the document and the chunk text, so inserting a chunk again
+    overwrites it, while chunks of separate insert calls never collide.
+    """
+    content = interleaved_content_as_str(chunk.content)
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return f"{chunk.metadata.get('document_id')}:{digest}"
+
+
+# Indexes return scores where higher is more similar, so that the scores of
+# different providers can be compared and thresholded the same way:
+# - L2 distances map to 1 / (1 + distance), in (0, 1]
+# - cosine distances map to the cosine similarity, 1 - distance, in [-1, 1]
+# - inner products are returned as is
+
+
+def l2_distance_to_score(distance: float) -> float:
+    return 1.0 / (1.0 + distance)
+
+
+def score_threshold_to_l2_distance(score_threshold: float) -> float:
+    """Returns the largest L2 distance whose score is at least `score_threshold`."""
+    if score_threshold <= 0.0:
+        return float("inf")
+    return 1.0 / score_threshold - 1.0
+
+
+def cosine_distance_to_score(distance: float) -> float:
+    return 1.0 - distance
+
+
+def score_threshold_to_cosine_distance(score_threshold: float) -> float:
+    """Returns the largest cosine distance whose score is at least `score_threshold`."""
+    return 1.0 - score_threshold
 
 
 class EmbeddingIndex(ABC):
@@ -172,29 +373,89 @@ class EmbeddingIndex(ABC):
 
     @abstractmethod
     async def query(
-        self, embedding: NDArray, k: int, score_threshold: float
+        self,
+        embedding: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
     ) -> QueryChunksResponse:
+        # returns at most k chunks with a score of at least score_threshold, best first.
+        # search_params are the query_chunks params, including index specific settings
         raise NotImplementedError()
 
+    async def query_batch(
+        self,
+        embeddings: NDArray,
+        k: int,
+        score_threshold: float,
+        search_params: Optional[Dict[str, Any]] = None,
+    ) -> List[QueryChunksResponse]:
+        # indexes that can search many embeddings in one request override this
+        return [
+            await self.query(embedding, k, score_threshold, search_params)
+            for embedding in embeddings
+        ]
+
+    async def query_keyword(
+        self, query_string: str, k: int, score_threshold: float
+    ) -> QueryChunksResponse:
+        # returns at most k chunks matching the terms of query_string, best first
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support keyword search"
+        )
+
     @abstractmethod
     async def delete(self):
         raise NotImplementedError()
 
 
+def reciprocal_rank_fusion(
+    responses: List[QueryChunksResponse], k: int, rrf_k: int = 60
+) -> QueryChunksResponse:
+    """Merges ranked responses by scoring each chunk sum(1 / (rrf_k + rank)).
+
+    Scores of different retrievers are not comparable, ranks are. A chunk found
+    by several retrievers is identified by its document and content.
+    """
+    fused: Dict[Tuple[Any, str], List] = {}
+    for response in responses:
+        for rank, chunk in enumerate(response.chunks, start=1):
+            key = (
+                chunk.metadata.get("document_id"),
+                interleaved_content_as_str(chunk.content),
+            )
+            entry = fused.setdefault(key, [chunk, 0.0])
+            entry[1] += 1.0 / (rrf_k + rank)
+
+    best = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)[:k]
+    return QueryChunksResponse(
+        chunks=[chunk for chunk, _ in best], scores=[score for _, score in best]
+    )
+
+
 @dataclass
 class VectorDBWithIndex:
     vector_db: VectorDB
     index: EmbeddingIndex
     inference_api: Api.inference
+    embedding_cache: Optional[EmbeddingCache] = None
+
+    async def _embed(self, contents: List[InterleavedContent]) -> NDArray:
+        if self.embedding_cache is not None:
+            return await self.embedding_cache.embed(
+                self.inference_api, self.vector_db.embedding_model, contents
+            )
+
+        embeddings_response = await self.inference_api.embeddings(
+            self.vector_db.embedding_model, contents
+        )
+        return np.array(embeddings_response.embeddings, dtype=np.float32)
 
     async def insert_chunks(
         self,
         chunks: List[Chunk],
     ) -> None:
-        embeddings_response = await self.inference_api.embeddings(
-            self.vector_db.embedding_model, [x.content for x in chunks]
-        )
-        embeddings = np.array(embeddings_response.embeddings)
+        embeddings = await self._embed([x.content for x in chunks])
 
         await self.index.add_chunks(chunks, embeddings)
 
@@ -203,14 +464,56 @@ class VectorDBWithIndex:
         query: InterleavedContent,
         params: Optional[Dict[str, Any]] = None,
     ) -> QueryChunksResponse:
+        responses = await self.query_chunks_batch([query], params)
+        return responses.data[0]
+
+    async def query_chunks_batch(
+        self,
+        queries: List[InterleavedContent],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> QueryChunksBatchResponse:
+        # params["mode"] is one of RAGSearchMode's values:
+        # - vector: nearest neighbors of the query embedding
+        # - keyword: BM25 over the chunk text, score_threshold applies to BM25 scores
+        # - hybrid: both, fused by rank; score_threshold only filters the vector
+        #   results and the returned scores are fusion scores
         if params is None:
             params = {}
         k = params.get("max_chunks", 3)
         score_threshold = params.get("score_threshold", 0.0)
+        mode = params.get("mode", "vector")
+        if mode not in ("vector", "keyword", "hybrid"):
+            raise ValueError(f"Unknown search mode {mode}")
+        if not queries:
+            return QueryChunksBatchResponse(data=[])
+
+        query_strs = [interleaved_content_as_str(query) for query in queries]
+        if mode == "keyword":
+            return QueryChunksBatchResponse(
+                data=[
+                    await self.index.query_keyword(query_str, k, score_threshold)
+                    for query_str in query_strs
+                ]
+            )
 
-        query_str = interleaved_content_as_str(query)
-        embeddings_response = await self.inference_api.embeddings(
-            self.vector_db.embedding_model, [query_str]
+        query_vectors = await self._embed(query_strs)
+        vector_responses = await self.index.query_batch(
+            query_vectors, k, score_threshold, params
+        )
+        if mode == "vector":
+            return QueryChunksBatchResponse(data=vector_responses)
+
+        rrf_k = params.get("rrf_k", 60)
+        return QueryChunksBatchResponse(
+            data=[
+                reciprocal_rank_fusion(
+                    [
+                        vector_response,
+                        await self.index.query_keyword(query_str, k, 0.0),
+                    ],
+                    k,
+                    rrf_k,
+                )
+                for query_str, vector_response in zip(query_strs, vector_responses)
+            ]
         )
-        query_vector = np.array(embeddings_response.embeddings[0], dtype=np.float32)
-        return await self.index.query(query_vector, k, score_threshold)
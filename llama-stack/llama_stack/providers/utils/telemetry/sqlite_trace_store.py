@@ -4,13 +4,196 @@
 # This source code is licensed under the terms described in the LICENSE file in
 # the root directory of this source tree.
 
+import base64
 import json
+import re
+import sqlite3
+import zlib
 from datetime import datetime
-from typing import Dict, List, Optional, Protocol
+from enum import Enum
+from typing import Any, Dict, List, Optional, Protocol
 
 import aiosqlite
 
-from llama_stack.apis.telemetry import QueryCondition, Span, SpanWithStatus, Trace
+from llama_stack.apis.telemetry import (
+    DEFAULT_TTL_DAYS,
+    QueryCondition,
+    Span,
+    SpanWithStatus,
+    Trace,
+)
+
+# span attributes trace queries filter on the most; each gets an indexed column
+DEFAULT_INDEXED_ATTRIBUTES = ["session_id"]
+
+COMPRESSED_PREFIX = "zlib+b64:"
+TRUNCATED_SUFFIX = "...[truncated]"
+
+
+class LargeAttributePolicy(Enum):
+    # values past the limit are cut, and end with TRUNCATED_SUFFIX
+    truncate = "truncate"
+    # values past the limit are stored compressed, and read back whole
+    compress = "compress"
+
+
+def compact_attributes(
+    attributes: Dict[str, Any], max_length: int, policy: LargeAttributePolicy
+) -> Dict[str, Any]:
+    """Caps the string attribute values that are longer than max_length characters."""
+    compacted = {}
+    for key, value in attributes.items():
+        if isinstance(value, str) and len(value) > max_length:
+            if policy == LargeAttributePolicy.compress:
+                value = COMPRESSED_PREFIX + base64.b64encode(
+                    zlib.compress(value.encode("utf-8"))
+                ).decode("ascii")
+            else:
+                value = value[:max_length] + TRUNCATED_SUFFIX
+        compacted[key] = value
+    return compacted
+
+
+def expand_attributes(attributes: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Inverse of compact_attributes for compressed values."""
+    if not attributes:
+        return attributes
+    return {
+        key: (
+            zlib.decompress(base64.b64decode(value[len(COMPRESSED_PREFIX) :])).decode(
+                "utf-8"
+            )
+            if isinstance(value, str) and value.startswith(COMPRESSED_PREFIX)
+            else value
+        )
+        for key, value in attributes.items()
+    }
+
+
+def attribute_column(key: str) -> str:
+    if not re.fullmatch(r"\w+", key):
+        raise ValueError(f"Cannot index span attribute {key!r}")
+    return f"attr_{key}"
+
+
+def create_trace_tables(
+    conn: sqlite3.Connection, indexed_attributes: Optional[List[str]] = None
+) -> None:
+    """Creates the trace tables and indexes, and adds columns for new indexed attributes."""
+    # only takes effect on a new database; lets retention give pages back to the
+    # file system a batch at a time, where VACUUM would rewrite the whole file
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # readers do not wait for the writer, and the writer does not wait for readers
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS traces (
+            trace_id TEXT PRIMARY KEY,
+            service_name TEXT,
+            root_span_id TEXT,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS spans (
+            span_id TEXT PRIMARY KEY,
+            trace_id TEXT REFERENCES traces(trace_id),
+            parent_span_id TEXT,
+            name TEXT,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            attributes TEXT,
+            status TEXT,
+            kind TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS span_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            span_id TEXT REFERENCES spans(span_id),
+            name TEXT,
+            timestamp TIMESTAMP,
+            attributes TEXT
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_traces_created_at ON traces(created_at);
+        CREATE INDEX IF NOT EXISTS idx_spans_trace_id ON spans(trace_id);
+        CREATE INDEX IF NOT EXISTS idx_spans_parent_span_id ON spans(parent_span_id);
+        CREATE INDEX IF NOT EXISTS idx_span_events_span_id ON span_events(span_id);
+        """
+    )
+
+    trace_columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(traces)")}
+    if "expires_at" not in trace_columns:
+        # traces stored before retention was enforced expire after the default ttl
+        conn.execute("ALTER TABLE traces ADD COLUMN expires_at TIMESTAMP")
+        conn.execute(
+            "UPDATE traces SET expires_at = strftime('%Y-%m-%dT%H:%M:%f', end_time, ?)",
+            (f"+{DEFAULT_TTL_DAYS} days",),
+        )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_traces_expires_at ON traces(expires_at)"
+    )
+
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(spans)")}
+    for key in indexed_attributes or []:
+        column = attribute_column(key)
+        if column not in columns:
+            # virtual, so existing rows need no rewrite; only the index stores values
+            conn.execute(
+                f"""
+                ALTER TABLE spans ADD COLUMN {column}
+                GENERATED ALWAYS AS (json_extract(attributes, '$.{key}')) VIRTUAL
+                """
+            )
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_spans_{column} ON spans({column})"
+        )
+    conn.commit()
+
+
+def delete_expired_traces(
+    conn: sqlite3.Connection, now: datetime, batch_size: int = 1000
+) -> int:
+    """Deletes the traces that expired by `now`, with their spans and span events.
+
+    Every batch of traces is deleted in its own transaction, so span writes are
+    not held up for long, and the pages it frees are returned to the file system.
+    Returns the number of traces deleted.
+    """
+    deleted = 0
+    while True:
+        trace_ids = [
+            row[0]
+            for row in conn.execute(
+                "SELECT trace_id FROM traces WHERE expires_at <= ? LIMIT ?",
+                (now.isoformat(), batch_size),
+            )
+        ]
+        if not trace_ids:
+            return deleted
+
+        placeholders = ", ".join("?" * len(trace_ids))
+        with conn:
+            conn.execute(
+                f"""
+                DELETE FROM span_events WHERE span_id IN (
+                    SELECT span_id FROM spans WHERE trace_id IN ({placeholders})
+                )
+                """,
+                trace_ids,
+            )
+            conn.execute(
+                f"DELETE FROM spans WHERE trace_id IN ({placeholders})", trace_ids
+            )
+            conn.execute(
+                f"DELETE FROM traces WHERE trace_id IN ({placeholders})", trace_ids
+            )
+        conn.execute("PRAGMA incremental_vacuum").fetchall()
+        deleted += len(trace_ids)
+        if len(trace_ids) < batch_size:
+            return deleted
 
 
 class TraceStore(Protocol):
@@ -31,8 +214,12 @@ class TraceStore(Protocol):
 
 
 class SQLiteTraceStore(TraceStore):
-    def __init__(self, conn_string: str):
+    def __init__(
+        self, conn_string: str, indexed_attributes: Optional[List[str]] = None
+    ):
         self.conn_string = conn_string
+        # must match the columns the span processor created
+        self.indexed_attributes = set(indexed_attributes or [])
 
     async def query_traces(
         self,
@@ -47,10 +234,13 @@ class SQLiteTraceStore(TraceStore):
 
             ops_map = {"eq": "=", "ne": "!=", "gt": ">", "lt": "<"}
 
-            conditions = [
-                f"json_extract(s.attributes, '$.{condition.key}') {ops_map[condition.op.value]} ?"
-                for condition in attribute_filters
-            ]
+            conditions = []
+            for condition in attribute_filters:
+                if condition.key in self.indexed_attributes:
+                    column = f"s.{attribute_column(condition.key)}"
+                else:
+                    column = f"json_extract(s.attributes, '$.{condition.key}')"
+                conditions.append(f"{column} {ops_map[condition.op.value]} ?")
             params = [condition.value for condition in attribute_filters]
             where_clause = " WHERE " + " AND ".join(conditions)
             return where_clause, params
@@ -66,23 +256,17 @@ class SQLiteTraceStore(TraceStore):
                 order_clauses.append(f"t.{clean_field} {'DESC' if desc else 'ASC'}")
             return " ORDER BY " + ", ".join(order_clauses)
 
-        # Build the main query
+        # Build the main query. Traces with a matching span are found through the
+        # span indexes; there is no need to join the spans of every trace.
         base_query = """
-            WITH matching_traces AS (
-                SELECT DISTINCT t.trace_id
-                FROM traces t
-                JOIN spans s ON t.trace_id = s.trace_id
+            SELECT t.trace_id, t.root_span_id, t.start_time, t.end_time
+            FROM traces t
+            WHERE t.trace_id IN (
+                SELECT s.trace_id
+                FROM spans s
                 {where_clause}
-            ),
-            filtered_traces AS (
-                SELECT t.trace_id, t.root_span_id, t.start_time, t.end_time
-                FROM matching_traces mt
-                JOIN traces t ON mt.trace_id = t.trace_id
-                LEFT JOIN spans s ON t.trace_id = s.trace_id
-                {order_clause}
             )
-            SELECT DISTINCT trace_id, root_span_id, start_time, end_time
-            FROM filtered_traces
+            {order_clause}
             LIMIT {limit} OFFSET {offset}
         """
 
@@ -160,7 +344,9 @@ class SQLiteTraceStore(TraceStore):
                         name=row["name"],
                         start_time=datetime.fromisoformat(row["start_time"]),
                         end_time=datetime.fromisoformat(row["end_time"]),
-                        attributes=json.loads(row["filtered_attributes"]),
+                        attributes=expand_attributes(
+                            json.loads(row["filtered_attributes"])
+                        ),
                         status=row["status"].lower(),
                     )
 
@@ -186,4 +372,11 @@ class SQLiteTraceStore(TraceStore):
                 row = await cursor.fetchone()
                 if row is None:
                     raise ValueError(f"Span {span_id} not found")
-                return Span(**row)
+                return Span(
+                    **{
+                        **dict(row),
+                        "attributes": expand_attributes(
+                            json.loads(row["attributes"] or "{}")
+                        ),
+                    }
+                )
@@ -0,0 +1,127 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import asyncio
+import threading
+
+import pytest
+
+from llama_stack.providers.utils.telemetry.tracing import (
+    BackgroundLogger,
+    BackgroundLoggerConfig,
+)
+
+
+class FakeTelemetry:
+    def __init__(self):
+        self.batches = []
+        self.loops = set()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    async def log_events(self, events, ttl_seconds: int = 0):
+        self.loops.add(id(asyncio.get_running_loop()))
+        self.entered.set()
+        self.release.wait()
+        self.batches.append(list(events))
+
+
+def make_logger(api, **config) -> BackgroundLogger:
+    return BackgroundLogger(api, BackgroundLoggerConfig(**config))
+
+
+def test_batches_by_size_on_one_loop():
+    api = FakeTelemetry()
+    logger = make_logger(api, max_batch_size=100, max_batch_delay_seconds=10)
+    for i in range(1000):
+        logger.log_event(i)
+    logger.flush()
+    logger.shutdown()
+
+    assert [event for batch in api.batches for event in batch] == list(range(1000))
+    assert all(len(batch) <= 100 for batch in api.batches)
+    assert len(api.loops) == 1
+    assert logger.logged_events == 1000
+    assert not logger.worker_thread.is_alive()
+
+
+def test_batches_by_time_window():
+    api = FakeTelemetry()
+    logger = make_logger(api, max_batch_delay_seconds=0.05)
+    for i in range(3):
+        logger.log_event(i)
+    logger.flush()
+    assert api.batches == [[0, 1, 2]]
+    logger.shutdown()
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [("drop_newest", [[0], [1, 2]]), ("drop_oldest", [[0], [2, 3]])],
+)
+def test_overflow_policies(policy, expected):
+    api = FakeTelemetry()
+    api.release.clear()
+    logger = make_logger(
+        api, capacity=2, overflow_policy=policy, max_batch_delay_seconds=0
+    )
+    logger.log_event(0)
+    # the worker holds event 0 while the provider is stuck
+    assert api.entered.wait(5)
+    for i in range(1, 4):
+        logger.log_event(i)
+    assert logger.dropped_events == 1
+
+    api.release.set()
+    logger.flush()
+    assert api.batches == expected
+    logger.shutdown()
+
+
+def test_block_policy_waits_then_drops():
+    api = FakeTelemetry()
+    api.release.clear()
+    logger = make_logger(
+        api,
+        capacity=1,
+        overflow_policy="block",
+        block_timeout_seconds=0.01,
+        max_batch_delay_seconds=0,
+    )
+    logger.log_event(0)
+    assert api.entered.wait(5)
+    logger.log_event(1)
+    logger.log_event(2)
+    assert logger.dropped_events == 1
+
+    api.release.set()
+    logger.flush()
+    assert api.batches == [[0], [1]]
+    logger.shutdown()
+
+
+def test_falls_back_to_log_event_and_counts_failures():
+    class SingleEventTelemetry:
+        def __init__(self):
+            self.events = []
+
+        async def log_event(self, event, ttl_seconds: int = 0):
+            if event == "bad":
+                raise ValueError(event)
+            self.events.append(event)
+
+    api = SingleEventTelemetry()
+    logger = make_logger(api, max_batch_delay_seconds=0)
+    logger.log_event("good")
+    logger.flush()
+    logger.log_event("bad")
+    logger.flush()
+    logger.shutdown()
+
+    assert api.events == ["good"]
+    assert logger.logged_events == 1
+    assert logger.failed_events == 1
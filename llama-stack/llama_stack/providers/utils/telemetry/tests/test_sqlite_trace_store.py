@@ -0,0 +1,185 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from llama_stack.apis.telemetry import QueryCondition
+from llama_stack.providers.utils.telemetry.sqlite_trace_store import (
+    compact_attributes,
+    create_trace_tables,
+    delete_expired_traces,
+    expand_attributes,
+    LargeAttributePolicy,
+    SQLiteTraceStore,
+)
+
+
+def insert_trace(conn, trace_id: str, session_id: str, start: int):
+    conn.execute(
+        "INSERT INTO traces (trace_id, root_span_id, start_time, end_time) VALUES (?, ?, ?, ?)",
+        (
+            trace_id,
+            f"{trace_id}-0",
+            f"2025-01-01T00:00:{start:02d}",
+            "2025-01-01T00:01:00",
+        ),
+    )
+    # a chain of spans; only the innermost has the session id
+    for depth in range(3):
+        conn.execute(
+            """
+            INSERT INTO spans (span_id, trace_id, parent_span_id, name, start_time, end_time, attributes, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'OK')
+            """,
+            (
+                f"{trace_id}-{depth}",
+                trace_id,
+                f"{trace_id}-{depth - 1}" if depth else None,
+                f"span-{depth}",
+                f"2025-01-01T00:00:{start:02d}",
+                "2025-01-01T00:01:00",
+                json.dumps(
+                    {
+                        "depth": depth,
+                        **({"session_id": session_id} if depth == 2 else {}),
+                    }
+                ),
+            ),
+        )
+
+
+def query_plan(conn, query: str, params=()) -> str:
+    return " ".join(
+        row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)
+    )
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "trace_store.db")
+    conn = sqlite3.connect(path)
+    create_trace_tables(conn, ["session_id"])
+    for i in range(6):
+        insert_trace(conn, f"trace{i}", f"session{i % 2}", i)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.mark.asyncio
+async def test_query_traces_by_indexed_and_other_attributes(db_path):
+    store = SQLiteTraceStore(db_path, ["session_id"])
+    traces = await store.query_traces(
+        attribute_filters=[QueryCondition(key="session_id", op="eq", value="session1")],
+        order_by=["-start_time"],
+    )
+    assert [trace.trace_id for trace in traces] == ["trace5", "trace3", "trace1"]
+
+    traces = await store.query_traces(
+        attribute_filters=[QueryCondition(key="depth", op="gt", value=1)],
+        order_by=["start_time"],
+        limit=2,
+        offset=1,
+    )
+    assert [trace.trace_id for trace in traces] == ["trace1", "trace2"]
+
+    tree = await store.get_span_tree("trace4-0", max_depth=2)
+    assert list(tree) == ["trace4-0", "trace4-1"]
+
+
+def test_trace_queries_use_indexes(db_path):
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert "idx_spans_attr_session_id" in query_plan(
+        conn, "SELECT trace_id FROM spans WHERE attr_session_id = ?", ("session1",)
+    )
+    assert "idx_spans_parent_span_id" in query_plan(
+        conn, "SELECT * FROM spans WHERE parent_span_id = ?", ("trace1-0",)
+    )
+    assert "idx_spans_trace_id" in query_plan(
+        conn, "SELECT * FROM spans WHERE trace_id = ?", ("trace1",)
+    )
+
+
+def test_new_indexed_attributes_are_added_to_existing_tables(db_path):
+    conn = sqlite3.connect(db_path)
+    create_trace_tables(conn, ["session_id", "depth"])
+    assert conn.execute(
+        "SELECT count(*) FROM spans WHERE attr_depth = 2"
+    ).fetchone() == (6,)
+    assert "idx_spans_attr_depth" in query_plan(
+        conn, "SELECT trace_id FROM spans WHERE attr_depth = 2"
+    )
+
+    with pytest.raises(ValueError):
+        create_trace_tables(conn, ["session_id') --"])
+
+
+def test_compact_attributes():
+    attributes = {"input": "x" * 100, "short": "y", "count": 3}
+    compressed = compact_attributes(attributes, 10, LargeAttributePolicy.compress)
+    assert compressed["input"] != attributes["input"] and len(compressed["input"]) < 100
+    assert compressed["short"] == "y" and compressed["count"] == 3
+    assert expand_attributes(compressed) == attributes
+
+    truncated = compact_attributes(attributes, 10, LargeAttributePolicy.truncate)
+    assert truncated["input"] == "x" * 10 + "...[truncated]"
+    assert expand_attributes(truncated) == truncated
+
+
+def test_delete_expired_traces(db_path):
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA auto_vacuum").fetchone() == (2,)
+    conn.execute(
+        "UPDATE traces SET expires_at = CASE WHEN trace_id < 'trace4' THEN ? ELSE ? END",
+        ("2025-01-01T00:00:00", "2025-03-01T00:00:00"),
+    )
+    conn.execute(
+        "INSERT INTO span_events (span_id, name, timestamp, attributes) VALUES ('trace0-1', 'log', '', '{}')"
+    )
+    conn.commit()
+
+    assert delete_expired_traces(conn, datetime(2025, 2, 1), batch_size=3) == 4
+    assert [row[0] for row in conn.execute("SELECT trace_id FROM traces")] == [
+        "trace4",
+        "trace5",
+    ]
+    assert conn.execute(
+        "SELECT DISTINCT trace_id FROM spans ORDER BY 1"
+    ).fetchall() == [
+        ("trace4",),
+        ("trace5",),
+    ]
+    assert conn.execute("SELECT count(*) FROM span_events").fetchone() == (0,)
+
+
+def test_existing_traces_get_the_default_ttl(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "legacy.db"))
+    conn.execute(
+        """
+        CREATE TABLE traces (
+            trace_id TEXT PRIMARY KEY,
+            service_name TEXT,
+            root_span_id TEXT,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        "INSERT INTO traces (trace_id, end_time) VALUES ('old', '2025-01-01T12:00:00.250000')"
+    )
+    create_trace_tables(conn)
+    assert conn.execute("SELECT expires_at FROM traces").fetchone() == (
+        "2025-01-08T12:00:00.250",
+    )
+    assert delete_expired_traces(conn, datetime(2025, 1, 8, 12)) == 0
+    assert delete_expired_traces(conn, datetime(2025, 1, 8, 12, 0, 1)) == 1
@@ -0,0 +1,180 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+import asyncio
+import random
+from collections import Counter, defaultdict
+
+import pytest
+
+from llama_stack.apis.telemetry import SpanEndPayload, SpanStartPayload
+from llama_stack.providers.utils.telemetry import tracing
+from llama_stack.providers.utils.telemetry.trace_protocol import trace_protocol
+
+NUM_REQUESTS = 500
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.events = []
+
+    def log_event(self, event):
+        self.events.append(event)
+
+
+async def pause():
+    await asyncio.sleep(random.random() * 0.001)
+
+
+@tracing.span("decorated")
+async def decorated(request: int):
+    await pause()
+    tracing.get_current_span().set_attribute("request", request)
+
+
+async def stream(request: int):
+    async with tracing.span("stream", {"request": request}):
+        for item in range(3):
+            await pause()
+            yield item
+
+
+async def subtask(request: int, j: int):
+    with tracing.span("subtask", {"request": request, "j": j}):
+        await pause()
+        with tracing.span("leaf", {"request": request, "j": j}):
+            await pause()
+
+
+async def handle_request(request: int):
+    await tracing.start_trace(f"request-{request}", {"request": request})
+    try:
+        with tracing.span("handler", {"request": request}):
+            await pause()
+            async for _ in stream(request):
+                await pause()
+            await asyncio.gather(subtask(request, 0), subtask(request, 1))
+            await decorated(request)
+    finally:
+        await tracing.end_trace()
+
+
+@pytest.mark.asyncio
+async def test_trace_trees_are_isolated_between_concurrent_requests(monkeypatch):
+    logger = RecordingLogger()
+    monkeypatch.setattr(tracing, "BACKGROUND_LOGGER", logger)
+
+    await asyncio.gather(*(handle_request(i) for i in range(NUM_REQUESTS)))
+    assert tracing.CURRENT_TRACE_CONTEXT.get() is None
+    assert tracing.get_current_span() is None
+
+    starts = defaultdict(dict)
+    ends = Counter()
+    for event in logger.events:
+        if isinstance(event.payload, SpanStartPayload):
+            starts[event.trace_id][event.span_id] = event
+        elif isinstance(event.payload, SpanEndPayload):
+            ends[(event.trace_id, event.span_id)] += 1
+    assert len(starts) == NUM_REQUESTS
+
+    expected_parents = {
+        "handler": "request",
+        "stream": "handler",
+        "subtask": "handler",
+        "leaf": "subtask",
+        "decorated": "handler",
+    }
+    requests = set()
+    for trace_id, spans in starts.items():
+        (root,) = [
+            span for span in spans.values() if span.payload.parent_span_id is None
+        ]
+        request = root.attributes["request"]
+        requests.add(request)
+        assert root.payload.name == f"request-{request}"
+        assert Counter(span.payload.name for span in spans.values()) == {
+            f"request-{request}": 1,
+            "handler": 1,
+            "stream": 1,
+            "subtask": 2,
+            "leaf": 2,
+            "decorated": 1,
+        }
+
+        for span_id, span in spans.items():
+            assert ends[(trace_id, span_id)] == 1
+            # decorated spans get their attributes once they have started
+            if span.payload.name != "decorated":
+                assert span.attributes["request"] == request
+            if span is root:
+                continue
+            parent = spans[span.payload.parent_span_id]
+            assert (
+                parent.payload.name.split("-")[0] == expected_parents[span.payload.name]
+            )
+            if span.payload.name == "leaf":
+                assert span.attributes["j"] == parent.attributes["j"]
+    assert requests == set(range(NUM_REQUESTS))
+
+
+class CountingArgument:
+    def __init__(self):
+        self.serialized = 0
+
+    def __str__(self):
+        self.serialized += 1
+        return "argument"
+
+
+@trace_protocol
+class Protocol:
+    async def run(self, argument: CountingArgument) -> str:
+        pass
+
+
+class Impl(Protocol):
+    async def run(self, argument: CountingArgument) -> str:
+        with tracing.span("inner") as span:
+            span.set_attribute("input", tracing.LazyAttribute(argument))
+        return "done"
+
+
+@pytest.mark.asyncio
+async def test_attributes_are_serialized_only_when_exported(monkeypatch):
+    logger = RecordingLogger()
+    monkeypatch.setattr(tracing, "BACKGROUND_LOGGER", logger)
+    argument = CountingArgument()
+
+    # without a trace nothing is serialized, nor are spans created
+    assert await Impl().run(argument) == "done"
+    assert argument.serialized == 0 and logger.events == []
+
+    await tracing.start_trace("request")
+    try:
+        assert await Impl().run(argument) == "done"
+    finally:
+        await tracing.end_trace()
+    assert argument.serialized == 0
+
+    ends = {
+        event.span_id: event
+        for event in logger.events
+        if isinstance(event.payload, SpanEndPayload)
+    }
+    assert len(ends) == 3
+    attributes = [
+        event.model_dump(mode="json")["attributes"] for event in ends.values()
+    ]
+    assert {"__args__": "{'argument': 'argument'}"}.items() <= attributes[1].items()
+    assert attributes[1]["output"] == "done"
+    assert attributes[0]["input"] == "argument"
+    assert argument.serialized == 2
+
+
+def test_lazy_attribute_only_calls_factories():
+    # a traced method may well return a callable; it is serialized, never called
+    assert tracing.LazyAttribute(len).resolve() == str(len)
+    assert tracing.LazyAttribute.from_factory(lambda: [1, None]).resolve() == [1, ""]
@@ -7,9 +7,10 @@
 import asyncio
 import inspect
 from functools import wraps
-from typing import Any, AsyncGenerator, Callable, Type, TypeVar
+from typing import Any, AsyncGenerator, Callable, Dict, Type, TypeVar
 
 from pydantic import BaseModel
+from pydantic_core import core_schema, SchemaSerializer
 
 T = TypeVar("T")
 
@@ -32,6 +33,51 @@ def serialize_value(value: Any) -> Any:
         return str(value)
 
 
+class LazyAttribute:
+    """A span attribute that is only serialized if its span gets exported.
+
+    Wraps a value that goes through serialize_value when the telemetry provider
+    records the span instead of when the attribute is set, or with `from_factory`
+    a callable producing it. Unsampled spans and requests without a trace never
+    pay for it. The value is read late and from another thread, so pass a copy of
+    anything that is mutated afterwards.
+    """
+
+    __slots__ = ("value", "factory")
+
+    def __init__(self, value: Any):
+        self.value = value
+        self.factory = None
+
+    @classmethod
+    def from_factory(cls, factory: Callable[[], Any]) -> "LazyAttribute":
+        attribute = cls(None)
+        attribute.factory = factory
+        return attribute
+
+    def resolve(self) -> Any:
+        value = self.value if self.factory is None else self.factory()
+        return serialize_value(value)
+
+
+# events that are dumped before reaching the provider carry the serialized value
+LazyAttribute.__pydantic_serializer__ = SchemaSerializer(
+    core_schema.any_schema(
+        serialization=core_schema.plain_serializer_function_ser_schema(
+            LazyAttribute.resolve
+        )
+    )
+)
+
+
+def resolve_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """Serializes the LazyAttribute values of a span's attributes."""
+    return {
+        key: value.resolve() if isinstance(value, LazyAttribute) else value
+        for key, value in attributes.items()
+    }
+
+
 def trace_protocol(cls: Type[T]) -> Type[T]:
     """
     A class decorator that automatically traces all methods in a protocol/base class
@@ -41,30 +87,33 @@ def trace_protocol(cls: Type[T]) -> Type[T]:
     def trace_method(method: Callable) -> Callable:
         is_async = asyncio.iscoroutinefunction(method)
         is_async_gen = inspect.isasyncgenfunction(method)
+        span_type = (
+            "async_generator" if is_async_gen else "async" if is_async else "sync"
+        )
+        param_names = list(inspect.signature(method).parameters.keys())[
+            1:
+        ]  # Skip 'self'
 
         def create_span_context(self: Any, *args: Any, **kwargs: Any) -> tuple:
             class_name = self.__class__.__name__
             method_name = method.__name__
-            span_type = (
-                "async_generator" if is_async_gen else "async" if is_async else "sync"
-            )
-            sig = inspect.signature(method)
-            param_names = list(sig.parameters.keys())[1:]  # Skip 'self'
             combined_args = {}
             for i, arg in enumerate(args):
                 param_name = (
                     param_names[i] if i < len(param_names) else f"position_{i + 1}"
                 )
-                combined_args[param_name] = serialize_value(arg)
+                combined_args[param_name] = arg
             for k, v in kwargs.items():
-                combined_args[str(k)] = serialize_value(v)
+                combined_args[str(k)] = v
 
             span_attributes = {
                 "__autotraced__": True,
                 "__class__": class_name,
                 "__method__": method_name,
                 "__type__": span_type,
-                "__args__": str(combined_args),
+                "__args__": LazyAttribute.from_factory(
+                    lambda: str(serialize_value(combined_args))
+                ),
             }
 
             return class_name, method_name, span_attributes
@@ -75,6 +124,11 @@ def trace_protocol(cls: Type[T]) -> Type[T]:
         ) -> AsyncGenerator:
             from llama_stack.providers.utils.telemetry import tracing
 
+            if tracing.CURRENT_TRACE_CONTEXT.get() is None:
+                async for item in method(self, *args, **kwargs):
+                    yield item
+                return
+
             class_name, method_name, span_attributes = create_span_context(
                 self, *args, **kwargs
             )
@@ -92,6 +146,9 @@ def trace_protocol(cls: Type[T]) -> Type[T]:
         async def async_wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
             from llama_stack.providers.utils.telemetry import tracing
 
+            if tracing.CURRENT_TRACE_CONTEXT.get() is None:
+                return await method(self, *args, **kwargs)
+
             class_name, method_name, span_attributes = create_span_context(
                 self, *args, **kwargs
             )
@@ -99,7 +156,7 @@ def trace_protocol(cls: Type[T]) -> Type[T]:
             with tracing.span(f"{class_name}.{method_name}", span_attributes) as span:
                 try:
                     result = await method(self, *args, **kwargs)
-                    span.set_attribute("output", serialize_value(result))
+                    span.set_attribute("output", LazyAttribute(result))
                     return result
                 except Exception as e:
                     span.set_attribute("error", str(e))
@@ -109,6 +166,9 @@ def trace_protocol(cls: Type[T]) -> Type[T]:
         def sync_wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
             from llama_stack.providers.utils.telemetry import tracing
 
+            if tracing.CURRENT_TRACE_CONTEXT.get() is None:
+                return method(self, *args, **kwargs)
+
             class_name, method_name, span_attributes = create_span_context(
                 self, *args, **kwargs
             )
@@ -116,7 +176,7 @@ def trace_protocol(cls: Type[T]) -> Type[T]:
             with tracing.span(f"{class_name}.{method_name}", span_attributes) as span:
                 try:
                     result = method(self, *args, **kwargs)
-                    span.set_attribute("output", serialize_value(result))
+                    span.set_attribute("output", LazyAttribute(result))
                     return result
                 except Exception as _e:
                     raise
@@ -5,17 +5,26 @@
 # the root directory of this source tree.
 
 import asyncio
+import atexit
 import base64
+import contextvars
 import logging
+import os
 import queue
 import threading
-import uuid
+import time
+import traceback
 from datetime import datetime
+from enum import Enum
 from functools import wraps
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel, Field
 
 from llama_stack.apis.telemetry import (
+    Event,
     LogSeverity,
+    MetricEvent,
     Span,
     SpanEndPayload,
     SpanStartPayload,
@@ -24,68 +33,193 @@ from llama_stack.apis.telemetry import (
     Telemetry,
     UnstructuredLogEvent,
 )
-from llama_stack.providers.utils.telemetry.trace_protocol import serialize_value
+from llama_stack.providers.utils.telemetry.trace_protocol import (
+    LazyAttribute,
+    serialize_value,
+)
 
 log = logging.getLogger(__name__)
 
 
 def generate_short_uuid(len: int = 8):
-    full_uuid = uuid.uuid4()
-    uuid_bytes = full_uuid.bytes
-    encoded = base64.urlsafe_b64encode(uuid_bytes)
-    return encoded.rstrip(b"=").decode("ascii")[:len]
+    # the url safe base64 alphabet of the truncated uuid4s used before, without
+    # building a UUID for every span; 12 bytes encode to 16 characters
+    return base64.urlsafe_b64encode(os.urandom(12)).decode("ascii")[:len]
 
 
-CURRENT_TRACE_CONTEXT = None
+# Trace state is per request: asyncio tasks and threads started with
+# asyncio.to_thread work on a copy of the context of the code that started them
+CURRENT_TRACE_CONTEXT: contextvars.ContextVar[Optional["TraceContext"]] = (
+    contextvars.ContextVar("trace_context", default=None)
+)
+# open spans of the current context, innermost last; tuples, so that copied
+# contexts never share a stack
+CURRENT_SPANS: contextvars.ContextVar[Tuple[Span, ...]] = contextvars.ContextVar(
+    "trace_spans", default=()
+)
 BACKGROUND_LOGGER = None
 
 
+class QueueOverflowPolicy(Enum):
+    # the event being logged is dropped
+    drop_newest = "drop_newest"
+    # the oldest queued event is dropped to make room
+    drop_oldest = "drop_oldest"
+    # the caller waits up to `block_timeout_seconds`, then the event is dropped
+    block = "block"
+
+
+class BackgroundLoggerConfig(BaseModel):
+    capacity: int = Field(
+        default=10_000,
+        description="Maximum number of events waiting to be handed to the telemetry provider",
+    )
+    overflow_policy: QueueOverflowPolicy = Field(
+        default=QueueOverflowPolicy.drop_newest,
+        description="What to do with new events while the queue is full",
+    )
+    block_timeout_seconds: float = Field(
+        default=0.1,
+        description="How long the `block` overflow policy waits for room in the queue",
+    )
+    max_batch_size: int = Field(
+        default=512,
+        description="Maximum number of events passed to one `log_events` call",
+    )
+    max_batch_delay_seconds: float = Field(
+        default=0.05,
+        description="How long a batch waits for more events after its first one",
+    )
+
+
 class BackgroundLogger:
-    def __init__(self, api: Telemetry, capacity: int = 1000):
+    """Hands events to the telemetry provider from a worker thread.
+
+    Logging an event only enqueues it. The worker runs one event loop for its
+    whole lifetime and drains the queue in batches, which are flushed once they
+    reach `max_batch_size` or `max_batch_delay_seconds` after their first event.
+    """
+
+    def __init__(self, api: Telemetry, config: Optional[BackgroundLoggerConfig] = None):
         self.api = api
-        self.log_queue = queue.Queue(maxsize=capacity)
-        self.worker_thread = threading.Thread(target=self._process_logs, daemon=True)
+        self.config = config or BackgroundLoggerConfig()
+        self.log_queue = queue.Queue(maxsize=self.config.capacity)
+
+        self._counter_lock = threading.Lock()
+        self.logged_events = 0
+        self.dropped_events = 0
+        self.failed_events = 0
+
+        self._stopping = threading.Event()
+        self.worker_thread = threading.Thread(
+            target=self._run, name="telemetry-logger", daemon=True
+        )
         self.worker_thread.start()
+        atexit.register(self.shutdown)
 
-    def log_event(self, event):
+    def log_event(self, event: Event) -> None:
+        policy = self.config.overflow_policy
         try:
-            self.log_queue.put_nowait(event)
+            if policy == QueueOverflowPolicy.block:
+                self.log_queue.put(event, timeout=self.config.block_timeout_seconds)
+            else:
+                self.log_queue.put_nowait(event)
+            return
         except queue.Full:
-            log.error("Log queue is full, dropping event")
+            pass
 
-    def _process_logs(self):
-        while True:
+        if policy == QueueOverflowPolicy.drop_oldest:
             try:
-                event = self.log_queue.get()
-                # figure out how to use a thread's native loop
-                asyncio.run(self.api.log_event(event))
-            except Exception:
-                import traceback
-
-                traceback.print_exc()
-                print("Error processing log event")
-            finally:
+                self.log_queue.get_nowait()
                 self.log_queue.task_done()
+                self.log_queue.put_nowait(event)
+            except (queue.Empty, queue.Full):
+                # lost a race with the worker or another producer; `event` is dropped
+                pass
+        self._count_dropped()
+
+    def _count_dropped(self) -> None:
+        with self._counter_lock:
+            self.dropped_events += 1
+            dropped = self.dropped_events
+        # at 1, 2, 4, 8, ... drops, so a full queue does not flood the logs
+        if dropped & (dropped - 1) == 0:
+            log.warning(f"Telemetry event queue is full, {dropped} events dropped")
+
+    def _next_batch(self) -> List[Event]:
+        try:
+            batch = [self.log_queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
 
-    def __del__(self):
+        deadline = time.monotonic() + self.config.max_batch_delay_seconds
+        while len(batch) < self.config.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self.log_queue.get_nowait())
+                else:
+                    batch.append(self.log_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    async def _log_batch(self, batch: List[Event]) -> None:
+        if hasattr(self.api, "log_events"):
+            await self.api.log_events(batch)
+        else:
+            for event in batch:
+                await self.api.log_event(event)
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while not (self._stopping.is_set() and self.log_queue.empty()):
+                batch = self._next_batch()
+                if not batch:
+                    continue
+                try:
+                    loop.run_until_complete(self._log_batch(batch))
+                    with self._counter_lock:
+                        self.logged_events += len(batch)
+                except Exception:
+                    with self._counter_lock:
+                        self.failed_events += len(batch)
+                    # not logged, the handler would send the error back to this queue
+                    traceback.print_exc()
+                    print(f"Error logging {len(batch)} telemetry events")
+                finally:
+                    for _ in batch:
+                        self.log_queue.task_done()
+        finally:
+            loop.close()
+
+    def flush(self) -> None:
+        """Waits until every event queued so far has been handed to the provider."""
         self.log_queue.join()
 
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stops the worker once the queue is drained, or after `timeout` seconds."""
+        self._stopping.set()
+        if self.worker_thread.is_alive():
+            self.worker_thread.join(timeout)
+        atexit.unregister(self.shutdown)
 
-class TraceContext:
-    spans: List[Span] = []
 
+class TraceContext:
     def __init__(self, logger: BackgroundLogger, trace_id: str):
         self.logger = logger
         self.trace_id = trace_id
 
     def push_span(self, name: str, attributes: Dict[str, Any] = None) -> Span:
-        current_span = self.get_current_span()
+        spans = CURRENT_SPANS.get()
         span = Span(
             span_id=generate_short_uuid(),
             trace_id=self.trace_id,
             name=name,
             start_time=datetime.now(),
-            parent_span_id=current_span.span_id if current_span else None,
+            parent_span_id=spans[-1].span_id if spans else None,
             attributes=attributes,
         )
 
@@ -102,40 +236,53 @@ class TraceContext:
             )
         )
 
-        self.spans.append(span)
+        CURRENT_SPANS.set(spans + (span,))
         return span
 
     def pop_span(self, status: SpanStatus = SpanStatus.OK):
-        span = self.spans.pop()
-        if span is not None:
-            self.logger.log_event(
-                StructuredLogEvent(
-                    trace_id=span.trace_id,
-                    span_id=span.span_id,
-                    timestamp=span.start_time,
-                    attributes=span.attributes,
-                    payload=SpanEndPayload(
-                        status=status,
-                    ),
-                )
+        spans = CURRENT_SPANS.get()
+        if not spans:
+            return
+        CURRENT_SPANS.set(spans[:-1])
+        self.end_span(spans[-1], status)
+
+    def end_span(self, span: Span, status: SpanStatus = SpanStatus.OK):
+        self.logger.log_event(
+            StructuredLogEvent(
+                trace_id=span.trace_id,
+                span_id=span.span_id,
+                timestamp=span.start_time,
+                attributes=span.attributes,
+                payload=SpanEndPayload(
+                    status=status,
+                ),
             )
+        )
 
-    def get_current_span(self):
-        return self.spans[-1] if self.spans else None
+    def get_current_span(self) -> Optional[Span]:
+        spans = CURRENT_SPANS.get()
+        return spans[-1] if spans else None
 
 
-def setup_logger(api: Telemetry, level: int = logging.INFO):
+def setup_logger(
+    api: Telemetry,
+    level: int = logging.INFO,
+    config: Optional[BackgroundLoggerConfig] = None,
+):
     global BACKGROUND_LOGGER
 
     if BACKGROUND_LOGGER is None:
-        BACKGROUND_LOGGER = BackgroundLogger(api)
+        if config is None:
+            # providers can configure the queue with a `background_logger` config field
+            config = getattr(getattr(api, "config", None), "background_logger", None)
+        BACKGROUND_LOGGER = BackgroundLogger(api, config)
     logger = logging.getLogger()
     logger.setLevel(level)
     logger.addHandler(TelemetryHandler())
 
 
 async def start_trace(name: str, attributes: Dict[str, Any] = None) -> TraceContext:
-    global CURRENT_TRACE_CONTEXT, BACKGROUND_LOGGER
+    global BACKGROUND_LOGGER
 
     if BACKGROUND_LOGGER is None:
         log.info("No Telemetry implementation set. Skipping trace initialization...")
@@ -143,21 +290,50 @@ async def start_trace(name: str, attributes: Dict[str, Any] = None) -> TraceCont
 
     trace_id = generate_short_uuid(16)
     context = TraceContext(BACKGROUND_LOGGER, trace_id)
+    CURRENT_TRACE_CONTEXT.set(context)
+    CURRENT_SPANS.set(())
     context.push_span(name, {"__root__": True, **(attributes or {})})
-
-    CURRENT_TRACE_CONTEXT = context
     return context
 
 
 async def end_trace(status: SpanStatus = SpanStatus.OK):
-    global CURRENT_TRACE_CONTEXT
-
-    context = CURRENT_TRACE_CONTEXT
+    context = CURRENT_TRACE_CONTEXT.get()
     if context is None:
         return
 
     context.pop_span(status)
-    CURRENT_TRACE_CONTEXT = None
+    CURRENT_TRACE_CONTEXT.set(None)
+    CURRENT_SPANS.set(())
+
+
+def log_metric(
+    metric: str,
+    value: Union[int, float],
+    unit: str,
+    attributes: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Records a metric against the current span. A no-op outside of a trace."""
+    global BACKGROUND_LOGGER
+
+    context = CURRENT_TRACE_CONTEXT.get()
+    if BACKGROUND_LOGGER is None or context is None:
+        return
+
+    span = context.get_current_span()
+    if span is None:
+        return
+
+    BACKGROUND_LOGGER.log_event(
+        MetricEvent(
+            trace_id=span.trace_id,
+            span_id=span.span_id,
+            timestamp=datetime.now(),
+            metric=metric,
+            value=value,
+            unit=unit,
+            attributes=attributes or {},
+        )
+    )
 
 
 def severity(levelname: str) -> LogSeverity:
@@ -183,12 +359,12 @@ class TelemetryHandler(logging.Handler):
         if record.module in ("asyncio", "selector_events"):
             return
 
-        global CURRENT_TRACE_CONTEXT, BACKGROUND_LOGGER
+        global BACKGROUND_LOGGER
 
         if BACKGROUND_LOGGER is None:
             raise RuntimeError("Telemetry API not initialized")
 
-        context = CURRENT_TRACE_CONTEXT
+        context = CURRENT_TRACE_CONTEXT.get()
         if context is None:
             return
 
@@ -214,49 +390,54 @@ class SpanContextManager:
     def __init__(self, name: str, attributes: Dict[str, Any] = None):
         self.name = name
         self.attributes = attributes
+        self.context = None
         self.span = None
 
     def __enter__(self):
-        global CURRENT_TRACE_CONTEXT
-        context = CURRENT_TRACE_CONTEXT
-        if context:
-            self.span = context.push_span(self.name, self.attributes)
+        self.context = CURRENT_TRACE_CONTEXT.get()
+        if self.context:
+            self.span = self.context.push_span(self.name, self.attributes)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        global CURRENT_TRACE_CONTEXT
-        context = CURRENT_TRACE_CONTEXT
-        if context:
-            context.pop_span()
+        if self.span is None:
+            return
+        # cancellations and closed generators are not errors
+        status = (
+            SpanStatus.ERROR
+            if exc_type is not None and issubclass(exc_type, Exception)
+            else SpanStatus.OK
+        )
+        if self.context.get_current_span() is self.span:
+            self.context.pop_span(status)
+        else:
+            # an async generator closed from another context, whose stack never had the span
+            self.context.end_span(self.span, status)
 
     def set_attribute(self, key: str, value: Any):
         if self.span:
             if self.span.attributes is None:
                 self.span.attributes = {}
-            self.span.attributes[key] = serialize_value(value)
+            if not isinstance(value, LazyAttribute):
+                value = serialize_value(value)
+            self.span.attributes[key] = value
 
     async def __aenter__(self):
-        global CURRENT_TRACE_CONTEXT
-        context = CURRENT_TRACE_CONTEXT
-        if context:
-            self.span = context.push_span(self.name, self.attributes)
-        return self
+        return self.__enter__()
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        global CURRENT_TRACE_CONTEXT
-        context = CURRENT_TRACE_CONTEXT
-        if context:
-            context.pop_span()
+        self.__exit__(exc_type, exc_value, traceback)
 
     def __call__(self, func: Callable):
+        # concurrent calls each get their own span
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
-            with self:
+            with SpanContextManager(self.name, self.attributes):
                 return func(*args, **kwargs)
 
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
-            async with self:
+            async with SpanContextManager(self.name, self.attributes):
                 return await func(*args, **kwargs)
 
         @wraps(func)
@@ -274,8 +455,7 @@ def span(name: str, attributes: Dict[str, Any] = None):
 
 
 def get_current_span() -> Optional[Span]:
-    global CURRENT_TRACE_CONTEXT
-    context = CURRENT_TRACE_CONTEXT
+    context = CURRENT_TRACE_CONTEXT.get()
     if context:
         return context.get_current_span()
     return None
@@ -0,0 +1,130 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+"""Benchmark for make_overlapped_chunks on a large synthetic corpus.
+
+Compares the previous implementation, which decodes every window from tokens,
+against slicing windows out of the text by token offsets. Both tokenize the
+whole corpus once, which dominates the total on small windows.
+
+    python -m llama_stack.scripts.benchmarks.chunking --corpus-mb 50 --trace-memory
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from llama_models.llama3.api.tokenizer import Tokenizer
+
+from llama_stack.apis.vector_io import Chunk
+from llama_stack.providers.utils.memory.vector_store import (
+    ChunkBoundary,
+    make_overlapped_chunks,
+)
+
+WORDS = (
+    "the of and to in is was for on that with as by at from his an were are "
+    "which this be or has had first one their its new after but who not they "
+    "have her she two been other when there all during into school time may "
+    "years more most only over city some world would where later up such used "
+    "many can state about national out known university united then made"
+).split()
+
+
+def make_corpus(num_bytes: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < num_bytes:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = rng.choices(WORDS, k=rng.randint(8, 30))
+            sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def legacy_make_overlapped_chunks(document_id, text, window_len, overlap_len):
+    tokenizer = Tokenizer.get_instance()
+    tokens = tokenizer.encode(text, bos=False, eos=False)
+
+    chunks = []
+    for i in range(0, len(tokens), window_len - overlap_len):
+        toks = tokens[i : i + window_len]
+        chunks.append(
+            Chunk(
+                content=tokenizer.decode(toks),
+                metadata={"token_count": len(toks), "document_id": document_id},
+            )
+        )
+    return chunks
+
+
+def run(name, fn, *args, trace_memory=False):
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    chunks = fn(*args)
+    elapsed = time.perf_counter() - t0
+    line = f"{name:<20} {len(chunks):>8} chunks  {elapsed:8.2f}s"
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f"  peak {peak / 2**20:8.1f} MiB"
+    print(line)
+    return chunks
+
+
+def main(
+    corpus_mb: float, window_len: int, overlap_len: int, trace_memory: bool
+) -> None:
+    text = make_corpus(int(corpus_mb * 2**20))
+    print(f"corpus: {len(text) / 2**20:.1f} MiB, window {window_len}/{overlap_len}")
+
+    # load the tokenizer outside of the measurements
+    make_overlapped_chunks("warmup", "warm up", window_len, overlap_len)
+
+    legacy = run(
+        "legacy",
+        legacy_make_overlapped_chunks,
+        "doc",
+        text,
+        window_len,
+        overlap_len,
+        trace_memory=trace_memory,
+    )
+    legacy = [c.content for c in legacy]
+
+    for boundary in ChunkBoundary:
+        chunks = run(
+            f"{boundary.value} spans",
+            make_overlapped_chunks,
+            "doc",
+            text,
+            window_len,
+            overlap_len,
+            boundary,
+            trace_memory=trace_memory,
+        )
+        if boundary == ChunkBoundary.token:
+            assert [c.content for c in chunks] == legacy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus-mb", type=float, default=20)
+    parser.add_argument("--window-len", type=int, default=512)
+    parser.add_argument("--overlap-len", type=int, default=128)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="also report peak allocations; slows every run down",
+    )
+    args = parser.parse_args()
+    main(args.corpus_mb, args.window_len, args.overlap_len, args.trace_memory)
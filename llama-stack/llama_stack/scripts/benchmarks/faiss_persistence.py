@@ -0,0 +1,150 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+"""Benchmark for FaissIndex persistence on a sqlite KVStore.
+
+Compares the v3 format, which rewrites the whole index as a text dump on every
+insert, against the v4 snapshot + append-only log format. The v3 format is
+quadratic in the bank size, so it runs on a smaller bank by default.
+
+    python -m llama_stack.scripts.benchmarks.faiss_persistence --num-chunks 100000
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from llama_stack.apis.vector_io import Chunk
+from llama_stack.providers.inline.vector_io.faiss.faiss import (
+    FaissIndex,
+    LEGACY_FAISS_INDEX_PREFIX,
+)
+from llama_stack.providers.utils.kvstore import kvstore_impl
+from llama_stack.providers.utils.kvstore.config import SqliteKVStoreConfig
+
+
+class LegacyFaissIndex(FaissIndex):
+    """The v3 implementation: the whole index and all chunks in one value."""
+
+    async def initialize(self) -> None:
+        stored_data = await self.kvstore.get(
+            f"{LEGACY_FAISS_INDEX_PREFIX}{self.bank_id}"
+        )
+        if stored_data:
+            data = json.loads(stored_data)
+            self.chunk_by_index = {
+                int(k): Chunk.model_validate_json(v)
+                for k, v in data["chunk_by_index"].items()
+            }
+            buffer = io.BytesIO(base64.b64decode(data["faiss_index"]))
+            self.index = faiss.deserialize_index(
+                np.loadtxt(buffer, dtype=np.float64).astype(np.uint8)
+            )
+
+    async def _save_chunks(self, start, chunks, embeddings) -> None:
+        buffer = io.BytesIO()
+        np.savetxt(buffer, faiss.serialize_index(self.index))
+        data = {
+            "chunk_by_index": {
+                k: v.model_dump_json() for k, v in self.chunk_by_index.items()
+            },
+            "faiss_index": base64.b64encode(buffer.getvalue()).decode("utf-8"),
+        }
+        await self.kvstore.set(
+            f"{LEGACY_FAISS_INDEX_PREFIX}{self.bank_id}", json.dumps(data)
+        )
+
+
+async def run(
+    name: str, index_cls, db_path: str, num_chunks: int, batch_size: int, dimension: int
+) -> None:
+    kvstore = await kvstore_impl(SqliteKVStoreConfig(db_path=db_path))
+    index = await index_cls.create(dimension, kvstore, "bank")
+    rng = np.random.default_rng(0)
+
+    slowest = 0.0
+    start = time.perf_counter()
+    for offset in range(0, num_chunks, batch_size):
+        count = min(batch_size, num_chunks - offset)
+        chunks = [
+            Chunk(
+                content=f"chunk {offset + i} " + "lorem ipsum " * 40,
+                metadata={"document_id": f"doc-{(offset + i) // 100}"},
+            )
+            for i in range(count)
+        ]
+        embeddings = rng.random((count, dimension), dtype=np.float32)
+        batch_start = time.perf_counter()
+        await index.add_chunks(chunks, embeddings)
+        slowest = max(slowest, time.perf_counter() - batch_start)
+    insert_elapsed = time.perf_counter() - start
+    await kvstore.shutdown()
+
+    kvstore = await kvstore_impl(SqliteKVStoreConfig(db_path=db_path))
+    start = time.perf_counter()
+    reloaded = await index_cls.create(dimension, kvstore, "bank")
+    load_elapsed = time.perf_counter() - start
+    assert reloaded.index.ntotal == num_chunks
+    await kvstore.shutdown()
+
+    print(
+        f"{name:<10} {num_chunks:>8} chunks   "
+        f"insert {num_chunks / insert_elapsed:>8.0f} chunks/s   "
+        f"slowest batch {slowest * 1000:>8.1f} ms   "
+        f"reload {load_elapsed * 1000:>8.1f} ms   "
+        f"db {os.path.getsize(db_path) / 2**20:>8.1f} MiB"
+    )
+
+
+async def main(
+    num_chunks: int, legacy_chunks: int, batch_size: int, dimension: int
+) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if legacy_chunks:
+            await run(
+                "v3",
+                LegacyFaissIndex,
+                os.path.join(tmpdir, "v3.db"),
+                legacy_chunks,
+                batch_size,
+                dimension,
+            )
+            await run(
+                "v4",
+                FaissIndex,
+                os.path.join(tmpdir, "v4-small.db"),
+                legacy_chunks,
+                batch_size,
+                dimension,
+            )
+        await run(
+            "v4",
+            FaissIndex,
+            os.path.join(tmpdir, "v4.db"),
+            num_chunks,
+            batch_size,
+            dimension,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-chunks", type=int, default=100_000)
+    parser.add_argument("--legacy-chunks", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=384)
+    args = parser.parse_args()
+    asyncio.run(
+        main(args.num_chunks, args.legacy_chunks, args.batch_size, args.dimension)
+    )
@@ -0,0 +1,97 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+"""Benchmark for range queries on the redis KVStore.
+
+Fills a namespace with N unrelated keys plus one session of 20 turns, then
+times fetching that session with the previous SCAN-based range and with the
+sorted-set index. Needs a scratch redis server; the namespace is flushed.
+
+    python -m llama_stack.scripts.benchmarks.kvstore_redis --host localhost --sizes 10000 100000 1000000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+from llama_stack.providers.utils.kvstore.config import RedisKVStoreConfig
+from llama_stack.providers.utils.kvstore.redis import RedisKVStoreImpl
+
+NAMESPACE = "kvstore-benchmark"
+SESSION_TURNS = 20
+
+
+async def scan_range(store: RedisKVStoreImpl, start_key: str, end_key: str) -> List:
+    """The original implementation: SCAN the keyspace, filter, then MGET."""
+    start_key = store._namespaced_key(start_key)
+    end_key = store._namespaced_key(end_key)
+    matching_keys = []
+    cursor = 0
+    while True:
+        cursor, keys = await store.redis.scan(cursor, match=start_key + "*", count=1000)
+        matching_keys.extend(k for k in keys if start_key <= k.decode() <= end_key)
+        if cursor == 0:
+            break
+    return await store.redis.mget(matching_keys) if matching_keys else []
+
+
+async def reset(store: RedisKVStoreImpl) -> None:
+    async for key in store.redis.scan_iter(match=f"{NAMESPACE}:*", count=10000):
+        await store.redis.delete(key)
+
+
+async def populate(store: RedisKVStoreImpl, num_keys: int) -> None:
+    for i in range(0, num_keys, 10000):
+        await store.set_many(
+            {
+                f"session:other-{j:08d}": "x" * 64
+                for j in range(i, min(i + 10000, num_keys))
+            }
+        )
+    await store.set_many(
+        {f"session:target:{i:04d}": "turn" for i in range(SESSION_TURNS)}
+    )
+
+
+async def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = await fn()
+    assert len(result) == SESSION_TURNS
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def main(host: str, port: int, sizes: List[int], repeat: int) -> None:
+    store = RedisKVStoreImpl(
+        RedisKVStoreConfig(host=host, port=port, namespace=NAMESPACE)
+    )
+    await store.initialize()
+    start_key, end_key = "session:target:", "session:target:\xff"
+
+    for num_keys in sizes:
+        await reset(store)
+        await populate(store, num_keys)
+        scan_ms = await timed(lambda: scan_range(store, start_key, end_key), repeat)
+        index_ms = await timed(lambda: store.range(start_key, end_key), repeat)
+        print(
+            f"{num_keys:>9} keys   scan {scan_ms:>9.2f} ms   zset index {index_ms:>7.2f} ms"
+        )
+
+    await reset(store)
+    await store.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.sizes, args.repeat))
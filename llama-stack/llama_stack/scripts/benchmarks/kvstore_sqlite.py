@@ -0,0 +1,124 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+"""Microbenchmark for the sqlite KVStore.
+
+Compares the previous connect-per-operation implementation against the pooled
+WAL implementation, with and without group commit.
+
+    python -m llama_stack.scripts.benchmarks.kvstore_sqlite --num-ops 2000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import aiosqlite
+
+from llama_stack.providers.utils.kvstore import kvstore_impl
+from llama_stack.providers.utils.kvstore.config import SqliteKVStoreConfig
+
+
+class ConnectPerOpKVStore:
+    """The original implementation: a fresh connection and commit per call."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    async def initialize(self):
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                "CREATE TABLE IF NOT EXISTS kvstore (key TEXT PRIMARY KEY, value TEXT, expiration TIMESTAMP)"
+            )
+            await db.commit()
+
+    async def set(
+        self, key: str, value: str, expiration: Optional[datetime] = None
+    ) -> None:
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO kvstore (key, value, expiration) VALUES (?, ?, ?)",
+                (key, value, expiration),
+            )
+            await db.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(
+                "SELECT value FROM kvstore WHERE key = ?", (key,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def range(self, start_key: str, end_key: str) -> List[str]:
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(
+                "SELECT value FROM kvstore WHERE key >= ? AND key <= ?",
+                (start_key, end_key),
+            ) as cursor:
+                return [row[0] async for row in cursor]
+
+
+async def run(name: str, store, num_ops: int, concurrency: int) -> None:
+    value = "x" * 512
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(coro):
+        async with semaphore:
+            await coro
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[bounded(store.set(f"key:{i:08d}", value)) for i in range(num_ops)]
+    )
+    set_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*[bounded(store.get(f"key:{i:08d}")) for i in range(num_ops)])
+    get_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, num_ops, 100):
+        await store.range(f"key:{i:08d}", f"key:{i + 99:08d}")
+    range_elapsed = time.perf_counter() - start
+
+    print(
+        f"{name:<28} set {num_ops / set_elapsed:>10.0f} ops/s   "
+        f"get {num_ops / get_elapsed:>10.0f} ops/s   "
+        f"range(100) {num_ops / 100 / range_elapsed:>8.0f} ops/s"
+    )
+
+
+async def main(num_ops: int, concurrency: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        baseline = ConnectPerOpKVStore(os.path.join(tmpdir, "baseline.db"))
+        await baseline.initialize()
+        await run("connect-per-op (before)", baseline, num_ops, concurrency)
+
+        for name, commit_window_ms in [
+            ("pooled wal", None),
+            ("pooled wal + group commit", 2),
+        ]:
+            store = await kvstore_impl(
+                SqliteKVStoreConfig(
+                    db_path=os.path.join(tmpdir, f"{commit_window_ms}.db"),
+                    commit_window_ms=commit_window_ms,
+                )
+            )
+            await run(name, store, num_ops, concurrency)
+            await store.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(main(args.num_ops, args.concurrency))
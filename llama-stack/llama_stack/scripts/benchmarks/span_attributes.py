@@ -0,0 +1,75 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+"""Benchmark for setting the conversation as a span attribute, as agents do.
+
+Times an inference span that records its input messages, serialized when set
+as before and deferred with LazyAttribute, without a trace and inside one. The
+provider only records the events and never exports them, as for a sampled out
+trace.
+
+    python -m llama_stack.scripts.benchmarks.span_attributes --num-messages 50
+"""
+
+import argparse
+import asyncio
+import time
+
+from llama_stack.apis.inference import UserMessage
+from llama_stack.providers.utils.telemetry import tracing
+
+
+class RecordingLogger:
+    def log_event(self, event):
+        pass
+
+
+def eager(messages):
+    with tracing.span("inference") as span:
+        span.set_attribute("input", [m.model_dump_json() for m in messages])
+
+
+def deferred(messages):
+    with tracing.span("inference") as span:
+        span.set_attribute("input", tracing.LazyAttribute(list(messages)))
+
+
+def run(fn, messages, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(messages)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--num-messages", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    messages = [
+        UserMessage(content=f"message {i} " + "lorem ipsum " * 50)
+        for i in range(args.num_messages)
+    ]
+    tracing.BACKGROUND_LOGGER = RecordingLogger()
+
+    print(f"{args.num_messages} messages, us per span")
+    print(
+        f"no trace: {run(eager, messages, args.iterations):>10.1f} -> "
+        f"{run(deferred, messages, args.iterations):.1f}"
+    )
+    await tracing.start_trace("request")
+    try:
+        print(
+            f"traced:   {run(eager, messages, args.iterations):>10.1f} -> "
+            f"{run(deferred, messages, args.iterations):.1f}"
+        )
+    finally:
+        await tracing.end_trace()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+"""Throughput benchmark for the telemetry BackgroundLogger.
+
+Compares the previous implementation, which ran a new event loop for every
+event, against the batching worker. The provider only records the events, so
+the numbers measure the logger's own overhead.
+
+    python -m llama_stack.scripts.benchmarks.telemetry_logger --num-events 100000
+"""
+
+import argparse
+import asyncio
+import queue
+import threading
+import time
+from datetime import datetime
+
+from llama_stack.apis.telemetry import SpanStartPayload, StructuredLogEvent
+from llama_stack.providers.utils.telemetry.tracing import (
+    BackgroundLogger,
+    BackgroundLoggerConfig,
+)
+
+
+class RecordingTelemetry:
+    def __init__(self):
+        self.num_events = 0
+
+    async def log_event(self, event, ttl_seconds: int = 0) -> None:
+        self.num_events += 1
+
+    async def log_events(self, events, ttl_seconds: int = 0) -> None:
+        self.num_events += len(events)
+
+
+class EventLoopPerEventLogger:
+    """The original implementation: `asyncio.run` for every event."""
+
+    def __init__(self, api, capacity: int = 1000):
+        self.api = api
+        self.log_queue = queue.Queue(maxsize=capacity)
+        self.dropped_events = 0
+        threading.Thread(target=self._process_logs, daemon=True).start()
+
+    def log_event(self, event):
+        try:
+            self.log_queue.put_nowait(event)
+        except queue.Full:
+            self.dropped_events += 1
+
+    def _process_logs(self):
+        while True:
+            event = self.log_queue.get()
+            try:
+                asyncio.run(self.api.log_event(event))
+            finally:
+                self.log_queue.task_done()
+
+    def flush(self):
+        self.log_queue.join()
+
+
+def make_event(i: int) -> StructuredLogEvent:
+    return StructuredLogEvent(
+        trace_id="trace",
+        span_id=f"{i:08d}",
+        timestamp=datetime.now(),
+        attributes={"i": i},
+        payload=SpanStartPayload(name="span"),
+    )
+
+
+def run(name: str, logger, api: RecordingTelemetry, events, rate: float) -> None:
+    # producers rarely log in a tight loop; `rate` paces them in events per second
+    interval = 1.0 / rate if rate else 0.0
+    start = time.perf_counter()
+    for i, event in enumerate(events):
+        logger.log_event(event)
+        if interval:
+            delay = start + (i + 1) * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    logger.flush()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>16}: {api.num_events / elapsed:>10,.0f} events/s delivered, "
+        f"{api.num_events:,} delivered, {logger.dropped_events:,} dropped"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--num-events", type=int, default=100_000)
+    parser.add_argument("--capacity", type=int, default=1000)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="events per second to log at, 0 for as fast as possible",
+    )
+    args = parser.parse_args()
+
+    events = [make_event(i) for i in range(args.num_events)]
+
+    api = RecordingTelemetry()
+    run(
+        "loop per event",
+        EventLoopPerEventLogger(api, args.capacity),
+        api,
+        events,
+        args.rate,
+    )
+
+    api = RecordingTelemetry()
+    logger = BackgroundLogger(api, BackgroundLoggerConfig(capacity=args.capacity))
+    run("batched", logger, api, events, args.rate)
+    logger.shutdown()
+
+
+if __name__ == "__main__":
+    main()
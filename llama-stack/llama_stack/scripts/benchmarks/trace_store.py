@@ -0,0 +1,146 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the terms described in the LICENSE file in
+# the root directory of this source tree.
+
+"""Benchmark for trace queries against the SQLite trace store.
+
+Fills a database with synthetic traces and times an attribute filtered trace
+query and a span tree lookup. This runs against the previous schema, which had no
+span indexes, and against the current one.
+
+    python -m llama_stack.scripts.benchmarks.trace_store --num-traces 100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from llama_stack.apis.telemetry import QueryCondition
+from llama_stack.providers.utils.telemetry.sqlite_trace_store import (
+    create_trace_tables,
+    SQLiteTraceStore,
+)
+
+SPANS_PER_TRACE = 10
+
+LEGACY_QUERY = """
+    WITH matching_traces AS (
+        SELECT DISTINCT t.trace_id
+        FROM traces t
+        JOIN spans s ON t.trace_id = s.trace_id
+        WHERE json_extract(s.attributes, '$.session_id') = ?
+    ),
+    filtered_traces AS (
+        SELECT t.trace_id, t.root_span_id, t.start_time, t.end_time
+        FROM matching_traces mt
+        JOIN traces t ON mt.trace_id = t.trace_id
+        LEFT JOIN spans s ON t.trace_id = s.trace_id
+    )
+    SELECT DISTINCT trace_id, root_span_id, start_time, end_time
+    FROM filtered_traces
+    LIMIT 100 OFFSET 0
+"""
+
+
+def create_legacy_tables(conn: sqlite3.Connection) -> None:
+    create_trace_tables(conn)
+    for index in ("idx_spans_trace_id", "idx_spans_parent_span_id"):
+        conn.execute(f"DROP INDEX {index}")
+    conn.execute("PRAGMA journal_mode=DELETE")
+
+
+def populate(conn: sqlite3.Connection, num_traces: int) -> None:
+    timestamp = "2025-01-01T00:00:00"
+    for start in range(0, num_traces, 10_000):
+        traces = []
+        spans = []
+        for t in range(start, min(start + 10_000, num_traces)):
+            trace_id = f"{t:032x}"
+            traces.append((trace_id, "bench", f"{t:012x}0000", timestamp, timestamp))
+            for s in range(SPANS_PER_TRACE):
+                attributes = {"__args__": "x" * 200, "depth": s}
+                if s == 1:
+                    # a session per 10 traces, set on the agent turn span
+                    attributes["session_id"] = f"session-{t // 10}"
+                spans.append(
+                    (
+                        f"{t:012x}{s:04x}",
+                        trace_id,
+                        f"{t:012x}{s - 1:04x}" if s else None,
+                        f"span-{s}",
+                        timestamp,
+                        timestamp,
+                        json.dumps(attributes),
+                        "OK",
+                        "INTERNAL",
+                    )
+                )
+        with conn:
+            conn.executemany(
+                "INSERT INTO traces (trace_id, service_name, root_span_id, start_time, end_time) VALUES (?, ?, ?, ?, ?)",
+                traces,
+            )
+            conn.executemany(
+                "INSERT INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                spans,
+            )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--num-traces", type=int, default=100_000)
+    args = parser.parse_args()
+    session = f"session-{args.num_traces // 20}"
+    root_span = f"{args.num_traces // 2:012x}0000"
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        legacy_path = os.path.join(tmpdir, "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        create_legacy_tables(conn)
+        populate(conn, args.num_traces)
+
+        # full scans take long enough to time once
+        start = time.perf_counter()
+        conn.execute(LEGACY_QUERY, (session,)).fetchall()
+        legacy_query_ms = (time.perf_counter() - start) * 1000
+        store = SQLiteTraceStore(legacy_path)
+        start = time.perf_counter()
+        await store.get_span_tree(root_span)
+        legacy_tree_ms = (time.perf_counter() - start) * 1000
+        conn.close()
+
+        path = os.path.join(tmpdir, "current.db")
+        conn = sqlite3.connect(path)
+        create_trace_tables(conn, ["session_id"])
+        populate(conn, args.num_traces)
+        conn.close()
+
+        store = SQLiteTraceStore(path, ["session_id"])
+        filters = [QueryCondition(key="session_id", op="eq", value=session)]
+        start = time.perf_counter()
+        for _ in range(5):
+            traces = await store.query_traces(attribute_filters=filters)
+        query_ms = (time.perf_counter() - start) / 5 * 1000
+        assert len(traces) == 10
+        start = time.perf_counter()
+        for _ in range(5):
+            tree = await store.get_span_tree(root_span)
+        tree_ms = (time.perf_counter() - start) / 5 * 1000
+        assert len(tree) == SPANS_PER_TRACE
+
+    num_spans = args.num_traces * SPANS_PER_TRACE
+    print(f"{num_spans:,} spans in {args.num_traces:,} traces")
+    print(
+        f"query_traces by session_id: {legacy_query_ms:>10.1f} ms -> {query_ms:.1f} ms"
+    )
+    print(f"get_span_tree:              {legacy_tree_ms:>10.1f} ms -> {tree_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())